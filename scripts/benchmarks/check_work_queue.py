@@ -0,0 +1,140 @@
+"""
+Work Queue Check
+Offline smoke test of the SQLite broker's lease semantics (see work_queue.py),
+run on one machine against a temp broker file. No network, no scraping.
+
+Checks:
+    claim         batches in enqueue order, no URL leased twice, even from
+                  several broker connections claiming at once
+    lease expiry  a lease that is not extended goes back to pending; the old
+                  worker can no longer complete it; a heartbeat keeps it
+    defer         a deferred URL is not claimed before not_before and the
+                  claim does not count as an attempt
+    fail          failed URLs are retried, then stored as failed after
+                  MAX_ATTEMPTS
+    interface     a Broker subclass missing methods cannot be instantiated
+
+Usage:
+    python check_work_queue.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from work_queue import MAX_ATTEMPTS, Broker, SQLiteBroker  # noqa: E402
+
+QUEUE = 'check'
+LEASE_SECONDS = 0.3
+
+
+def urls(count):
+    return [f'https://www.amazon.in/dp/B{i:09d}' for i in range(1, count + 1)]
+
+
+def check_claim(path):
+    broker = SQLiteBroker(path)
+    assert broker.enqueue(QUEUE, urls(40)) == 40
+    assert broker.enqueue(QUEUE, urls(5)) == 0, 'duplicates must be ignored'
+    first = broker.claim(QUEUE, 'w0', 5, LEASE_SECONDS)
+    assert [task.position for task in first] == [1, 2, 3, 4, 5]
+
+    # Several connections (as several processes would have) claiming at once
+    claimed, lock = [], threading.Lock()
+
+    def claim_all(worker):
+        own = SQLiteBroker(path)
+        while True:
+            tasks = own.claim(QUEUE, worker, 3, 30)
+            if not tasks:
+                break
+            with lock:
+                claimed.extend(task.url for task in tasks)
+        own.close()
+
+    threads = [threading.Thread(target=claim_all, args=(f'w{i}',)) for i in range(1, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == len(set(claimed)) == 35, 'a URL was leased twice'
+    broker.purge(QUEUE)
+    broker.close()
+
+
+def check_lease_expiry(path):
+    broker = SQLiteBroker(path)
+    broker.enqueue(QUEUE, urls(2))
+    kept, dropped = broker.claim(QUEUE, 'w1', 2, LEASE_SECONDS)
+    for _ in range(3):
+        time.sleep(LEASE_SECONDS / 2)
+        assert broker.heartbeat('w1', [kept.id], LEASE_SECONDS) == 1
+    # dropped's lease has expired by now; the next claim re-queues it
+    retaken = broker.claim(QUEUE, 'w2', 5, LEASE_SECONDS)
+    assert [task.url for task in retaken] == [dropped.url], retaken
+    assert retaken[0].attempts == 2
+    assert not broker.complete('w1', dropped.id, {'title': 'late'}), 'expired lease must not complete'
+    assert broker.complete('w2', dropped.id, {'title': 'ok'})
+    assert broker.complete('w1', kept.id, {'title': 'ok'})
+    assert broker.counts(QUEUE)['done'] == 2
+    broker.purge(QUEUE)
+    broker.close()
+
+
+def check_defer(path):
+    broker = SQLiteBroker(path)
+    broker.enqueue(QUEUE, urls(1))
+    task, = broker.claim(QUEUE, 'w1', 1, LEASE_SECONDS)
+    assert broker.defer('w1', task.id, time.time() + 0.5, 'robot_check')
+    counts = broker.counts(QUEUE)
+    assert counts['pending'] == 1 and counts['deferred'] == 1, counts
+    assert broker.claim(QUEUE, 'w2', 1, LEASE_SECONDS) == [], 'deferred URL claimed early'
+    time.sleep(0.6)
+    task, = broker.claim(QUEUE, 'w2', 1, LEASE_SECONDS)
+    assert task.attempts == 1, 'a deferred claim must not count as an attempt'
+    broker.purge(QUEUE)
+    broker.close()
+
+
+def check_fail(path):
+    broker = SQLiteBroker(path)
+    broker.enqueue(QUEUE, urls(1))
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        task, = broker.claim(QUEUE, 'w1', 1, LEASE_SECONDS)
+        assert task.attempts == attempt
+        assert broker.fail('w1', task.id, 'boom', {'error': 'boom'})
+    counts = broker.counts(QUEUE)
+    assert counts['failed'] == 1 and counts['pending'] == 0, counts
+    assert broker.results(QUEUE) == [(1, urls(1)[0], {'error': 'boom'})]
+    broker.purge(QUEUE)
+    broker.close()
+
+
+def check_interface():
+    class PartialBroker(Broker):
+        def enqueue(self, queue, urls):
+            return 0
+
+    try:
+        PartialBroker()
+    except TypeError:
+        return
+    raise AssertionError('an incomplete Broker was instantiated')
+
+
+def main():
+    checks = [check_claim, check_lease_expiry, check_defer, check_fail]
+    with tempfile.TemporaryDirectory() as directory:
+        for check in checks:
+            check(os.path.join(directory, f'{check.__name__}.sqlite'))
+            print(f"✅ {check.__name__}")
+    check_interface()
+    print("✅ check_interface")
+
+
+if __name__ == '__main__':
+    main()
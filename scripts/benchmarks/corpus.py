@@ -0,0 +1,92 @@
+"""
+Benchmark Corpus
+Product pages the benchmarks run against, fully offline.
+
+Saved Amazon product pages (*.html or *.html.gz, e.g. "Save page as... HTML
+only") go in scripts/benchmarks/fixtures/. When there are fewer saved pages
+than requested, the corpus is filled up with generated pages that have the
+same structure and roughly the same size as a real product page (title,
+feature bullets, landing image with data-a-dynamic-image, Open Graph tags,
+inline scripts and styles). Generated pages are deterministic, so runs on the
+same machine are comparable.
+"""
+
+import glob
+import gzip
+import os
+import random
+from typing import List
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Roughly the size of a real product page (300-600 KB of HTML)
+FILLER_BLOCKS = (60, 120)
+
+
+def load_saved_pages(directory: str = FIXTURES_DIR) -> List[bytes]:
+    """
+    Saved product pages in `directory`, sorted by file name
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html')) + glob.glob(os.path.join(directory, '*.html.gz'))):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+def asin_for(index: int) -> str:
+    return f'B{index:09d}'
+
+
+def synthetic_page(index: int) -> bytes:
+    """
+    A generated Amazon-like product page (deterministic for a given index)
+    """
+    rng = random.Random(index)
+    asin = asin_for(index)
+    image_id = f'{rng.getrandbits(40):010x}'
+    title = f'Product {index} Wireless Noise Cancelling Headphones, {rng.randint(20, 60)}H Battery &amp; Fast Charging'
+    bullets = ''.join(
+        f'<li><span class="a-list-item"> Feature {index}.{n}: {"lorem ipsum dolor sit amet " * rng.randint(3, 8)}</span></li>'
+        for n in range(rng.randint(4, 7))
+    )
+    filler = ''.join(
+        f'<div class="a-section a-spacing-small" data-csa-c-id="{rng.getrandbits(32):08x}">'
+        f'<span class="a-size-base">{"related product text " * rng.randint(5, 15)}</span>'
+        f'<a href="/dp/{asin_for(rng.randint(0, 10 ** 6))}">link</a></div>'
+        for _ in range(rng.randint(*FILLER_BLOCKS) * 10)
+    )
+    script = '<script type="text/javascript">var data = {' + ','.join(
+        f'"k{n}": "{rng.getrandbits(64):016x}"' for n in range(2000)) + '};</script>'
+    style = '<style>' + ''.join(f'.c{n}{{margin:{n % 7}px}}' for n in range(1500)) + '</style>'
+    image = f'https://m.media-amazon.com/images/I/{image_id}._SL1500_.jpg'
+    return f'''<!doctype html><html lang="en-in"><head><meta charset="utf-8">
+<title>Amazon.in: {title}</title>
+<meta name="description" content="Buy {title} online at low price">
+<meta property="og:title" content="{title}">
+<meta property="og:description" content="Product {index} description">
+<meta property="og:image" content="{image}">
+<link rel="canonical" href="https://www.amazon.in/dp/{asin}">
+{style}{script}
+</head><body>
+<div id="nav-belt">{filler[:len(filler) // 3]}</div>
+<div id="dp-container">
+<div id="titleSection"><h1 id="title" class="a-size-large a-spacing-none">
+<span id="productTitle" class="a-size-large product-title-word-break">  {title}  </span></h1></div>
+<div id="imgTagWrapperId"><img alt="{title}" src="https://m.media-amazon.com/images/I/{image_id}._SX342_.jpg"
+ data-old-hires="{image}" id="landingImage" class="a-dynamic-image"
+ data-a-dynamic-image='{{"{image}":[1500,1500]}}'></div>
+<div id="feature-bullets" class="a-section a-spacing-medium a-spacing-top-small">
+<ul class="a-unordered-list a-vertical a-spacing-mini">{bullets}</ul></div>
+{filler[len(filler) // 3:]}
+</div>{script}</body></html>'''.encode('utf-8')
+
+
+def load_corpus(size: int, directory: str = FIXTURES_DIR) -> List[bytes]:
+    """
+    `size` pages: saved pages first, then generated ones
+    """
+    pages = load_saved_pages(directory)[:size]
+    pages.extend(synthetic_page(i) for i in range(len(pages), size))
+    return pages
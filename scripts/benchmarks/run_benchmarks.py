@@ -0,0 +1,316 @@
+"""
+Scraper Benchmarks
+Offline benchmarks for the parsing, fetching and merge stages, with a stored
+baseline to catch regressions.
+
+Every stage runs in its own fresh process (so peak RSS is per stage) against
+the benchmark corpus (see corpus.py) and, for network stages, the local
+stand-in server (see stand_in_server.py) with simulated latency and 429s.
+Caches (pages, links, image verdicts) live in a temp directory, so every run
+starts cold and the real scripts/.cache is never touched.
+
+Per stage it reports items/sec, p50/p99 latency per item, peak RSS, and the
+peak traced memory and number of memory blocks allocated (tracemalloc, measured
+in a separate pass so it doesn't slow down the timed pass).
+
+Stages:
+    parse_lxml       product_parser.parse_product_page, lxml backend
+    parse_bs4        product_parser.parse_product_page, bs4 backend
+    find_image       image_refresh.find_image_in_page (parse step of the image updaters, lxml)
+    merge            update_tech_products.merge_scraped_data_with_info
+    fetch_extract    scrape_products.extract_product_details via the stand-in server
+    extract_image    image_refresh.extract_image_from_amazon via the stand-in server
+    scrape_async     scrape_products_async, 8 concurrent requests, no rate limit
+
+Usage:
+    python run_benchmarks.py                            # all stages, compare with baseline.json if present
+    python run_benchmarks.py --stages parse_lxml merge --pages 50
+    python run_benchmarks.py --rate-429 0.05 --latency 0.1
+    python run_benchmarks.py --save-baseline            # store this run as the new baseline
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from corpus import load_corpus  # noqa: E402
+from stand_in_server import StandInServer  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+# A stage is a regression when it is this much slower (or bigger) than the baseline
+DEFAULT_TOLERANCE = 0.10
+
+# Metrics compared with the baseline, and whether higher is better
+COMPARED_METRICS = {
+    'items_per_sec': True,
+    'p50_ms': False,
+    'p99_ms': False,
+    'peak_rss_mb': False,
+}
+
+
+# ============================================
+# STAGES
+# ============================================
+# Each stage takes the run options and returns a callable that processes one
+# item, plus the list of items. Stages without per-item latency return a
+# single "item" that runs the whole batch and report its size in 'batch'.
+def _stage_parse(backend: str):
+    def setup(options: Dict):
+        from product_parser import parse_product_page
+        pages = load_corpus(options['pages'])
+        return (lambda page: parse_product_page(page, backend)), pages, 1
+    return setup
+
+
+def _stage_find_image(options: Dict):
+    from image_refresh import find_image_in_page
+    return find_image_in_page, load_corpus(options['pages']), 1
+
+
+def _stage_merge(options: Dict):
+    from update_tech_products import merge_scraped_data_with_info
+    size = options['pages'] * 10
+    scraped = [{'url': f'https://amzn.to/{i:07d}', 'title': f'Product {i}', 'image_url': 'default.png',
+                'description': 'x' * 200, 'extracted_at': '2026-01-01T00:00:00'} for i in range(size)]
+    info = {p['url']: {'id': f'tech-{i}', 'category': 'tech', 'subcategory': 'audio', 'price_range': 'budget',
+                       'original_title': p['title'], 'original_description': '', 'original_image': ''}
+            for i, p in enumerate(scraped)}
+    return (lambda _: merge_scraped_data_with_info(scraped, info)), list(range(50)), size
+
+
+def _stage_fetch_extract(options: Dict):
+    from scrape_products import extract_product_details
+    return extract_product_details, options['urls'], 1
+
+
+def _stage_extract_image(options: Dict):
+    from image_refresh import extract_image_from_amazon
+    return extract_image_from_amazon, options['urls'], 1
+
+
+def _stage_scrape_async(options: Dict):
+    from scrape_products import scrape_products_async
+
+    def run(_):
+        asyncio.run(scrape_products_async(options['urls'], max_concurrency=8, requests_per_second=None,
+                                          verify_images=False, adaptive=False))
+    return run, [None], len(options['urls'])
+
+
+STAGES: Dict[str, Callable] = {
+    'parse_lxml': _stage_parse('lxml'),
+    'parse_bs4': _stage_parse('bs4'),
+    'find_image': _stage_find_image,
+    'merge': _stage_merge,
+    'fetch_extract': _stage_fetch_extract,
+    'extract_image': _stage_extract_image,
+    'scrape_async': _stage_scrape_async,
+}
+
+NETWORK_STAGES = ('fetch_extract', 'extract_image', 'scrape_async')
+
+
+# ============================================
+# MEASUREMENT (runs in a fresh process per stage)
+# ============================================
+def _isolate_caches(directory: str) -> None:
+    import image_verifier
+    import link_resolver
+    import page_cache
+
+    page_cache._default_cache = page_cache.PageCache(os.path.join(directory, 'pages'))
+    link_resolver._default_cache = link_resolver.LinkCache(os.path.join(directory, 'links.sqlite'))
+    image_verifier._default_cache = image_verifier.VerdictCache(os.path.join(directory, 'image_verdicts.sqlite'))
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_stage(name: str, options: Dict) -> Dict:
+    """
+    Run one stage and measure it (call in a fresh process)
+    """
+    import http_client
+
+    # Retries against the stand-in server should not sleep for seconds
+    http_client.configure(backoff_factor=0.05, backoff_jitter=0.0, backoff_max=0.5)
+
+    with tempfile.TemporaryDirectory(prefix='bench-') as cache_dir, \
+            contextlib.redirect_stdout(io.StringIO()):
+        _isolate_caches(os.path.join(cache_dir, 'timed'))
+        func, items, batch = STAGES[name](options)
+
+        # Warm-up (imports, compiled selectors) outside the timed pass
+        if name not in NETWORK_STAGES:
+            func(items[0])
+
+        latencies = []
+        started = time.perf_counter()
+        for item in items:
+            item_started = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - item_started)
+        wall = time.perf_counter() - started
+        peak_rss = _peak_rss_mb()
+
+        # Memory pass on fresh caches: tracemalloc slows everything down
+        _isolate_caches(os.path.join(cache_dir, 'traced'))
+        sample = items[:max(1, min(len(items), options['memory_items']))]
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for item in sample:
+            func(item)
+        after = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    per_item = [latency / batch for latency in latencies]
+    count = len(items) * batch
+    return {
+        'items': count,
+        'wall_s': round(wall, 3),
+        'items_per_sec': round(count / wall, 2) if wall else None,
+        'p50_ms': round(_percentile(per_item, 0.50) * 1000, 3) if len(items) > 1 else None,
+        'p99_ms': round(_percentile(per_item, 0.99) * 1000, 3) if len(items) > 1 else None,
+        'mean_ms': round(statistics.mean(per_item) * 1000, 3),
+        'peak_rss_mb': peak_rss,
+        'traced_peak_mb': round(traced_peak / (1024 * 1024), 2),
+        'allocated_blocks': allocated_blocks // len(sample),
+    }
+
+
+def run_stage_isolated(name: str, options: Dict) -> Dict:
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_stage, name, options).result()
+
+
+# ============================================
+# BASELINE
+# ============================================
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+    Regressions of `results` against `baseline`, as printable lines
+    """
+    regressions = []
+    for stage, metrics in results.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new, old = metrics.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            if worse:
+                regressions.append(f"{stage}.{metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    columns = ('items', 'items_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb', 'traced_peak_mb', 'allocated_blocks')
+    print(f"{'stage':<15}" + ''.join(f"{c:>17}" for c in columns))
+    for stage, metrics in results.items():
+        cells = []
+        for column in columns:
+            value = metrics.get(column)
+            cell = '-' if value is None else f'{value:g}'
+            old = baseline.get(stage, {}).get(column)
+            if column in COMPARED_METRICS and value and old:
+                cell += f' ({(value - old) / old:+.0%})'
+            cells.append(f'{cell:>17}')
+        print(f'{stage:<15}' + ''.join(cells))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the scraper stages offline')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--pages', type=int, default=100, help='Corpus size')
+    parser.add_argument('--memory-items', type=int, default=10, help='Items measured with tracemalloc')
+    parser.add_argument('--latency', type=float, default=0.02, help='Stand-in server latency (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Extra random latency (max seconds)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Share of page requests answered with 429')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Relative change that counts as a regression')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    options = {'pages': args.pages, 'memory_items': args.memory_items}
+    results: Dict[str, Dict] = {}
+    server = StandInServer(load_corpus(args.pages), args.latency, args.jitter, args.rate_429)
+    with server:
+        options['urls'] = server.page_urls()
+        for stage in args.stages:
+            print(f"Running {stage}...", flush=True)
+            results[stage] = run_stage_isolated(stage, options)
+    if server.status_counts:
+        print(f"Stand-in server responses: {dict(sorted(server.status_counts.items()))}")
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['stages']
+    except (FileNotFoundError, KeyError, ValueError):
+        baseline = {}
+
+    print()
+    print_table(results, baseline)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'options': {k: v for k, v in vars(args).items() if k not in ('baseline', 'save_baseline', 'output')},
+        'stages': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        stages = {**baseline, **results}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({**report, 'stages': stages}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if baseline:
+        print(f"\nCompared with baseline ({args.tolerance:.0%} tolerance): "
+              + (f"{len(regressions)} regression(s)" if regressions else "no regressions"))
+        for line in regressions:
+            print(f"  ❌ {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
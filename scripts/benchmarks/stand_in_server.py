@@ -0,0 +1,190 @@
+"""
+Stand-in Amazon Server
+Local HTTP server that plays www.amazon.in and m.media-amazon.com for benchmarks.
+
+- /dp/<ASIN> serves corpus page N for ASIN B<N, 9 digits> (gzip-encoded when
+  the client accepts it, like the real site)
+- /m.media-amazon.com/... serves a 1500x1500 JPEG-shaped image (honours Range).
+  Image URLs in the pages are rewritten to point here; the path keeps
+  'media-amazon.com' so the scrapers' image checks still accept them.
+- Simulated latency (fixed + random jitter) and a share of 429 responses with
+  Retry-After, to exercise the retry and rate-limit paths
+
+Usage (standalone, e.g. to point a scraper at it by hand):
+    python stand_in_server.py --port 8800 --latency 0.1 --rate-429 0.05
+"""
+
+import argparse
+import gzip
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from corpus import load_corpus
+
+PAGE_PATH = re.compile(r'^/dp/B(\d{9})')
+IMAGE_PREFIX = '/m.media-amazon.com/'
+
+# Total size reported for stand-in images
+IMAGE_BYTES = 180 * 1024
+
+
+def fake_jpeg(width: int = 1500, height: int = 1500, size: int = IMAGE_BYTES) -> bytes:
+    """
+    JPEG header with the given dimensions, padded to `size` bytes. Enough for
+    header-sniffing checks; not a decodable image.
+    """
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+    sof = b'\xff\xc0' + struct.pack('>HBHHB', 17, 8, height, width, 3) + b'\x01\x22\x00\x02\x11\x01\x03\x11\x01'
+    head = b'\xff\xd8' + app0 + sof
+    return head + b'\x00' * (size - len(head) - 2) + b'\xff\xd9'
+
+
+class StandInServer:
+    """
+    Threaded stand-in server running in the background
+
+    Args:
+        pages: Page bodies served at /dp/B000000000, /dp/B000000001, ...
+        latency: Seconds added to every response
+        jitter: Up to this many extra random seconds per response
+        rate_429: Share of page requests answered with 429
+        retry_after: Retry-After seconds sent with a 429
+        seed: Random seed (latency jitter and 429 choice)
+    """
+
+    def __init__(self, pages: List[bytes], latency: float = 0.0, jitter: float = 0.0, rate_429: float = 0.0,
+                 retry_after: int = 0, seed: int = 0, host: str = '127.0.0.1', port: int = 0):
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.status_counts: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._image = fake_jpeg()
+        self._gzipped: dict = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+        self.base_url = f'http://{host}:{self._server.server_address[1]}'
+        self._image_base = (self.base_url + IMAGE_PREFIX).encode('ascii')
+
+    def page_url(self, index: int) -> str:
+        return f'{self.base_url}/dp/B{index:09d}'
+
+    def page_urls(self) -> List[str]:
+        return [self.page_url(i) for i in range(len(self.pages))]
+
+    def _page_body(self, index: int, compressed: bool) -> bytes:
+        body = self.pages[index].replace(b'https://m.media-amazon.com/', self._image_base)
+        if not compressed:
+            return body
+        if index not in self._gzipped:
+            self._gzipped[index] = gzip.compress(body, compresslevel=6)
+        return self._gzipped[index]
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency + self._random.random() * self.jitter
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.rate_429
+
+    def _count(self, status: int) -> None:
+        with self._lock:
+            self.status_counts[status] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status: int, body: bytes = b'', headers: Optional[dict] = None) -> None:
+                server._count(status)
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                time.sleep(server._delay())
+                if self.path.startswith(IMAGE_PREFIX):
+                    return self._send_image()
+                match = PAGE_PATH.match(self.path)
+                if not match or int(match.group(1)) >= len(server.pages):
+                    return self._send(404, b'Not Found', {'Content-Type': 'text/plain'})
+                if server._throttle():
+                    return self._send(429, b'Too Many Requests',
+                                      {'Content-Type': 'text/plain', 'Retry-After': str(server.retry_after)})
+                compressed = 'gzip' in self.headers.get('Accept-Encoding', '')
+                headers = {'Content-Type': 'text/html; charset=utf-8'}
+                if compressed:
+                    headers['Content-Encoding'] = 'gzip'
+                self._send(200, server._page_body(int(match.group(1)), compressed), headers)
+
+            def _send_image(self):
+                image = server._image
+                headers = {'Content-Type': 'image/jpeg'}
+                byte_range = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if byte_range:
+                    start = int(byte_range.group(1))
+                    end = min(int(byte_range.group(2) or len(image) - 1), len(image) - 1)
+                    headers['Content-Range'] = f'bytes {start}-{end}/{len(image)}'
+                    return self._send(206, image[start:end + 1], headers)
+                self._send(200, image, headers)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StandInServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stand-in Amazon server')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--pages', type=int, default=100, help='Corpus size')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Extra random latency (max seconds)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Share of page requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After seconds on 429')
+    args = parser.parse_args()
+
+    server = StandInServer(load_corpus(args.pages), args.latency, args.jitter, args.rate_429,
+                           args.retry_after, port=args.port)
+    print(f"Serving {args.pages} pages at {server.page_url(0)} ... {server.page_url(args.pages - 1)}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,227 @@
+"""
+Catalog Shards
+Per-category and per-subcategory slices of the catalog, so a page only
+downloads the products it shows.
+
+Written to public/data/catalog/ (served as static files):
+
+    index.json                                  manifest (counts, hashes, sizes)
+    products/<category>.json                    products.json entries of one category
+    products/<category>/<subcategory>.json      ... of one subcategory
+    subcategories/<category>/<subcategory>.json subcategoryProducts.json slice
+                                                ({price range: [products]})
+
+Each manifest entry has the shard's file name, item count, size and a short
+content hash; fetch shards as `<file>?v=<hash>` so they can be cached forever
+and are re-downloaded only when their content changes. Shards are minified by
+default and can get .gz / .br copies like the main catalog files.
+
+Usage:
+    python catalog_shards.py                      # build from the catalog store
+    python catalog_shards.py --compress gzip br
+"""
+
+import argparse
+import json
+import os
+import re
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from catalog_writer import COMPRESSIONS, CatalogWriter, write_json
+
+SHARDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'data', 'catalog')
+MANIFEST_FILE = 'index.json'
+MANIFEST_VERSION = 1
+
+# Products without a category still get a shard
+UNCATEGORIZED = 'uncategorized'
+
+# Characters of the SHA-256 kept in the manifest (plenty for cache-busting)
+HASH_LENGTH = 16
+
+
+def shard_slug(value: str) -> str:
+    """
+    File-name-safe version of a category / subcategory id
+    """
+    slug = re.sub(r'[^a-z0-9_-]+', '-', (value or '').strip().lower()).strip('-')
+    return slug or UNCATEGORIZED
+
+
+def _entry(file_name: str, count: int, content_hash: str, size: int) -> Dict:
+    return {'file': file_name, 'count': count, 'hash': content_hash[:HASH_LENGTH], 'bytes': size}
+
+
+def load_manifest(out_dir: str = SHARDS_DIR) -> Dict:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_files(manifest: Dict) -> set:
+    """
+    Every shard file name listed in a manifest
+    """
+    files = set()
+    for category in manifest.get('products', {}).get('categories', {}).values():
+        files.add(category['file'])
+        files.update(sub['file'] for sub in category.get('subcategories', {}).values())
+    for category in manifest.get('subcategoryProducts', {}).get('categories', {}).values():
+        files.update(sub['file'] for sub in category.values())
+    return files
+
+
+class ShardWriter:
+    """
+    Streams products into their category and subcategory shards in one pass
+
+    Only one product is held at a time; a writer per shard stays open until
+    commit(), which also writes the subcategoryProducts slices and the
+    manifest, then removes shards that no longer exist.
+
+    Args:
+        out_dir: Shard directory
+        minify: Compact JSON (default; shards are only read by the frontend)
+        compress: Also write .gz / .br copies of every shard
+    """
+
+    def __init__(self, out_dir: str = SHARDS_DIR, minify: bool = True, compress: Sequence[str] = ()):
+        self.out_dir = out_dir
+        self.minify = minify
+        self.compress = tuple(compress)
+        self.count = 0
+        os.makedirs(out_dir, exist_ok=True)
+        self._writers: Dict[Tuple[str, ...], CatalogWriter] = {}
+
+    def _writer(self, key: Tuple[str, ...]) -> CatalogWriter:
+        writer = self._writers.get(key)
+        if writer is None:
+            path = os.path.join(self.out_dir, 'products', *key[:-1], key[-1] + '.json')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self._writers[key] = CatalogWriter(path, minify=self.minify, compress=self.compress)
+        return writer
+
+    def write(self, product: Dict) -> None:
+        category = shard_slug(product.get('category'))
+        self._writer((category,)).write(product)
+        if product.get('subcategory'):
+            self._writer((category, shard_slug(product['subcategory']))).write(product)
+        self.count += 1
+
+    def write_all(self, products: Iterable[Dict]) -> int:
+        for product in products:
+            self.write(product)
+        return self.count
+
+    def _file_name(self, path: str) -> str:
+        return os.path.relpath(path, self.out_dir).replace(os.sep, '/')
+
+    def _write_subcategory_shards(self, data: Dict) -> Dict:
+        section: Dict = {}
+        for category_id, subcategories in data.items():
+            for subcategory, price_ranges in subcategories.items():
+                path = os.path.join(self.out_dir, 'subcategories', shard_slug(category_id),
+                                    shard_slug(subcategory) + '.json')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                content_hash, size = write_json(path, price_ranges, minify=self.minify, compress=self.compress)
+                count = sum(len(products) for products in price_ranges.values())
+                section.setdefault(category_id, {})[subcategory] = _entry(self._file_name(path), count,
+                                                                           content_hash, size)
+        return section
+
+    def commit(self, subcategory_products: Optional[Dict] = None) -> Dict:
+        """
+        Finish every shard and write the manifest
+
+        Args:
+            subcategory_products: Nested subcategoryProducts.json data to slice;
+                None keeps the subcategory shards of the previous build
+
+        Returns:
+            The manifest
+        """
+        previous = load_manifest(self.out_dir)
+        categories: Dict = {}
+        for key, writer in sorted(self._writers.items()):
+            writer.commit()
+            entry = _entry(self._file_name(writer.path), writer.count, writer.content_hash, writer.bytes_written)
+            if len(key) == 1:
+                categories.setdefault(key[0], {}).update(entry)
+            else:
+                categories.setdefault(key[0], {}).setdefault('subcategories', {})[key[1]] = entry
+        self._writers = {}
+
+        if subcategory_products is not None:
+            subcategory_section = {'categories': self._write_subcategory_shards(subcategory_products)}
+        else:
+            subcategory_section = previous.get('subcategoryProducts', {'categories': {}})
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'products': {'count': self.count, 'categories': categories},
+            'subcategoryProducts': subcategory_section,
+        }
+        # The manifest goes last, so it never points at a shard that isn't written yet
+        write_json(os.path.join(self.out_dir, MANIFEST_FILE), manifest, minify=self.minify, compress=self.compress)
+
+        for file_name in manifest_files(previous) - manifest_files(manifest):
+            path = os.path.join(self.out_dir, file_name)
+            for suffix in ('', '.gz', '.br'):
+                try:
+                    os.remove(path + suffix)
+                except OSError:
+                    pass
+            try:
+                os.rmdir(os.path.dirname(path))  # only succeeds once the directory is empty
+            except OSError:
+                pass
+        return manifest
+
+    def abort(self) -> None:
+        for writer in self._writers.values():
+            writer.abort()
+        self._writers = {}
+
+
+def write_shards(products: Iterable[Dict], subcategory_products: Optional[Dict] = None, out_dir: str = SHARDS_DIR,
+                 minify: bool = True, compress: Sequence[str] = ()) -> Dict:
+    """
+    Build all shards and the manifest. Returns the manifest.
+    """
+    writer = ShardWriter(out_dir, minify, compress)
+    try:
+        writer.write_all(products)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(subcategory_products)
+
+
+def print_manifest(manifest: Dict) -> None:
+    products = manifest['products']
+    print(f"Sharded {products['count']} products into {len(products['categories'])} categories:")
+    for category_id, category in products['categories'].items():
+        print(f"  {category_id}: {category['count']} products, {category['bytes'] / 1024:.1f} KB, "
+              f"{len(category.get('subcategories', {}))} subcategory shards")
+    subcategories = manifest['subcategoryProducts']['categories']
+    print(f"Subcategory shards: {sum(len(c) for c in subcategories.values())}")
+
+
+if __name__ == '__main__':
+    from catalog_store import open_catalog
+
+    parser = argparse.ArgumentParser(description='Write per-category catalog shards for the frontend')
+    parser.add_argument('--out-dir', default=SHARDS_DIR, help='Shard directory (default: public/data/catalog)')
+    parser.add_argument('--pretty', action='store_true', help='Indented JSON instead of minified')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, default=[],
+                        help='Also write pre-compressed copies (.gz / .br)')
+    args = parser.parse_args()
+
+    store = open_catalog()
+    try:
+        print_manifest(write_shards(store.iter_products(), store.export_subcategory_products(), args.out_dir,
+                                    minify=not args.pretty, compress=args.compress))
+    finally:
+        store.close()
@@ -0,0 +1,522 @@
+"""
+Product Catalog Store
+SQLite storage layer for the product catalog, with indexed lookups and a
+deterministic exporter for the frontend JSON files.
+
+The JSON files in src/data stay the source of truth that the frontend builds
+from. The store mirrors them in scripts/.cache/catalog.sqlite:
+
+- On open, a JSON file whose content changed since the last import/export is
+  re-imported automatically
+- Scripts query and update single products through indexes (id, product_link,
+  category, subcategory, image_url) instead of scanning and rewriting lists
+- export() regenerates products.json and subcategoryProducts.json once at the
+  end of a run, in the original order and formatting; files whose content
+  didn't change are not rewritten
+- Every product row carries a content hash of its canonical JSON. Downstream
+  steps (shards, search index, image mirror) call changes(<name>) to get the
+  products added, changed or removed since they last ran, and
+  mark_consumed(<name>) once they have caught up
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from catalog_shards import MANIFEST_FILE as SHARDS_MANIFEST, write_shards
+from catalog_writer import file_hash, write_catalog, write_json
+from search_index import build_index, write_index
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data')
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'catalog.sqlite')
+
+PRODUCTS_FILE = 'products.json'
+SUBCATEGORY_FILE = 'subcategoryProducts.json'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    product_link TEXT,
+    category TEXT,
+    subcategory TEXT,
+    image_url TEXT,
+    extracted_at TEXT,
+    data TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS products_position ON products (position);
+CREATE INDEX IF NOT EXISTS products_link ON products (product_link);
+CREATE INDEX IF NOT EXISTS products_category ON products (category, subcategory);
+CREATE INDEX IF NOT EXISTS products_subcategory ON products (subcategory);
+CREATE INDEX IF NOT EXISTS products_image ON products (image_url);
+CREATE INDEX IF NOT EXISTS products_extracted ON products (extracted_at);
+
+CREATE TABLE IF NOT EXISTS subcategory_products (
+    rowid INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    category_id TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    price_range TEXT NOT NULL,
+    id TEXT,
+    link TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sub_position ON subcategory_products (position);
+CREATE INDEX IF NOT EXISTS sub_id ON subcategory_products (id);
+CREATE INDEX IF NOT EXISTS sub_link ON subcategory_products (link);
+CREATE INDEX IF NOT EXISTS sub_category ON subcategory_products (category_id, subcategory, price_range);
+
+CREATE TABLE IF NOT EXISTS sources (
+    tbl TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+);
+
+-- Product content hashes each downstream step last processed
+CREATE TABLE IF NOT EXISTS consumed (
+    consumer TEXT NOT NULL,
+    id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (consumer, id)
+);
+'''
+
+# Key under which a consumer records the subcategoryProducts.json version it used
+SUBCATEGORY_KEY = '#subcategoryProducts'
+
+
+def ends_with_newline(path: str) -> bool:
+    """
+    Whether an existing file ends with a newline (kept on rewrite so exports
+    don't produce whitespace-only diffs)
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    except OSError:
+        return False
+
+
+def _dumps(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+def product_hash(product: Dict) -> str:
+    """
+    SHA-256 of a product's canonical serialization (sorted keys, compact), so
+    the hash only changes when the content does
+    """
+    canonical = json.dumps(product, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class CatalogStore:
+    """
+    SQLite mirror of products.json and subcategoryProducts.json
+
+    Args:
+        db_path: SQLite file
+        data_dir: Directory holding the frontend JSON files
+        products_file: File mirrored by the products table
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, data_dir: str = DATA_DIR,
+                 products_file: str = PRODUCTS_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.data_dir = data_dir
+        self.products_file = products_file
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.sync_from_json()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def _migrate(self) -> None:
+        # Stores created before products had a content hash
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(products)')}
+        if 'content_hash' not in columns:
+            self.conn.execute('ALTER TABLE products ADD COLUMN content_hash TEXT')
+        rows = self.conn.execute('SELECT id, data FROM products WHERE content_hash IS NULL').fetchall()
+        for product_id, data in rows:
+            self.conn.execute('UPDATE products SET content_hash = ? WHERE id = ?',
+                              (product_hash(json.loads(data)), product_id))
+        self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # Import
+    # ------------------------------------------------------------------
+    def _sources(self):
+        return (('products', self.products_file, self._import_products),
+                ('subcategory_products', SUBCATEGORY_FILE, self._import_subcategory_products))
+
+    def _recorded_source(self, table: str) -> Optional[tuple]:
+        return self.conn.execute('SELECT file_name, content_hash FROM sources WHERE tbl = ?', (table,)).fetchone()
+
+    def _record_source(self, table: str, name: str) -> None:
+        content_hash = file_hash(self.path(name))
+        if content_hash:
+            self.conn.execute('INSERT OR REPLACE INTO sources (tbl, file_name, content_hash) VALUES (?, ?, ?)',
+                              (table, name, content_hash))
+
+    def sync_from_json(self, force: bool = False) -> None:
+        """
+        Re-import any JSON file that changed since it was last imported or exported
+        """
+        for table, name, importer in self._sources():
+            current = file_hash(self.path(name))
+            if current is None:
+                continue
+            if force or self._recorded_source(table) != (name, current):
+                with open(self.path(name), 'r', encoding='utf-8') as f:
+                    importer(json.load(f))
+                self._record_source(table, name)
+        self.conn.commit()
+
+    def _import_products(self, products: List[Dict]) -> None:
+        self.conn.execute('DELETE FROM products')
+        for position, product in enumerate(products):
+            self._write_product(product, position)
+
+    def _import_subcategory_products(self, data: Dict) -> None:
+        self.conn.execute('DELETE FROM subcategory_products')
+        position = 0
+        for category_id, subcategories in data.items():
+            for subcategory, price_ranges in subcategories.items():
+                for price_range, products in price_ranges.items():
+                    for product in products:
+                        self._write_subcategory_product(category_id, subcategory, price_range, product, position)
+                        position += 1
+
+    # ------------------------------------------------------------------
+    # products.json
+    # ------------------------------------------------------------------
+    def _write_product(self, product: Dict, position: int) -> None:
+        self.conn.execute(
+            'INSERT OR REPLACE INTO products'
+            ' (id, position, product_link, category, subcategory, image_url, extracted_at, data, content_hash)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (product.get('id'), position, product.get('product_link'), product.get('category'),
+             product.get('subcategory'), product.get('image_url'), product.get('extracted_at'),
+             _dumps(product), product_hash(product))
+        )
+
+    def _products(self, where: str = '', params: tuple = ()) -> List[Dict]:
+        rows = self.conn.execute(f'SELECT data FROM products {where} ORDER BY position', params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_product(self, product_id: str) -> Optional[Dict]:
+        row = self.conn.execute('SELECT data FROM products WHERE id = ?', (product_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_link(self, product_link: str) -> List[Dict]:
+        return self._products('WHERE product_link = ?', (product_link,))
+
+    def products_in(self, category: str, subcategory: Optional[str] = None) -> List[Dict]:
+        """
+        Products of a category (optionally narrowed to one subcategory), in catalog order
+        """
+        if subcategory is None:
+            return self._products('WHERE category = ?', (category,))
+        return self._products('WHERE category = ? AND subcategory = ?', (category, subcategory))
+
+    def products_range(self, start: int, stop: int) -> List[Dict]:
+        """
+        Products at catalog positions start <= position < stop
+        """
+        return self._products('WHERE position >= ? AND position < ?', (start, stop))
+
+    def products_extracted_between(self, start: str, end: str) -> List[Dict]:
+        """
+        Products whose extracted_at (ISO timestamp) is in [start, end)
+        """
+        return self._products('WHERE extracted_at >= ? AND extracted_at < ?', (start, end))
+
+    def products_needing_images(self, placeholders: List[str] = (), markers: List[str] = ()) -> List[Dict]:
+        """
+        Products with no image, an image equal to one of `placeholders`, or an
+        image URL containing one of `markers`
+        """
+        clauses = ["image_url IS NULL", "image_url = ''"]
+        params: List[str] = []
+        for placeholder in placeholders:
+            clauses.append('image_url = ?')
+            params.append(placeholder)
+        for marker in markers:
+            clauses.append('instr(image_url, ?) > 0')
+            params.append(marker)
+        return self._products('WHERE ' + ' OR '.join(clauses), tuple(params))
+
+    def iter_products(self) -> Iterator[Dict]:
+        for row in self.conn.execute('SELECT data FROM products ORDER BY position'):
+            yield json.loads(row[0])
+
+    def count_products(self, category: Optional[str] = None) -> int:
+        if category is None:
+            return self.conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        return self.conn.execute('SELECT COUNT(*) FROM products WHERE category = ?', (category,)).fetchone()[0]
+
+    def upsert_product(self, product: Dict, merge: bool = True) -> str:
+        """
+        Insert or update a product by id
+
+        Existing products keep their position; with merge=True fields not in
+        `product` are kept too. New products are appended to the catalog.
+
+        Returns:
+            'added', 'updated' or 'unchanged'
+        """
+        row = self.conn.execute('SELECT position, data FROM products WHERE id = ?',
+                                (product.get('id'),)).fetchone()
+        if row is None:
+            position = self.conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM products').fetchone()[0]
+            self._write_product(product, position)
+            return 'added'
+        existing = json.loads(row[1])
+        updated = {**existing, **product} if merge else product
+        if updated == existing:
+            return 'unchanged'
+        self._write_product(updated, row[0])
+        return 'updated'
+
+    def update_product_fields(self, product_id: str, **fields) -> bool:
+        """
+        Update some fields of one product; returns False if the id is unknown
+        """
+        if self.get_product(product_id) is None:
+            return False
+        self.upsert_product({'id': product_id, **fields})
+        return True
+
+    def delete_product(self, product_id: str) -> bool:
+        return self.conn.execute('DELETE FROM products WHERE id = ?', (product_id,)).rowcount > 0
+
+    # ------------------------------------------------------------------
+    # Change tracking
+    # ------------------------------------------------------------------
+    def product_hashes(self) -> Dict[str, str]:
+        return dict(self.conn.execute('SELECT id, content_hash FROM products ORDER BY position'))
+
+    def changes(self, consumer: str) -> Dict[str, List[str]]:
+        """
+        Products added or changed, and ids removed, since `consumer` last
+        called mark_consumed() (everything counts as added the first time)
+
+        Returns:
+            {'changed': [ids in catalog order], 'removed': [ids]}
+        """
+        changed = [row[0] for row in self.conn.execute(
+            'SELECT p.id FROM products p LEFT JOIN consumed c ON c.consumer = ? AND c.id = p.id'
+            ' WHERE c.content_hash IS NULL OR c.content_hash != p.content_hash ORDER BY p.position',
+            (consumer,))]
+        removed = [row[0] for row in self.conn.execute(
+            'SELECT id FROM consumed WHERE consumer = ? AND id != ? AND id NOT IN (SELECT id FROM products)',
+            (consumer, SUBCATEGORY_KEY))]
+        return {'changed': changed, 'removed': removed}
+
+    def mark_consumed(self, consumer: str, ids: Optional[Iterable[str]] = None) -> None:
+        """
+        Record that `consumer` has processed the current version of the given
+        products (default: the whole catalog, forgetting removed ones)
+        """
+        if ids is None:
+            self.conn.execute('DELETE FROM consumed WHERE consumer = ? AND id != ?', (consumer, SUBCATEGORY_KEY))
+            self.conn.execute('INSERT INTO consumed (consumer, id, content_hash)'
+                              ' SELECT ?, id, content_hash FROM products', (consumer,))
+        else:
+            for product_id in ids:
+                self.conn.execute('INSERT OR REPLACE INTO consumed (consumer, id, content_hash)'
+                                  ' SELECT ?, id, content_hash FROM products WHERE id = ?', (consumer, product_id))
+        self.conn.commit()
+
+    def subcategory_version(self) -> Optional[str]:
+        """
+        Content hash of subcategoryProducts.json as last imported or exported
+        """
+        row = self._recorded_source('subcategory_products')
+        return row[1] if row else None
+
+    def subcategory_changed(self, consumer: str) -> bool:
+        row = self.conn.execute('SELECT content_hash FROM consumed WHERE consumer = ? AND id = ?',
+                                (consumer, SUBCATEGORY_KEY)).fetchone()
+        return row is None or row[0] != self.subcategory_version()
+
+    def mark_subcategory_consumed(self, consumer: str) -> None:
+        version = self.subcategory_version()
+        if version:
+            self.conn.execute('INSERT OR REPLACE INTO consumed (consumer, id, content_hash) VALUES (?, ?, ?)',
+                              (consumer, SUBCATEGORY_KEY, version))
+            self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # subcategoryProducts.json
+    # ------------------------------------------------------------------
+    def _write_subcategory_product(self, category_id: str, subcategory: str, price_range: str,
+                                   product: Dict, position: int, rowid: Optional[int] = None) -> None:
+        self.conn.execute(
+            'INSERT OR REPLACE INTO subcategory_products'
+            ' (rowid, position, category_id, subcategory, price_range, id, link, data)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (rowid, position, category_id, subcategory, price_range, product.get('id'),
+             product.get('link'), _dumps(product))
+        )
+
+    def subcategory_products(self, category_id: str, subcategory: Optional[str] = None) -> List[Dict]:
+        """
+        Entries of subcategoryProducts.json for a category (and subcategory),
+        each with its category_id, subcategory and price_range
+        """
+        query = ('SELECT category_id, subcategory, price_range, data FROM subcategory_products'
+                 ' WHERE category_id = ?')
+        params: tuple = (category_id,)
+        if subcategory is not None:
+            query += ' AND subcategory = ?'
+            params += (subcategory,)
+        rows = self.conn.execute(query + ' ORDER BY position', params).fetchall()
+        return [{'category_id': r[0], 'subcategory': r[1], 'price_range': r[2], 'product': json.loads(r[3])}
+                for r in rows]
+
+    def iter_subcategory_entries(self) -> Iterator[Dict]:
+        """
+        Every entry of subcategoryProducts.json in file order, with its rowid
+        (for update_subcategory_entry), category_id, subcategory and price_range
+        """
+        rows = self.conn.execute('SELECT rowid, category_id, subcategory, price_range, data'
+                                 ' FROM subcategory_products ORDER BY position')
+        for rowid, category_id, subcategory, price_range, data in rows:
+            yield {'rowid': rowid, 'category_id': category_id, 'subcategory': subcategory,
+                   'price_range': price_range, 'product': json.loads(data)}
+
+    def update_subcategory_entry(self, rowid: int, product: Dict) -> None:
+        """
+        Replace one entry (from iter_subcategory_entries) in place
+        """
+        row = self.conn.execute('SELECT position, category_id, subcategory, price_range FROM subcategory_products'
+                                ' WHERE rowid = ?', (rowid,)).fetchone()
+        if row is None:
+            raise KeyError(rowid)
+        self._write_subcategory_product(row[1], row[2], row[3], product, row[0], rowid)
+
+    def find_subcategory_by_link(self, link: str) -> List[Dict]:
+        rows = self.conn.execute(
+            'SELECT category_id, subcategory, price_range, data FROM subcategory_products'
+            ' WHERE link = ? ORDER BY position', (link,)
+        ).fetchall()
+        return [{'category_id': r[0], 'subcategory': r[1], 'price_range': r[2], 'product': json.loads(r[3])}
+                for r in rows]
+
+    def upsert_subcategory_product(self, category_id: str, subcategory: str, price_range: str,
+                                   product: Dict, merge: bool = True) -> str:
+        """
+        Insert or update an entry of subcategoryProducts.json by
+        (category, subcategory, price range, id)
+
+        Returns:
+            'added', 'updated' or 'unchanged'
+        """
+        row = self.conn.execute(
+            'SELECT rowid, position, data FROM subcategory_products'
+            ' WHERE category_id = ? AND subcategory = ? AND price_range = ? AND id = ?',
+            (category_id, subcategory, price_range, product.get('id'))
+        ).fetchone()
+        if row is None:
+            position = self.conn.execute(
+                'SELECT COALESCE(MAX(position), -1) + 1 FROM subcategory_products').fetchone()[0]
+            self._write_subcategory_product(category_id, subcategory, price_range, product, position)
+            return 'added'
+        existing = json.loads(row[2])
+        updated = {**existing, **product} if merge else product
+        if updated == existing:
+            return 'unchanged'
+        self._write_subcategory_product(category_id, subcategory, price_range, updated, row[1], row[0])
+        return 'updated'
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def export_products(self) -> List[Dict]:
+        return list(self.iter_products())
+
+    def export_subcategory_products(self) -> Dict:
+        """
+        Rebuild the nested category -> subcategory -> price range -> [products]
+        structure in stored order
+        """
+        data: Dict = {}
+        rows = self.conn.execute(
+            'SELECT category_id, subcategory, price_range, data FROM subcategory_products ORDER BY position'
+        )
+        for category_id, subcategory, price_range, product in rows:
+            data.setdefault(category_id, {}).setdefault(subcategory, {}).setdefault(price_range, []).append(
+                json.loads(product))
+        return data
+
+    def export(self, products: bool = True, subcategory_products: bool = True, minify: bool = False,
+               compress: Sequence[str] = (), shards_dir: Optional[str] = None,
+               search_index_path: Optional[str] = None) -> None:
+        """
+        Write the frontend JSON files from the store (atomic, same formatting
+        as before: indent=2, UTF-8) and commit
+
+        products.json is streamed row by row from the database, so memory
+        doesn't grow with the catalog. minify / compress are passed to the
+        catalog writer (compact output, .gz / .br copies). With shards_dir,
+        per-category shards and their manifest are rebuilt as well (see
+        catalog_shards.py), and with search_index_path the search index (see
+        search_index.py) - each only if a product changed since it was last
+        built (or its output is missing).
+        """
+        if products:
+            path = self.path(self.products_file)
+            write_catalog(path, self.iter_products(), minify=minify, compress=compress,
+                          trailing_newline=ends_with_newline(path))
+            self._record_source('products', self.products_file)
+        if subcategory_products:
+            path = self.path(SUBCATEGORY_FILE)
+            write_json(path, self.export_subcategory_products(), minify=minify, compress=compress,
+                       trailing_newline=ends_with_newline(path))
+            self._record_source('subcategory_products', SUBCATEGORY_FILE)
+        if shards_dir:
+            if (self._stale('shards', os.path.join(shards_dir, SHARDS_MANIFEST))
+                    or self.subcategory_changed('shards')):
+                write_shards(self.iter_products(), self.export_subcategory_products(), shards_dir,
+                             compress=compress)
+                self.mark_consumed('shards')
+                self.mark_subcategory_consumed('shards')
+            else:
+                print("Shards are up to date")
+        if search_index_path:
+            if self._stale('search_index', search_index_path):
+                write_index(build_index(self.iter_products()), search_index_path, compress)
+                self.mark_consumed('search_index')
+            else:
+                print("Search index is up to date")
+        self.conn.commit()
+
+    def _stale(self, consumer: str, output_path: str) -> bool:
+        changes = self.changes(consumer)
+        return bool(changes['changed'] or changes['removed']) or not os.path.exists(output_path)
+
+    def close(self) -> None:
+        """
+        Close the store, discarding changes not committed by export() or
+        commit(), so the store never gets ahead of the JSON files it mirrors
+        """
+        self.conn.rollback()
+        self.conn.close()
+
+
+def open_catalog(data_dir: str = DATA_DIR, db_path: str = DEFAULT_DB_PATH,
+                 products_file: str = PRODUCTS_FILE) -> CatalogStore:
+    """
+    Open the catalog store, re-importing any JSON file changed since last use
+    """
+    return CatalogStore(db_path, data_dir, products_file)
@@ -0,0 +1,258 @@
+"""
+Catalog Sync
+Keeps products.json, subcategoryProducts.json and trendingProducts.json
+consistent in one pass.
+
+- Every entry of the three files is read once and indexed by id (products
+  and subcategory entries share ids), ASIN and normalized link; entries that
+  share any key are joined into one group (union-find), so a trending entry
+  with a different amzn.to link still meets its products.json twin once
+  both links resolve to the same ASIN
+- For each synced field, the value from the first source in the field's
+  precedence list that has a usable value wins and is copied to the rest of
+  the group (missing, placeholder and thumbnail images and "Product Title Not
+  Found" never win)
+- The three files are written together at the end, and only those that changed
+
+ASINs come from the URL or the short link cache (see link_resolver.py); pass
+--resolve to resolve uncached amzn.to links first.
+
+Usage:
+    python catalog_sync.py                        # sync images (default rules)
+    python catalog_sync.py --dry-run
+    python catalog_sync.py --rules rules.json     # e.g. {"image": ["subcategory", "products"],
+                                                  #       "title": ["products", "subcategory"]}
+"""
+
+import argparse
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import link_resolver
+import telemetry
+from catalog_store import DATA_DIR, DEFAULT_DB_PATH, PRODUCTS_FILE, open_catalog
+from image_refresh import entry_image, image_problem, load_trending, save_trending
+from product_parser import TITLE_NOT_FOUND
+
+SOURCES = ('products', 'subcategory', 'trending')
+
+# Where each synced field lives in each file. Subcategory and trending entries
+# carry the image twice (image / amazonImageUrl); both are kept in step.
+FIELD_KEYS = {
+    'image': {'products': ('image_url',), 'subcategory': ('image', 'amazonImageUrl'),
+              'trending': ('image', 'amazonImageUrl')},
+    'title': {source: ('title',) for source in SOURCES},
+    'description': {source: ('description',) for source in SOURCES},
+}
+
+LINK_KEYS = {'products': 'product_link', 'subcategory': 'link', 'trending': 'link'}
+
+# Field -> sources in order of precedence. Curated subcategory entries win
+# images, as in sync_product_images_from_subcategory.mjs.
+DEFAULT_RULES: Dict[str, Tuple[str, ...]] = {
+    'image': ('subcategory', 'trending', 'products'),
+}
+
+
+def load_rules(path: Optional[str]) -> Dict[str, Tuple[str, ...]]:
+    """
+    Precedence rules from a JSON file ({field: [source, ...]}), or the defaults
+    """
+    if not path:
+        return dict(DEFAULT_RULES)
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    for field, sources in rules.items():
+        if field not in FIELD_KEYS:
+            raise ValueError(f'Unknown field {field!r} (expected one of {tuple(FIELD_KEYS)})')
+        unknown = set(sources) - set(SOURCES)
+        if unknown:
+            raise ValueError(f'Unknown sources {sorted(unknown)} for {field!r} (expected any of {SOURCES})')
+    return {field: tuple(sources) for field, sources in rules.items()}
+
+
+def normalize_link(link: str) -> str:
+    """
+    Link without query, fragment, trailing slash or host case differences
+    (affiliate tags and tracking parameters don't make a different product)
+    """
+    parsed = urlparse(link.strip())
+    return f'{parsed.netloc.lower()}{parsed.path.rstrip("/")}'
+
+
+def field_value(entry: Dict, field: str) -> Optional[str]:
+    if field == 'image' and entry['source'] != 'products':
+        return entry_image(entry['product'])
+    return entry['product'].get(FIELD_KEYS[field][entry['source']][0])
+
+
+def usable(field: str, value: Optional[str]) -> bool:
+    if field == 'image':
+        return image_problem(value) is None
+    if field == 'title':
+        return bool(value and value.strip()) and value != TITLE_NOT_FOUND
+    return bool(value and value.strip())
+
+
+def set_field(entry: Dict, field: str, value: str) -> None:
+    product = entry['product']
+    keys = FIELD_KEYS[field][entry['source']]
+    present = [key for key in keys if key in product] or keys[:1]
+    for key in present:
+        product[key] = value
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: List[int] = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a: int, b: int) -> None:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def join_entries(entries: List[Dict]) -> List[List[Dict]]:
+    """
+    Group entries that share an id (products / subcategory), ASIN or link.
+    Groups come back in first-seen order.
+    """
+    sets = _UnionFind()
+    owners: Dict[Tuple[str, str], int] = {}
+    cache = link_resolver.get_cache()
+    for entry in entries:
+        index = sets.add()
+        keys = []
+        if entry['source'] in ('products', 'subcategory') and entry['product'].get('id'):
+            keys.append(('id', str(entry['product']['id'])))
+        link = entry['product'].get(LINK_KEYS[entry['source']])
+        if link:
+            keys.append(('link', normalize_link(link)))
+            asin = link_resolver.known_asin(link, cache)
+            if asin:
+                keys.append(('asin', asin))
+        for key in keys:
+            if key in owners:
+                sets.union(owners[key], index)
+            else:
+                owners[key] = index
+    groups: Dict[int, List[Dict]] = {}
+    for index, entry in enumerate(entries):
+        groups.setdefault(sets.find(index), []).append(entry)
+    return list(groups.values())
+
+
+def resolve_group(group: List[Dict], field: str, precedence: Sequence[str]) -> Tuple[Optional[str], bool]:
+    """
+    Winning value of a field for a group, and whether the group disagreed
+    """
+    rank = {source: i for i, source in enumerate(precedence)}
+    candidates = [entry for entry in group if entry['source'] in rank]
+    candidates.sort(key=lambda entry: rank[entry['source']])  # stable: file order within a source
+    values = [field_value(entry, field) for entry in candidates]
+    usable_values = [value for value in values if usable(field, value)]
+    winner = usable_values[0] if usable_values else None
+    return winner, len(set(usable_values)) > 1
+
+
+def sync_catalog(rules: Optional[Dict[str, Sequence[str]]] = None, dry_run: bool = False, resolve: bool = False,
+                 data_dir: str = DATA_DIR, db_path: str = DEFAULT_DB_PATH, products_file: str = PRODUCTS_FILE) -> Dict:
+    """
+    Join the three data files and apply the precedence rules
+
+    Args:
+        rules: Field -> sources in order of precedence (default DEFAULT_RULES).
+            Only entries of the listed sources are read and updated for a field.
+        dry_run: Report what would change without writing
+        resolve: Resolve uncached short links first (network), so more
+            entries can be joined by ASIN
+        data_dir / db_path / products_file: As for open_catalog()
+
+    Returns:
+        Report: entries per source, groups, conflicts per field, updates per source
+    """
+    rules = dict(DEFAULT_RULES if rules is None else rules)
+    store = open_catalog(data_dir, db_path, products_file)
+    trending = load_trending(data_dir)
+    report = {'entries': dict.fromkeys(SOURCES, 0), 'groups': 0, 'joined': 0,
+              'conflicts': dict.fromkeys(rules, 0), 'updated': dict.fromkeys(SOURCES, 0)}
+    try:
+        # One pass over each file
+        entries: List[Dict] = []
+        entries.extend({'source': 'products', 'ref': p['id'], 'product': p} for p in store.iter_products())
+        entries.extend({'source': 'subcategory', 'ref': e['rowid'], 'product': e['product']}
+                       for e in store.iter_subcategory_entries())
+        entries.extend({'source': 'trending', 'ref': i, 'product': p} for i, p in enumerate(trending))
+        for entry in entries:
+            report['entries'][entry['source']] += 1
+
+        if resolve:
+            links = {entry['product'].get(LINK_KEYS[entry['source']]) for entry in entries}
+            link_resolver.resolve_links(sorted(link for link in links if link))
+
+        changed: Dict[int, Dict] = {}
+        with telemetry.span('extract'):
+            groups = join_entries(entries)
+            report['groups'] = len(groups)
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                report['joined'] += 1
+                for field, precedence in rules.items():
+                    winner, conflict = resolve_group(group, field, precedence)
+                    if conflict:
+                        report['conflicts'][field] += 1
+                    if winner is None:
+                        continue
+                    for entry in group:
+                        if entry['source'] in precedence and field_value(entry, field) != winner:
+                            set_field(entry, field, winner)
+                            changed[id(entry)] = entry
+
+        for entry in changed.values():
+            report['updated'][entry['source']] += 1
+        print(f"Catalog sync: {sum(report['entries'].values())} entries "
+              f"({', '.join(f'{n} {s}' for s, n in report['entries'].items())}), "
+              f"{report['joined']} joined groups")
+        for field, count in report['conflicts'].items():
+            print(f"  {field}: {count} conflicts resolved by {' > '.join(rules[field])}")
+        print(f"  Updates: {', '.join(f'{n} {s}' for s, n in report['updated'].items())}"
+              + (' (dry run)' if dry_run else ''))
+        if dry_run or not changed:
+            return report
+
+        # All three outputs are written together, once
+        for entry in changed.values():
+            if entry['source'] == 'products':
+                store.upsert_product(entry['product'], merge=False)
+            elif entry['source'] == 'subcategory':
+                store.update_subcategory_entry(entry['ref'], entry['product'])
+        updated = report['updated']
+        if updated['products'] or updated['subcategory']:
+            store.export(products=bool(updated['products']), subcategory_products=bool(updated['subcategory']))
+        if updated['trending']:
+            save_trending(trending, data_dir)
+        return report
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sync fields across products, subcategory and trending data')
+    parser.add_argument('--rules', help='JSON file: {field: [source, ...]} in order of precedence')
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without writing')
+    parser.add_argument('--resolve', action='store_true', help='Resolve uncached amzn.to links first (network)')
+    args = parser.parse_args()
+
+    sync_catalog(load_rules(args.rules), dry_run=args.dry_run, resolve=args.resolve)
@@ -0,0 +1,336 @@
+"""
+Catalog Writer
+Streaming writer for the product catalog files.
+
+- Products are serialised one at a time as they are produced, so memory stays
+  flat however large the catalog grows (no list-wide json.dump)
+- Output as a JSON array (pretty, byte-identical to json.dump(indent=2), or
+  minified for production) or as NDJSON, one product per line
+- Optional pre-compressed copies for the static host (<file>.gz, and
+  <file>.br when the brotli package is installed), encoded in the same pass
+- Everything goes to temp files in the target directory that are fsynced and
+  renamed into place on commit, so a crash never leaves a half-written catalog
+  (or a .gz that doesn't match the .json next to it)
+- A file whose content hash matches what is already on disk is not replaced,
+  so unchanged catalogs keep their timestamps (no build cache / CDN
+  invalidation, no noisy diffs)
+
+Usage:
+    with CatalogWriter('products.json', minify=True, compress=('gzip', 'br')) as writer:
+        for product in products:
+            writer.write(product)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import telemetry
+from job_journal import file_mode
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+FORMATS = ('json', 'ndjson')
+COMPRESSIONS = ('gzip', 'br')
+
+# Catalog files are written once and downloaded many times: compress hard
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def available_compressions() -> Tuple[str, ...]:
+    """
+    Compressions that can be used on this machine
+    """
+    return tuple(c for c in COMPRESSIONS if c != 'br' or brotli is not None)
+
+
+def file_hash(path: str) -> Optional[str]:
+    """
+    SHA-256 of a file's bytes, or None if it does not exist
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def _dumps(data, minify: bool) -> str:
+    if minify:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+class _Output:
+    """
+    One destination file written through a temp file (optionally compressed)
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = None):
+        self.path = path
+        fd, self.tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp',
+                                             dir=os.path.dirname(os.path.abspath(path)))
+        self.file = os.fdopen(fd, 'wb')
+        self._gzip = None
+        self._brotli = None
+        if compression == 'gzip':
+            # mtime=0 keeps the .gz identical for identical content
+            self._gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self.file, compresslevel=GZIP_LEVEL, mtime=0)
+        elif compression == 'br':
+            self._brotli = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+    def write(self, data: bytes) -> None:
+        if self._gzip is not None:
+            self._gzip.write(data)
+        elif self._brotli is not None:
+            self.file.write(self._brotli.process(data))
+        else:
+            self.file.write(data)
+
+    def finish(self) -> None:
+        if self._gzip is not None:
+            self._gzip.close()
+        elif self._brotli is not None:
+            self.file.write(self._brotli.finish())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        # mkstemp creates the file as 0600; the static server must be able to read it
+        os.chmod(self.tmp_path, file_mode(self.path))
+
+    def discard(self) -> None:
+        try:
+            self.file.close()
+        except OSError:
+            pass
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class _OutputSet:
+    """
+    A catalog file plus its compressed copies, all receiving the same bytes
+    """
+
+    def __init__(self, path: str, compress: Sequence[str] = ()):
+        unknown = set(compress) - set(COMPRESSIONS)
+        if unknown:
+            raise ValueError(f'Unknown compression {sorted(unknown)} (expected any of {COMPRESSIONS})')
+        if 'br' in compress and brotli is None:
+            print("⚠️ brotli is not installed (pip install brotli), skipping the .br copy")
+        self.path = path
+        self.bytes_written = 0
+        self.changed: Optional[bool] = None
+        self._hash = hashlib.sha256()
+        self._outputs: List[_Output] = []
+        try:
+            self._outputs.append(_Output(path))
+            for compression in compress:
+                if compression in available_compressions():
+                    self._outputs.append(_Output(path + _SUFFIXES[compression], compression))
+        except BaseException:
+            self.abort()
+            raise
+
+    @property
+    def paths(self) -> List[str]:
+        return [output.path for output in self._outputs]
+
+    @property
+    def content_hash(self) -> str:
+        """
+        SHA-256 of the uncompressed content written so far
+        """
+        return self._hash.hexdigest()
+
+    def write(self, text: str) -> None:
+        data = text.encode('utf-8')
+        self.bytes_written += len(data)
+        self._hash.update(data)
+        for output in self._outputs:
+            output.write(data)
+
+    def _unchanged(self) -> bool:
+        # Every copy must already exist: a newly requested .gz is still written
+        return (all(os.path.exists(output.path) for output in self._outputs)
+                and file_hash(self.path) == self.content_hash)
+
+    def commit(self) -> None:
+        """
+        Rename everything into place, unless the content is identical to the
+        file on disk (then the temp files are dropped). Sets `changed`.
+        """
+        try:
+            if self._unchanged():
+                self.changed = False
+                telemetry.count('files_unchanged')
+                self.abort()
+                return
+            for output in self._outputs:
+                output.finish()
+            # Compressed copies first: the main file appearing last means a
+            # reader never sees a new .json next to stale .gz/.br copies
+            for output in reversed(self._outputs):
+                os.replace(output.tmp_path, output.path)
+        except BaseException:
+            self.abort()
+            raise
+        self.changed = True
+        telemetry.count('files_written')
+        # A copy from an earlier compressed export would no longer match
+        written = set(self.paths)
+        for suffix in _SUFFIXES.values():
+            if self.path + suffix not in written:
+                try:
+                    os.remove(self.path + suffix)
+                except FileNotFoundError:
+                    pass
+        self._outputs = []
+
+    def abort(self) -> None:
+        for output in self._outputs:
+            output.discard()
+        self._outputs = []
+
+
+class CatalogWriter:
+    """
+    Streams JSON values into a catalog file (and its compressed copies)
+
+    Args:
+        path: Destination file
+        fmt: 'json' (array) or 'ndjson' (one value per line)
+        minify: Compact JSON without indentation or spaces
+        compress: Any of 'gzip', 'br' to also write <path>.gz / <path>.br.
+            'br' is skipped with a warning when brotli isn't installed.
+        trailing_newline: End a JSON array file with a newline
+    """
+
+    def __init__(self, path: str, fmt: str = 'json', minify: bool = False, compress: Sequence[str] = (),
+                 trailing_newline: bool = False):
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown format {fmt!r} (expected one of {FORMATS})')
+        self.path = path
+        self.fmt = fmt
+        self.minify = minify
+        self.trailing_newline = trailing_newline
+        self.count = 0
+        self._outputs = _OutputSet(path, compress)
+        self.paths = self._outputs.paths
+        self._closed = False
+
+    @property
+    def bytes_written(self) -> int:
+        return self._outputs.bytes_written
+
+    @property
+    def content_hash(self) -> str:
+        return self._outputs.content_hash
+
+    @property
+    def changed(self) -> Optional[bool]:
+        """
+        After commit(): whether the file was actually replaced
+        """
+        return self._outputs.changed
+
+    def write(self, item) -> None:
+        """
+        Append one value (usually a product dict)
+        """
+        if self.fmt == 'ndjson':
+            self._outputs.write(_dumps(item, minify=True) + '\n')
+        elif self.minify:
+            self._outputs.write(('[' if self.count == 0 else ',') + _dumps(item, minify=True))
+        else:
+            # Same layout as json.dump(items, indent=2): each item indented one level
+            item_text = _dumps(item, minify=False).replace('\n', '\n  ')
+            self._outputs.write(('[\n  ' if self.count == 0 else ',\n  ') + item_text)
+        self.count += 1
+
+    def write_all(self, items: Iterable) -> int:
+        for item in items:
+            self.write(item)
+        return self.count
+
+    def commit(self) -> None:
+        """
+        Close the array, flush everything to disk and rename into place
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.fmt == 'json':
+            if self.count == 0:
+                self._outputs.write('[]')
+            else:
+                self._outputs.write(']' if self.minify else '\n]')
+            if self.trailing_newline:
+                self._outputs.write('\n')
+        self._outputs.commit()
+
+    def abort(self) -> None:
+        """
+        Drop everything written so far; the existing files stay untouched
+        """
+        self._closed = True
+        self._outputs.abort()
+
+    def __enter__(self) -> 'CatalogWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def write_catalog(path: str, items: Iterable, fmt: str = 'json', minify: bool = False, compress: Sequence[str] = (),
+                  trailing_newline: bool = False) -> int:
+    """
+    Stream `items` (any iterable, e.g. a generator over the catalog store) into
+    `path`. Returns the number of items written.
+    """
+    with telemetry.span('write'):
+        with CatalogWriter(path, fmt, minify, compress, trailing_newline) as writer:
+            return writer.write_all(items)
+
+
+def write_json(path: str, data, minify: bool = False, compress: Sequence[str] = (),
+               trailing_newline: bool = False) -> Tuple[str, int]:
+    """
+    Write a single JSON document (e.g. the nested subcategory catalog) with the
+    same minify / compressed-copy / atomic-rename handling, encoded in chunks
+
+    Returns:
+        (SHA-256 of the content, size in bytes)
+    """
+    with telemetry.span('write'):
+        outputs = _OutputSet(path, compress)
+        try:
+            encoder = json.JSONEncoder(ensure_ascii=False, indent=None if minify else 2,
+                                       separators=(',', ':') if minify else None)
+            for chunk in encoder.iterencode(data):
+                outputs.write(chunk)
+            if trailing_newline:
+                outputs.write('\n')
+        except BaseException:
+            outputs.abort()
+            raise
+        outputs.commit()
+        return outputs.content_hash, outputs.bytes_written
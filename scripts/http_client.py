@@ -0,0 +1,220 @@
+"""
+Shared HTTP Client
+One pooled requests.Session used by every scraping script.
+
+- Keep-alive connection pooling, so repeat requests to amzn.to / www.amazon.in
+  reuse TCP+TLS connections instead of paying a new handshake each time
+- Retries with exponential backoff and jitter on 429/503 (and other transient
+  5xx), honouring Retry-After, so throttled requests are retried instead of
+  silently turning into placeholder images
+- Observers (see add_observer) hear about every response and whether the
+  server asked us to slow down, e.g. the adaptive rate controller
+- Pool sizes and retry policy are tunable through configure() or environment
+  variables (SCRAPER_POOL_CONNECTIONS, SCRAPER_POOL_MAXSIZE, SCRAPER_MAX_RETRIES,
+  SCRAPER_BACKOFF_FACTOR, SCRAPER_BACKOFF_JITTER, SCRAPER_TIMEOUT)
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import telemetry
+
+# Browser-like headers sent with every request
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+# Status codes that mean "slow down / try again later"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Of those, the ones that mean the server is throttling us
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def _env_number(name: str, default, cast=float):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+# Current client settings (see configure())
+settings = {
+    'pool_connections': _env_number('SCRAPER_POOL_CONNECTIONS', 10, int),
+    'pool_maxsize': _env_number('SCRAPER_POOL_MAXSIZE', 20, int),
+    'max_retries': _env_number('SCRAPER_MAX_RETRIES', 4, int),
+    'backoff_factor': _env_number('SCRAPER_BACKOFF_FACTOR', 1.0),
+    'backoff_jitter': _env_number('SCRAPER_BACKOFF_JITTER', 0.5),
+    'backoff_max': _env_number('SCRAPER_BACKOFF_MAX', 60.0),
+    'timeout': _env_number('SCRAPER_TIMEOUT', 15.0),
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# observer(url, throttled, seconds), see add_observer()
+Observer = Callable[[str, Optional[str], float], None]
+_observers: List[Observer] = []
+
+
+def build_retry() -> Retry:
+    """
+    Retry policy: exponential backoff (backoff_factor * 2**n) plus random
+    jitter, capped at backoff_max, on connection errors and RETRY_STATUS_CODES
+    """
+    return Retry(
+        total=settings['max_retries'],
+        connect=settings['max_retries'],
+        read=settings['max_retries'],
+        status=settings['max_retries'],
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        backoff_factor=settings['backoff_factor'],
+        backoff_jitter=settings['backoff_jitter'],
+        backoff_max=settings['backoff_max'],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def build_session() -> requests.Session:
+    """
+    Create a new session with pooled, retrying adapters for http and https
+    """
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=settings['pool_connections'],
+        pool_maxsize=settings['pool_maxsize'],
+        max_retries=build_retry(),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure(**overrides) -> None:
+    """
+    Change client settings (pool_connections, pool_maxsize, max_retries,
+    backoff_factor, backoff_jitter, backoff_max, timeout).
+    The shared session is rebuilt on next use.
+    """
+    global _session
+    unknown = set(overrides) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown HTTP client setting(s): {', '.join(sorted(unknown))}")
+    with _session_lock:
+        settings.update(overrides)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Return the shared session, creating it on first use
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def add_observer(observer: Observer) -> None:
+    """
+    Call observer(url, throttled, seconds) after every response: `throttled` is
+    'http_429' / 'http_503' when the server sent one (even if a retry then
+    succeeded), a reason passed to report_throttled(), or None. Observers run
+    on the requesting thread and must be thread-safe.
+    """
+    _observers.append(observer)
+
+
+def remove_observer(observer: Observer) -> None:
+    try:
+        _observers.remove(observer)
+    except ValueError:
+        pass
+
+
+def _notify(url: str, throttled: Optional[str], seconds: float) -> None:
+    for observer in list(_observers):
+        observer(url, throttled, seconds)
+
+
+def report_throttled(url: str, reason: str) -> None:
+    """
+    Tell the observers about a throttling sign found in a response body
+    (e.g. 'robot_check' for a CAPTCHA page served with status 200)
+    """
+    _notify(url, reason, 0.0)
+
+
+def _record(response: requests.Response) -> requests.Response:
+    """
+    Count the response status and the retries urllib3 made for it, and tell
+    the observers
+    """
+    telemetry.count('http_responses', status=response.status_code)
+    retries = getattr(response.raw, 'retries', None)
+    history = getattr(retries, 'history', None) or ()
+    throttled = None
+    for attempt in history:
+        telemetry.count('retries', status=attempt.status if attempt.status else 'error')
+        if throttled is None and attempt.status in THROTTLE_STATUS_CODES:
+            throttled = f'http_{attempt.status}'
+    if throttled is None and response.status_code in THROTTLE_STATUS_CODES:
+        throttled = f'http_{response.status_code}'
+    if _observers:
+        _notify(response.url, throttled, response.elapsed.total_seconds())
+    return response
+
+
+def get(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+        **kwargs) -> requests.Response:
+    """
+    GET a URL through the shared session
+
+    Args:
+        url: URL to fetch
+        headers: Extra headers merged over DEFAULT_HEADERS
+        timeout: Request timeout in seconds (defaults to settings['timeout'])
+
+    Returns:
+        The final response (after redirects and retries); raise_for_status()
+        is left to the caller
+    """
+    return _record(get_session().get(
+        url,
+        headers=headers,
+        timeout=settings['timeout'] if timeout is None else timeout,
+        **kwargs
+    ))
+
+
+def head(url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None,
+         **kwargs) -> requests.Response:
+    """
+    HEAD a URL through the shared session (see get())
+    """
+    return _record(get_session().head(
+        url,
+        headers=headers,
+        timeout=settings['timeout'] if timeout is None else timeout,
+        **kwargs
+    ))
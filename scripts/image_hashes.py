@@ -0,0 +1,334 @@
+"""
+Image Hashes
+Perceptual hashing of product images to find duplicates and placeholders.
+
+Placeholders used to be found by looking for '51nBTTG3hNL' in the URL, and
+scrape_products only compares a product's image with the one before it. Both
+miss the same picture served under a different URL or size. This module:
+
+- Computes a 64-bit pHash (DCT) and dHash (gradient) for every product image;
+  hashes are cached by image URL in scripts/.cache/image_hashes.sqlite
+- Indexes the pHashes in a BK-tree, so near-duplicate lookups take roughly
+  O(log n) comparisons instead of comparing every pair
+- Flags products that share an image with another product or match a known
+  placeholder image
+
+Usage:
+    python image_hashes.py                 # report duplicates and placeholders in products.json
+    python image_hashes.py --threshold 6   # stricter matching
+"""
+
+import argparse
+import io
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import http_client
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'image_hashes.sqlite')
+
+# Images known to be placeholders rather than product photos
+KNOWN_PLACEHOLDERS = (
+    'https://m.media-amazon.com/images/I/51nBTTG3hNL._SL1500_.jpg',
+)
+
+# Maximum Hamming distance (of 64 bits) for two images to count as the same.
+# A pHash match is confirmed with the dHash to keep false positives down.
+PHASH_THRESHOLD = 8
+DHASH_THRESHOLD = 12
+
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+_DCT_MATRIX = [[math.cos(math.pi * (2 * x + 1) * u / (2 * _DCT_SIZE)) for x in range(_DCT_SIZE)]
+               for u in range(_DCT_KEEP)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+# ============================================
+# HASHING
+# ============================================
+def _grayscale(data: bytes, size: Tuple[int, int]) -> List[int]:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('L', (size[0] * 4, size[1] * 4))
+        return list(image.convert('L').resize(size, Image.LANCZOS).getdata())
+
+
+def dhash(data: bytes) -> int:
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 thumbnail
+    """
+    pixels = _grayscale(data, (9, 8))
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def phash(data: bytes) -> int:
+    """
+    DCT hash: the 8x8 lowest frequencies of a 32x32 thumbnail, one bit per
+    coefficient above the median (DC term excluded from the median)
+    """
+    pixels = _grayscale(data, (_DCT_SIZE, _DCT_SIZE))
+    rows = [pixels[i * _DCT_SIZE:(i + 1) * _DCT_SIZE] for i in range(_DCT_SIZE)]
+    # Separable 2D DCT-II, keeping only the low frequencies
+    partial = [[sum(c * p for c, p in zip(basis, row)) for basis in _DCT_MATRIX] for row in rows]
+    coefficients = [sum(_DCT_MATRIX[u][x] * partial[x][v] for x in range(_DCT_SIZE))
+                    for u in range(_DCT_KEEP) for v in range(_DCT_KEEP)]
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def hash_image(data: bytes) -> Tuple[int, int]:
+    """
+    (pHash, dHash) of an encoded image; runs in a worker process
+    """
+    return phash(data), dhash(data)
+
+
+# ============================================
+# BK-TREE
+# ============================================
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance
+
+    Each child edge is labelled with its distance to the parent, and the
+    triangle inequality limits a radius-r search to edges within r of the
+    query's distance to the node.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """
+        All items within `radius` of value, as (distance, item)
+        """
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.extend((distance, item) for item in items)
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+# ============================================
+# HASH CACHE
+# ============================================
+class HashCache:
+    """
+    SQLite cache of image URL -> (pHash, dHash) (thread-safe)
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            ' url TEXT PRIMARY KEY, phash TEXT NOT NULL, dhash TEXT NOT NULL, computed_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        found = {}
+        with self._lock:
+            for url in urls:
+                row = self._conn.execute('SELECT phash, dhash FROM hashes WHERE url = ?', (url,)).fetchone()
+                if row:
+                    found[url] = (int(row[0], 16), int(row[1], 16))
+        return found
+
+    def put(self, url: str, hashes: Tuple[int, int]) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO hashes (url, phash, dhash, computed_at) VALUES (?, ?, ?, ?)',
+                (url, f'{hashes[0]:016x}', f'{hashes[1]:016x}', time.time())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _download(url: str) -> bytes:
+    response = http_client.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+def hash_urls(urls: Iterable[str], cache: Optional[HashCache] = None, workers: Optional[int] = None,
+              download_workers: int = 8) -> Dict[str, Tuple[int, int]]:
+    """
+    (pHash, dHash) for each image URL: cached hashes are reused, the rest are
+    downloaded concurrently and hashed in a process pool
+
+    Returns:
+        Mapping of url -> (phash, dhash); URLs that failed are left out
+    """
+    cache = cache or HashCache()
+    urls = list(dict.fromkeys(u for u in urls if u and u.startswith('http')))
+    hashes = cache.get_many(urls)
+    missing = [u for u in urls if u not in hashes]
+    if not missing:
+        return hashes
+
+    with ThreadPoolExecutor(max_workers=max(1, download_workers)) as downloads, \
+            ProcessPoolExecutor(max_workers=workers) as hashing:
+        pending = {url: downloads.submit(_download, url) for url in missing}
+        futures = {}
+        for url, download in pending.items():
+            try:
+                futures[url] = hashing.submit(hash_image, download.result())
+            except Exception as error:
+                print(f"  ❌ Download failed: {url[:80]} ({error})")
+        for url, future in futures.items():
+            try:
+                hashes[url] = future.result()
+                cache.put(url, hashes[url])
+            except Exception as error:
+                print(f"  ❌ Hashing failed: {url[:80]} ({error})")
+    return hashes
+
+
+# ============================================
+# DUPLICATE / PLACEHOLDER DETECTION
+# ============================================
+def is_match(a: Tuple[int, int], b: Tuple[int, int], threshold: int = PHASH_THRESHOLD) -> bool:
+    return hamming(a[0], b[0]) <= threshold and hamming(a[1], b[1]) <= DHASH_THRESHOLD
+
+
+def find_image_matches(products: List[Dict], hashes: Dict[str, Tuple[int, int]],
+                       placeholders: Dict[str, Tuple[int, int]], threshold: int = PHASH_THRESHOLD) -> Dict:
+    """
+    Group products whose images look the same and flag placeholder images
+
+    Args:
+        products: Products with 'id' and 'image_url'
+        hashes: url -> (phash, dhash) for the product images
+        placeholders: url -> (phash, dhash) for known placeholder images
+        threshold: Maximum pHash Hamming distance
+
+    Returns:
+        {'duplicates': [[product ids sharing an image], ...],
+         'placeholders': [product ids whose image matches a placeholder]}
+    """
+    placeholder_tree = BKTree()
+    for url, value in placeholders.items():
+        placeholder_tree.add(value[0], value)
+
+    tree = BKTree()
+    hashed = [(p['id'], hashes[p['image_url']]) for p in products if p.get('image_url') in hashes]
+    for index, (_, value) in enumerate(hashed):
+        tree.add(value[0], index)
+
+    # Union-find over matching pairs
+    parent = list(range(len(hashed)))
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    flagged_placeholders = []
+    for index, (product_id, value) in enumerate(hashed):
+        if any(is_match(value, match, threshold) for _, match in placeholder_tree.search(value[0], threshold)):
+            flagged_placeholders.append(product_id)
+            continue
+        for _, other in tree.search(value[0], threshold):
+            if other != index and is_match(value, hashed[other][1], threshold):
+                parent[root(other)] = root(index)
+
+    placeholder_ids = set(flagged_placeholders)
+    groups: Dict[int, List[str]] = {}
+    for index, (product_id, _) in enumerate(hashed):
+        if product_id not in placeholder_ids:
+            groups.setdefault(root(index), []).append(product_id)
+
+    return {
+        'duplicates': [ids for ids in groups.values() if len(ids) > 1],
+        'placeholders': flagged_placeholders,
+    }
+
+
+def scan_products(products: List[Dict], threshold: int = PHASH_THRESHOLD, workers: Optional[int] = None) -> Dict:
+    """
+    Hash the images of `products` and the known placeholders, then find matches
+    (see find_image_matches)
+    """
+    cache = HashCache()
+    try:
+        hashes = hash_urls([p.get('image_url') for p in products] + list(KNOWN_PLACEHOLDERS), cache, workers)
+    finally:
+        cache.close()
+    placeholders = {url: hashes[url] for url in KNOWN_PLACEHOLDERS if url in hashes}
+    return find_image_matches(products, hashes, placeholders, threshold)
+
+
+if __name__ == '__main__':
+    from catalog_store import open_catalog
+
+    parser = argparse.ArgumentParser(description='Find duplicate and placeholder images in products.json')
+    parser.add_argument('--threshold', type=int, default=PHASH_THRESHOLD,
+                        help='Maximum pHash Hamming distance (of 64 bits)')
+    parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: CPU count)')
+    args = parser.parse_args()
+
+    store = open_catalog()
+    catalog = store.export_products()
+    store.close()
+    by_id = {p['id']: p for p in catalog}
+
+    report = scan_products(catalog, args.threshold, args.workers)
+    print(f"\nPlaceholder images: {len(report['placeholders'])}")
+    for product_id in report['placeholders']:
+        print(f"  {product_id}: {(by_id[product_id].get('title') or '')[:60]}")
+    print(f"\nProducts sharing an image: {len(report['duplicates'])} groups")
+    for ids in report['duplicates']:
+        print(f"  {', '.join(ids)}")
+        print(f"    {by_id[ids[0]].get('image_url')}")
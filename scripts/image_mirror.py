@@ -0,0 +1,264 @@
+"""
+Image Mirror
+Downloads product images once and serves resized copies from the site itself.
+
+Product cards used to hotlink the full-size _SL1500_ Amazon image even where
+it renders at card size. This stage:
+
+- Downloads each product's image_url once into a content-addressed store
+  (scripts/.cache/images/<sha256>), so identical images are stored once
+- Encodes WebP and AVIF variants at several widths in a process pool into
+  public/images/products/ (named after the content hash)
+- Writes src/data/imageManifest.json mapping each product id to its variants
+  and a tiny inline LQIP (blurred low-quality placeholder)
+
+Runs are incremental: a product whose image_url is unchanged and whose variants
+exist is skipped, and an image already encoded for another product is reused.
+
+Requires Pillow (AVIF needs a Pillow build with AVIF support; without it only
+WebP variants are written).
+
+Usage:
+    python image_mirror.py
+    python image_mirror.py --workers 4 --force
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import http_client
+from catalog_store import DATA_DIR, open_catalog
+from job_journal import atomic_write_json
+from product_parser import PLACEHOLDER_IMAGE
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ORIGINALS_DIR = os.path.join(SCRIPTS_DIR, '.cache', 'images')
+PUBLIC_DIR = os.path.join(SCRIPTS_DIR, '..', 'public')
+VARIANTS_DIR = os.path.join(PUBLIC_DIR, 'images', 'products')
+MANIFEST_FILE = os.path.join(DATA_DIR, 'imageManifest.json')
+
+# Name under which the catalog store tracks which products were mirrored
+MIRROR_CONSUMER = 'image_mirror'
+
+# Variant widths in px (never upscaled beyond the original)
+WIDTHS = (320, 640, 960)
+QUALITY = {'webp': 78, 'avif': 55}
+
+# LQIP: tiny blurred WebP inlined as a data URI
+LQIP_WIDTH = 16
+
+
+def available_formats() -> Tuple[str, ...]:
+    """
+    Variant formats this Pillow build can encode (AVIF is optional)
+    """
+    from PIL import features
+    formats = ['webp']
+    if features.check('avif'):
+        formats.append('avif')
+    return tuple(formats)
+
+
+def original_path(content_hash: str) -> str:
+    return os.path.join(ORIGINALS_DIR, content_hash[:2], content_hash)
+
+
+def variant_name(content_hash: str, width: int, fmt: str) -> str:
+    return f'{content_hash[:16]}-{width}.{fmt}'
+
+
+def public_src(name: str) -> str:
+    return '/images/products/' + name
+
+
+# ============================================
+# DOWNLOAD (threads)
+# ============================================
+def download_original(url: str) -> str:
+    """
+    Download an image into the content-addressed store
+
+    Returns:
+        sha256 of the image bytes
+    """
+    response = http_client.get(url)
+    response.raise_for_status()
+    body = response.content
+    content_hash = hashlib.sha256(body).hexdigest()
+    path = original_path(content_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    return content_hash
+
+
+# ============================================
+# ENCODING (process pool)
+# ============================================
+def encode_variants(content_hash: str, formats: Tuple[str, ...], widths: Tuple[int, ...] = WIDTHS,
+                    out_dir: str = VARIANTS_DIR) -> Dict:
+    """
+    Encode the resized variants and LQIP of one stored original
+
+    Runs in a worker process. Variants that already exist are not re-encoded.
+
+    Returns:
+        Manifest fields: hash, width, height, lqip, variants {format: [{width, src}]}
+    """
+    from PIL import Image, ImageFilter
+
+    os.makedirs(out_dir, exist_ok=True)
+    with Image.open(original_path(content_hash)) as source:
+        source.load()
+        image = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+    width, height = image.size
+
+    targets = sorted({w for w in widths if w < width} | {min(width, max(widths))})
+    variants: Dict[str, List[Dict]] = {fmt: [] for fmt in formats}
+    for target in targets:
+        resized = None
+        for fmt in formats:
+            name = variant_name(content_hash, target, fmt)
+            path = os.path.join(out_dir, name)
+            if not os.path.exists(path):
+                if resized is None:
+                    resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                resized.save(tmp_path, format=fmt.upper(), quality=QUALITY[fmt])
+                os.replace(tmp_path, path)
+            variants[fmt].append({'width': target, 'src': public_src(name)})
+
+    tiny = image.resize((LQIP_WIDTH, max(1, round(height * LQIP_WIDTH / width))), Image.BILINEAR)
+    buffer = io.BytesIO()
+    tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, format='WEBP', quality=30)
+    lqip = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    return {'hash': content_hash, 'width': width, 'height': height, 'lqip': lqip, 'variants': variants}
+
+
+# ============================================
+# MANIFEST
+# ============================================
+def load_manifest(path: Optional[str] = None) -> Dict[str, Dict]:
+    try:
+        with open(path or MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def is_current(entry: Optional[Dict], image_url: str, formats: Tuple[str, ...], out_dir: str = VARIANTS_DIR) -> bool:
+    """
+    True if a manifest entry was built from image_url and all its variant files exist
+    """
+    if not entry or entry.get('source') != image_url:
+        return False
+    if any(fmt not in entry.get('variants', {}) for fmt in formats):
+        return False
+    return all(os.path.exists(os.path.join(out_dir, os.path.basename(v['src'])))
+               for variants in entry['variants'].values() for v in variants)
+
+
+def mirror_images(workers: Optional[int] = None, download_workers: int = 8, force: bool = False) -> Dict[str, Dict]:
+    """
+    Mirror every product image in products.json and rewrite the manifest
+
+    Args:
+        workers: Encoder processes (default: CPU count)
+        download_workers: Concurrent downloads
+        force: Rebuild every entry even if it is current
+
+    Returns:
+        The new manifest (product id -> entry)
+    """
+    formats = available_formats()
+    store = open_catalog()
+    products = [p for p in store.iter_products()
+                if (p.get('image_url') or '').startswith('http') and p['image_url'] != PLACEHOLDER_IMAGE]
+    changed = set(store.changes(MIRROR_CONSUMER)['changed'])
+    store.close()
+
+    old_manifest = load_manifest()
+    manifest: Dict[str, Dict] = {}
+    todo = []
+    for product in products:
+        entry = old_manifest.get(product['id'])
+        # Products unchanged since the last run keep their entry without
+        # checking the variant files (use --force after deleting files by hand)
+        unchanged = (product['id'] not in changed and entry and entry.get('source') == product['image_url']
+                     and all(fmt in entry.get('variants', {}) for fmt in formats))
+        if not force and (unchanged or is_current(entry, product['image_url'], formats)):
+            manifest[product['id']] = entry
+        else:
+            todo.append(product)
+
+    print(f"Image mirror: {len(products)} products with images, {len(todo)} new or changed")
+    print(f"Formats: {', '.join(formats)}; widths: {', '.join(map(str, WIDTHS))}")
+
+    # Download each distinct URL once
+    urls = list(dict.fromkeys(p['image_url'] for p in todo))
+
+    def download(url: str):
+        try:
+            return url, download_original(url), None
+        except Exception as error:
+            return url, None, error
+
+    hashes: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, download_workers)) as pool:
+        for url, content_hash, error in pool.map(download, urls):
+            if error:
+                print(f"  ❌ Download failed: {url[:80]} ({error})")
+            else:
+                hashes[url] = content_hash
+
+    # Encode each distinct image once
+    encoded: Dict[str, Dict] = {}
+    distinct = list(dict.fromkeys(hashes.values()))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {h: pool.submit(encode_variants, h, formats) for h in distinct}
+        for content_hash, future in futures.items():
+            try:
+                encoded[content_hash] = future.result()
+            except Exception as error:
+                print(f"  ❌ Encoding failed: {content_hash[:16]} ({error})")
+
+    for product in todo:
+        content_hash = hashes.get(product['image_url'])
+        if content_hash in encoded:
+            manifest[product['id']] = {'source': product['image_url'], **encoded[content_hash]}
+        elif product['id'] in old_manifest:
+            # Keep the previous variants if the new image could not be mirrored
+            manifest[product['id']] = old_manifest[product['id']]
+
+    # Same order as products.json so diffs stay small
+    order = {p['id']: i for i, p in enumerate(products)}
+    manifest = dict(sorted(manifest.items(), key=lambda item: order.get(item[0], len(order))))
+    atomic_write_json(MANIFEST_FILE, manifest)
+
+    # Products whose entry is now current don't need another look next time
+    store = open_catalog()
+    store.mark_consumed(MIRROR_CONSUMER, [p['id'] for p in products
+                                          if manifest.get(p['id'], {}).get('source') == p['image_url']])
+    store.close()
+
+    print(f"✅ Mirrored {len(encoded)} images, manifest has {len(manifest)} products")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mirror product images as resized WebP/AVIF variants')
+    parser.add_argument('--workers', type=int, default=None, help='Encoder processes (default: CPU count)')
+    parser.add_argument('--download-workers', type=int, default=8, help='Concurrent downloads')
+    parser.add_argument('--force', action='store_true', help='Rebuild every image')
+    args = parser.parse_args()
+    mirror_images(workers=args.workers, download_workers=args.download_workers, force=args.force)
@@ -0,0 +1,523 @@
+"""
+Image Refresh
+One command to fill in and refresh product images across the catalog.
+
+Replaces the two near-identical scripts update_product_images.py and
+update_all_product_images.py (now thin wrappers around this module), which
+walked all of products.json and slept 2 seconds after every product.
+
+- Covers products.json, subcategoryProducts.json and trendingProducts.json in
+  one pass; a product link that appears in several files is fetched once and
+  its new image is written to every entry
+- Keeps a persistent worklist (scripts/.cache/image_worklist.sqlite) of links
+  whose image is missing, a placeholder, a thumbnail, or expired (not verified
+  for IMAGE_MAX_AGE_DAYS and now failing verification). Interrupted runs pick up
+  where they stopped; links that keep failing are retried with backoff.
+- Fetches only the worklist, concurrently, with per-host rate limits
+
+A run where nothing needs changing only reads the JSON files and finishes in
+seconds.
+
+Usage:
+    python image_refresh.py
+    python image_refresh.py --sources products --concurrency 8
+    python image_refresh.py --dry-run     # show the worklist without fetching
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import image_verifier
+import link_resolver
+import page_cache
+import telemetry
+from catalog_store import DATA_DIR, PRODUCTS_FILE, ends_with_newline, open_catalog
+from job_journal import atomic_write_json
+from product_parser import PLACEHOLDER_IMAGE, parse_product_page
+from rate_limit import AIMDController, HostRateLimiter
+
+WORKLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'image_worklist.sqlite')
+TRENDING_FILE = 'trendingProducts.json'
+
+SOURCES = ('products', 'subcategory', 'trending')
+
+# Page cache key for find_image_in_page results
+EXTRACT_KIND = 'product_image'
+
+# Images that mean "no image yet"
+PLACEHOLDER_IMAGES = ('default.png',)
+PLACEHOLDER_MARKERS = ('51nBTTG3hNL',)
+
+# Images not verified for this long are checked again
+IMAGE_MAX_AGE_DAYS = 30
+
+# Failed links wait RETRY_BASE_SECONDS * 2^(attempts - 1) before the next try
+RETRY_BASE_SECONDS = 3600
+RETRY_MAX_SECONDS = 7 * 24 * 3600
+
+
+# ============================================
+# PAGE PARSING
+# ============================================
+def find_image_in_page(content):
+    """
+    Find the main product image in a product page's HTML, with the same
+    selectors and parser as the scraper (product_parser.py)
+    Returns the image URL or None if not found
+    """
+    image_url = parse_product_page(content)['image_url']
+    return None if image_url == PLACEHOLDER_IMAGE else image_url
+
+
+def extract_image_from_amazon(url):
+    """
+    Extract the main product image from an Amazon product page
+
+    Returns:
+        (image_url, error): image_url is None if no acceptable image was found
+    """
+    try:
+        # Go straight to the canonical product page when the short link is cached.
+        # Parsing is skipped when the page body is unchanged since the last run.
+        cache = page_cache.get_cache()
+        page = cache.fetch(link_resolver.canonical_url(url))
+        cached = cache.get_extract(page, EXTRACT_KIND)
+        if cached is not None:
+            image_url = cached['image_url']
+        else:
+            with telemetry.span('parse'):
+                image_url = find_image_in_page(page.body)
+            cache.put_extract(page, EXTRACT_KIND, {'image_url': image_url})
+
+        if not image_url:
+            return None, 'no image on page'
+        # Don't write broken images or thumbnails into the catalog
+        with telemetry.span('validate'):
+            verdict = image_verifier.verify_image_url(image_url)
+        if not verdict['ok'] and verdict['reason'] != 'unreachable':
+            telemetry.count('images_rejected', reason=verdict['reason'])
+            return None, f"rejected image ({verdict['reason']}): {image_url}"
+        return image_url, None
+
+    except Exception as error:
+        return None, str(error)
+
+
+# ============================================
+# CATALOG ENTRIES
+# ============================================
+def image_problem(image: Optional[str]) -> Optional[str]:
+    """
+    Why an image needs replacing ('missing', 'placeholder', 'thumbnail'), or
+    None if it looks fine without a network check
+    """
+    if not image or not image.strip():
+        return 'missing'
+    if image in PLACEHOLDER_IMAGES or any(marker in image for marker in PLACEHOLDER_MARKERS):
+        return 'placeholder'
+    if image_verifier.THUMBNAIL_PATTERN.search(image):
+        return 'thumbnail'
+    return None
+
+
+def entry_image(product: Dict) -> Optional[str]:
+    """
+    Image a subcategory/trending entry displays (same order as productImage.ts)
+    """
+    return product.get('image') or product.get('amazonImageUrl')
+
+
+def load_trending(data_dir: str = DATA_DIR) -> List[Dict]:
+    with open(os.path.join(data_dir, TRENDING_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_trending(products: List[Dict], data_dir: str = DATA_DIR) -> None:
+    path = os.path.join(data_dir, TRENDING_FILE)
+    atomic_write_json(path, products, trailing_newline=ends_with_newline(path))
+
+
+def collect_entries(store, trending: Optional[List[Dict]], sources: Iterable[str]) -> List[Dict]:
+    """
+    Every catalog entry with a link, as {source, ref, link, image}
+
+    `ref` identifies the entry within its source: the product id for
+    products.json, the subcategory entry for subcategoryProducts.json and the
+    list index for trendingProducts.json.
+    """
+    entries = []
+    if 'products' in sources:
+        for product in store.iter_products():
+            if product.get('product_link'):
+                entries.append({'source': 'products', 'ref': product['id'],
+                                'link': product['product_link'], 'image': product.get('image_url')})
+    if 'subcategory' in sources:
+        for category_id in store.export_subcategory_products():
+            for entry in store.subcategory_products(category_id):
+                if entry['product'].get('link'):
+                    entries.append({'source': 'subcategory', 'ref': entry,
+                                    'link': entry['product']['link'], 'image': entry_image(entry['product'])})
+    if 'trending' in sources and trending is not None:
+        for index, product in enumerate(trending):
+            if product.get('link'):
+                entries.append({'source': 'trending', 'ref': index,
+                                'link': product['link'], 'image': entry_image(product)})
+    return entries
+
+
+def apply_image(store, trending: Optional[List[Dict]], entry: Dict, image_url: str) -> bool:
+    """
+    Write a new image into one catalog entry
+
+    Returns:
+        True if the entry changed
+    """
+    if entry['source'] == 'products':
+        product = store.get_product(entry['ref'])
+        if product is None or product.get('image_url') == image_url:
+            return False
+        return store.update_product_fields(entry['ref'], image_url=image_url)
+
+    if entry['source'] == 'subcategory':
+        ref = entry['ref']
+        product = ref['product']
+    else:
+        product = trending[entry['ref']]
+    # Entries carry the image twice (image / amazonImageUrl); keep them in step
+    changes = {key: image_url for key in ('image', 'amazonImageUrl') if key in product} or {'image': image_url}
+    if all(product.get(key) == value for key, value in changes.items()):
+        return False
+    product.update(changes)
+    if entry['source'] == 'subcategory':
+        store.upsert_subcategory_product(ref['category_id'], ref['subcategory'], ref['price_range'], product)
+    return True
+
+
+# ============================================
+# WORKLIST
+# ============================================
+class Worklist:
+    """
+    Persistent set of product links whose image must be (re)fetched, plus the
+    time each link's image was last confirmed good
+    """
+
+    def __init__(self, path: str = WORKLIST_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS items (
+                link TEXT PRIMARY KEY,
+                reason TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                last_error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS checked (
+                link TEXT PRIMARY KEY,
+                image_url TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    def add(self, link: str, reason: str) -> None:
+        self.conn.execute('INSERT OR IGNORE INTO items (link, reason, added_at) VALUES (?, ?, ?)',
+                          (link, reason, time.time()))
+        self.conn.execute('UPDATE items SET reason = ? WHERE link = ?', (reason, link))
+
+    def discard(self, link: str) -> None:
+        self.conn.execute('DELETE FROM items WHERE link = ?', (link,))
+
+    def due(self, now: Optional[float] = None, retry_failed: bool = False) -> List[Tuple[str, str]]:
+        """
+        (link, reason) of items ready to be fetched
+        """
+        if retry_failed:
+            rows = self.conn.execute('SELECT link, reason FROM items ORDER BY added_at')
+        else:
+            rows = self.conn.execute('SELECT link, reason FROM items WHERE next_attempt_at <= ? ORDER BY added_at',
+                                     (now or time.time(),))
+        return rows.fetchall()
+
+    def waiting(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM items WHERE next_attempt_at > ?',
+                                 (time.time(),)).fetchone()[0]
+
+    def done(self, link: str, image_url: str) -> None:
+        self.discard(link)
+        self.mark_checked(link, image_url)
+
+    def failed(self, link: str, error: str) -> None:
+        attempts = (self.conn.execute('SELECT attempts FROM items WHERE link = ?', (link,)).fetchone() or (0,))[0] + 1
+        delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+        self.conn.execute('UPDATE items SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE link = ?',
+                          (attempts, time.time() + delay, error, link))
+        self.conn.commit()
+
+    def mark_checked(self, link: str, image_url: str) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO checked (link, image_url, checked_at) VALUES (?, ?, ?)',
+                          (link, image_url, time.time()))
+        self.conn.commit()
+
+    def is_fresh(self, link: str, image_url: str, max_age_seconds: float) -> bool:
+        row = self.conn.execute('SELECT image_url, checked_at FROM checked WHERE link = ?', (link,)).fetchone()
+        return bool(row) and row[0] == image_url and time.time() - row[1] <= max_age_seconds
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def build_worklist(worklist: Worklist, entries: List[Dict], max_age_days: float, verify_workers: int = 16) -> None:
+    """
+    Bring the worklist in line with the catalog entries
+
+    Missing, placeholder and thumbnail images are found from the JSON alone.
+    Images not verified within max_age_days are re-verified (range requests,
+    see image_verifier.py) and queued only if they now fail. Links whose
+    images are all good again (e.g. fixed by hand) are dropped.
+    """
+    max_age = max_age_days * 24 * 3600
+    problems: Dict[str, str] = {}
+    expired: Dict[str, List[str]] = {}
+    for entry in entries:
+        problem = image_problem(entry['image'])
+        if problem:
+            problems.setdefault(entry['link'], problem)
+        elif not worklist.is_fresh(entry['link'], entry['image'], max_age):
+            expired.setdefault(entry['image'], []).append(entry['link'])
+
+    if expired:
+        print(f"Re-verifying {len(expired)} images not checked in the last {max_age_days:g} days...")
+        with telemetry.span('validate'):
+            verdicts = image_verifier.verify_image_urls(expired, max_workers=verify_workers)
+        unverified = set()
+        for image_url, links in expired.items():
+            verdict = verdicts[image_url]
+            for link in links:
+                if verdict['ok']:
+                    worklist.mark_checked(link, image_url)
+                elif verdict['reason'] == 'unreachable':
+                    unverified.add(link)
+                else:
+                    problems.setdefault(link, f"expired ({verdict['reason']})")
+    else:
+        unverified = set()
+
+    for link in {entry['link'] for entry in entries}:
+        if link in problems:
+            worklist.add(link, problems[link])
+        elif link not in unverified:
+            worklist.discard(link)
+    worklist.commit()
+
+
+def perceptual_placeholder_links(products_file: str = PRODUCTS_FILE) -> List[Tuple[str, str]]:
+    """
+    (link, reason) for products whose image looks like a known placeholder
+    (perceptual hash match, see image_hashes.py), to pass as extra_links
+    """
+    import image_hashes
+
+    store = open_catalog(products_file=products_file)
+    products = store.export_products()
+    store.close()
+    by_id = {p['id']: p for p in products}
+    report = image_hashes.scan_products(products)
+    return [(by_id[i]['product_link'], 'placeholder (perceptual)')
+            for i in report['placeholders'] if by_id[i].get('product_link')]
+
+
+# ============================================
+# FETCHING
+# ============================================
+async def fetch_images_async(links: List[str], max_concurrency: int = 4, requests_per_second: Optional[float] = 0.5,
+                             burst: int = 1, adaptive: bool = True) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    Fetch the main image for each link concurrently with per-host rate limits
+
+    Links that lead to the same ASIN are fetched once and share the result.
+    With `adaptive`, the concurrency and rate are starting points adapted to
+    throttling signals (see AIMDController).
+
+    Returns:
+        Mapping of link -> (image_url, error)
+    """
+    if adaptive:
+        controller = AIMDController(requests_per_second, max_concurrency, burst)
+        semaphore = limiter = controller
+    else:
+        controller = None
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        limiter = HostRateLimiter(requests_per_second, burst) if requests_per_second else None
+    results: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    with controller.observing() if controller else nullcontext():
+        await link_resolver.resolve_links_async(links, max_concurrency, limiter)
+    groups = list(link_resolver.group_by_product(links).values())
+    deduped = sum(len(group) - 1 for group in groups)
+    if deduped:
+        telemetry.count('fetches_deduped', deduped)
+        print(f"Deduplicated: {sum(map(len, groups))} links point at {len(groups)} products, "
+              f"{deduped} fetches saved")
+
+    async def fetch(index: int, group: List[str]) -> None:
+        link = group[0]
+        async with semaphore:
+            if limiter:
+                await limiter.acquire(link)
+            result = await asyncio.to_thread(extract_image_from_amazon, link)
+        for member in group:
+            results[member] = result
+        image_url, error = result
+        shared = f" (+{len(group) - 1} links)" if len(group) > 1 else ''
+        if image_url:
+            print(f"[{index}/{len(groups)}] ✅ {link}{shared} -> {image_url[:80]}")
+        else:
+            print(f"[{index}/{len(groups)}] ❌ {link}{shared}: {error}")
+
+    with controller.observing() if controller else nullcontext():
+        await asyncio.gather(*(fetch(i, group) for i, group in enumerate(groups, 1)))
+    if controller:
+        controller.log_state()
+    return results
+
+
+def refresh_images(
+    sources: Iterable[str] = SOURCES,
+    max_concurrency: int = 4,
+    delay_between_requests: float = 2.0,
+    adaptive: bool = True,
+    max_age_days: float = IMAGE_MAX_AGE_DAYS,
+    extra_links: Iterable[Tuple[str, str]] = (),
+    retry_failed: bool = False,
+    dry_run: bool = False,
+    products_file: str = PRODUCTS_FILE,
+) -> Dict:
+    """
+    Refresh images in the selected catalog files
+
+    Args:
+        sources: Any of 'products', 'subcategory', 'trending'
+        max_concurrency: Maximum number of page requests in flight
+        delay_between_requests: Minimum delay in seconds between requests to a host
+        adaptive: Use both only as starting points and adapt them to throttling
+            signals (429/503, robot-check pages, slow responses)
+        max_age_days: Re-verify images not checked for this long
+        extra_links: Additional (link, reason) pairs to queue
+        retry_failed: Ignore the backoff of links that failed before
+        dry_run: Only build and print the worklist
+        products_file: File under src/data used as the 'products' source
+
+    Returns:
+        Summary dict (queued, fetched, deduped, updated, failed, waiting, entries_changed)
+    """
+    sources = tuple(sources)
+    store = open_catalog(products_file=products_file)
+    trending = load_trending() if 'trending' in sources else None
+    worklist = Worklist()
+    summary = {'queued': 0, 'fetched': 0, 'deduped': 0, 'updated': 0, 'failed': 0, 'waiting': 0,
+               'entries_changed': 0}
+
+    try:
+        entries = collect_entries(store, trending, sources)
+        build_worklist(worklist, entries, max_age_days)
+        for link, reason in extra_links:
+            worklist.add(link, reason)
+        worklist.commit()
+
+        # Only links that still appear in the selected files are fetched
+        present = {entry['link'] for entry in entries}
+        due = [(link, reason) for link, reason in worklist.due(retry_failed=retry_failed) if link in present]
+        summary['queued'] = len(due)
+        summary['waiting'] = worklist.waiting()
+
+        print(f"Image refresh: {len(entries)} entries, {len(present)} distinct links, {len(due)} to fetch"
+              + (f", {summary['waiting']} waiting to retry" if summary['waiting'] else ''))
+        for link, reason in due:
+            print(f"  {reason}: {link}")
+        if dry_run or not due:
+            return summary
+
+        requests_per_second = 1.0 / delay_between_requests if delay_between_requests > 0 else None
+        results = asyncio.run(fetch_images_async([link for link, _ in due], max_concurrency, requests_per_second,
+                                                adaptive=adaptive))
+        summary['fetched'] = len(link_resolver.group_by_product(results))
+        summary['deduped'] = len(results) - summary['fetched']
+
+        changed_sources = set()
+        by_link: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            by_link.setdefault(entry['link'], []).append(entry)
+        with telemetry.span('extract'):
+            for link, (image_url, error) in results.items():
+                if not image_url:
+                    # The entry keeps its placeholder until a later retry succeeds
+                    worklist.failed(link, error or 'unknown error')
+                    telemetry.count('placeholder_fallbacks', reason='image_not_found')
+                    summary['failed'] += 1
+                    continue
+                for entry in by_link.get(link, []):
+                    if apply_image(store, trending, entry, image_url):
+                        changed_sources.add(entry['source'])
+                        summary['entries_changed'] += 1
+                worklist.done(link, image_url)
+                summary['updated'] += 1
+            worklist.commit()
+
+        # Write back only the files that changed (temp file + rename)
+        if changed_sources & {'products', 'subcategory'}:
+            store.export(products='products' in changed_sources,
+                         subcategory_products='subcategory' in changed_sources)
+        if 'trending' in changed_sources:
+            save_trending(trending)
+
+        print("=" * 60)
+        print("✅ Image refresh complete!")
+        print(f"   Fetched: {summary['fetched']} pages ({summary['deduped']} links shared a fetch)")
+        print(f"   Updated: {summary['updated']} links ({summary['entries_changed']} entries)")
+        print(f"   Failed: {summary['failed']} (retried later with backoff)")
+        print("=" * 60)
+        return summary
+    finally:
+        worklist.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill in missing, placeholder, thumbnail or expired product images')
+    parser.add_argument('--sources', nargs='+', choices=SOURCES, default=list(SOURCES),
+                        help='Catalog files to cover (default: all)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum page requests in flight')
+    parser.add_argument('--delay', type=float, default=2.0,
+                        help='Seconds between requests to a host (starting pace unless --fixed-rate)')
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help="Keep --concurrency and --delay fixed instead of adapting to throttling")
+    parser.add_argument('--max-age-days', type=float, default=IMAGE_MAX_AGE_DAYS,
+                        help='Re-verify images not checked for this long')
+    parser.add_argument('--perceptual', action='store_true',
+                        help='Also queue products.json images that look like a placeholder (perceptual hash)')
+    parser.add_argument('--retry-failed', action='store_true', help='Retry failed links now, ignoring backoff')
+    parser.add_argument('--dry-run', action='store_true', help='Show the worklist without fetching')
+    telemetry.add_arguments(parser)
+    args = parser.parse_args()
+
+    telemetry.start_run('image_refresh', args.metrics_file, args.prometheus_file)
+    try:
+        extra = perceptual_placeholder_links() if args.perceptual else []
+
+        refresh_images(sources=args.sources, max_concurrency=args.concurrency, delay_between_requests=args.delay,
+                       adaptive=not args.fixed_rate, max_age_days=args.max_age_days, extra_links=extra, retry_failed=args.retry_failed,
+                       dry_run=args.dry_run)
+    finally:
+        telemetry.finish_run()
@@ -0,0 +1,333 @@
+"""
+Image URL Verifier
+Checks product image URLs over the network before they reach the catalog.
+
+is_valid_image_url only looks at the URL string, so dead m.media-amazon.com
+links and tiny thumbnails (_AC_SS115_ etc., which src/lib/productImage.ts has
+to filter out in the browser) used to end up in products.json. This module:
+
+- Requests the first bytes of every image concurrently (Range GET, so only a
+  few KB are transferred) and reads content type, byte size and pixel
+  dimensions from the file header (JPEG, PNG, GIF, WebP, BMP)
+- Rejects broken, non-image, placeholder, thumbnail and undersized images
+- Caches verdicts in scripts/.cache/image_verdicts.sqlite with a TTL
+
+Usage:
+    python image_verifier.py          # report rejected images in the catalog
+    python image_verifier.py --fix    # also clear them so the image updaters refetch them
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import http_client
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'image_verdicts.sqlite')
+
+# Good verdicts are trusted for a week, failures are re-checked after a day
+OK_TTL_SECONDS = 7 * 24 * 3600
+FAILED_TTL_SECONDS = 24 * 3600
+
+# Bytes requested per image; enough for the header of every supported format
+PROBE_BYTES = 64 * 1024
+
+# Smallest acceptable product image. Judged by the longest side: the parser
+# keeps renditions like _SX342_ (342 px wide, any height) that the frontend
+# upgrades to _SL1500_ (src/lib/productImage.ts), so a landscape 342x200 is fine.
+MIN_LONGEST_SIDE = 300
+MIN_BYTES = 2 * 1024
+
+# Same patterns as src/lib/productImage.ts
+THUMBNAIL_PATTERN = re.compile(r'_AC_(?:SS|US)\d+_')
+PLACEHOLDER_MARKERS = ('51nBTTG3hNL', 'default.png')
+
+
+# ============================================
+# IMAGE HEADER PARSING
+# ============================================
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def image_dimensions(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Read (format, width, height) from the first bytes of an image file
+
+    Returns:
+        None if the format is not recognised or the header is incomplete
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n') and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+    if data.startswith(b'\xff\xd8'):
+        size = _jpeg_size(data)
+        return ('jpeg',) + size if size else None
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return 'webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            width = int.from_bytes(data[24:27], 'little') + 1
+            height = int.from_bytes(data[27:30], 'little') + 1
+            return 'webp', width, height
+    if data[:2] == b'BM' and len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        return 'bmp', width, abs(height)
+    return None
+
+
+# ============================================
+# VERDICT CACHE
+# ============================================
+class VerdictCache:
+    """
+    SQLite cache of image verdicts (thread-safe)
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            ' url TEXT PRIMARY KEY, ok INTEGER NOT NULL, checked_at REAL NOT NULL, data TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT ok, checked_at, data FROM verdicts WHERE url = ?', (url,)).fetchone()
+        if not row:
+            return None
+        ttl = OK_TTL_SECONDS if row[0] else FAILED_TTL_SECONDS
+        if time.time() - row[1] > ttl:
+            return None
+        return json.loads(row[2])
+
+    def put(self, verdict: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO verdicts (url, ok, checked_at, data) VALUES (?, ?, ?, ?)',
+                (verdict['url'], int(verdict['ok']), verdict['checked_at'], json.dumps(verdict))
+            )
+            self._conn.commit()
+
+
+_default_cache: Optional[VerdictCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> VerdictCache:
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = VerdictCache()
+    return _default_cache
+
+
+# ============================================
+# PROBING
+# ============================================
+def _verdict(url: str, ok: bool, reason: str, **details) -> Dict:
+    verdict = {
+        'url': url,
+        'ok': ok,
+        'reason': reason,
+        'status': None,
+        'content_type': None,
+        'bytes': None,
+        'format': None,
+        'width': None,
+        'height': None,
+        'checked_at': time.time(),
+    }
+    verdict.update(details)
+    return verdict
+
+
+def _total_size(response, received: int) -> Optional[int]:
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    if response.status_code == 200 and response.headers.get('Content-Length', '').isdigit():
+        return int(response.headers['Content-Length'])
+    return received if received < PROBE_BYTES else None
+
+
+def probe_image(url: str) -> Dict:
+    """
+    Fetch the first PROBE_BYTES of an image and judge it (no cache)
+
+    Returns:
+        Verdict dict: url, ok, reason, status, content_type, bytes, format,
+        width, height, checked_at
+    """
+    if not url or not url.startswith('http'):
+        return _verdict(url, False, 'not-a-url')
+    if any(marker in url for marker in PLACEHOLDER_MARKERS):
+        return _verdict(url, False, 'placeholder')
+    if THUMBNAIL_PATTERN.search(url):
+        return _verdict(url, False, 'thumbnail')
+
+    try:
+        response = http_client.get(url, headers={'Range': f'bytes=0-{PROBE_BYTES - 1}'}, stream=True)
+        try:
+            status = response.status_code
+            content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+            data = b''
+            if status < 400:
+                for chunk in response.iter_content(16 * 1024):
+                    data += chunk
+                    if len(data) >= PROBE_BYTES:
+                        break
+        finally:
+            response.close()
+    except Exception as error:
+        return _verdict(url, False, 'unreachable', error=str(error))
+
+    details = {'status': status, 'content_type': content_type}
+    if status >= 400:
+        return _verdict(url, False, 'broken', **details)
+    if content_type and not content_type.startswith('image/'):
+        return _verdict(url, False, 'not-an-image', **details)
+
+    details['bytes'] = _total_size(response, len(data))
+    header = image_dimensions(data)
+    if header is None:
+        return _verdict(url, False, 'unreadable', **details)
+    details.update(format=header[0], width=header[1], height=header[2])
+
+    if max(header[1], header[2]) < MIN_LONGEST_SIDE:
+        return _verdict(url, False, 'too-small', **details)
+    if details['bytes'] is not None and details['bytes'] < MIN_BYTES:
+        return _verdict(url, False, 'too-small', **details)
+    return _verdict(url, True, 'ok', **details)
+
+
+def verify_image_url(url: str, cache: Optional[VerdictCache] = None) -> Dict:
+    """
+    Verdict for one image URL, from the cache when still fresh
+    """
+    cache = cache or get_cache()
+    verdict = cache.get(url)
+    if verdict is None:
+        verdict = probe_image(url)
+        # Network failures are not cached: they say nothing about the image
+        if verdict['reason'] != 'unreachable':
+            cache.put(verdict)
+    return verdict
+
+
+def verify_image_urls(urls: Iterable[str], max_workers: int = 16) -> Dict[str, Dict]:
+    """
+    Verify many image URLs concurrently
+
+    Returns:
+        Mapping of url -> verdict
+    """
+    unique = list(dict.fromkeys(u for u in urls if u))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        verdicts = list(pool.map(verify_image_url, unique))
+    return dict(zip(unique, verdicts))
+
+
+# ============================================
+# CATALOG CHECK
+# ============================================
+def verify_catalog(fix: bool = False, max_workers: int = 16) -> Dict[str, Dict]:
+    """
+    Verify every image in products.json and subcategoryProducts.json
+
+    Args:
+        fix: Clear rejected images (image_url / image / amazonImageUrl set to
+            '') so the frontend shows its fallback and the image updaters
+            pick the products up again
+        max_workers: Concurrent probes
+
+    Returns:
+        Mapping of url -> verdict for the rejected images (unreachable images
+        are reported as unchecked, never rejected)
+    """
+    from catalog_store import open_catalog
+
+    store = open_catalog()
+    products = store.export_products()
+    sub_entries = [e for category in store.export_subcategory_products()
+                   for e in store.subcategory_products(category)]
+
+    urls = [p.get('image_url') for p in products]
+    for entry in sub_entries:
+        urls.extend([entry['product'].get('image'), entry['product'].get('amazonImageUrl')])
+    urls = [u for u in urls if u]
+
+    print(f"Verifying {len(set(urls))} image URLs...")
+    verdicts = verify_image_urls(urls, max_workers)
+    # Unreachable images (timeout, DNS failure) say nothing about the image: report, never clear
+    rejected = {url: v for url, v in verdicts.items() if not v['ok'] and v['reason'] != 'unreachable'}
+    unchecked = [url for url, v in verdicts.items() if v['reason'] == 'unreachable']
+
+    for url, verdict in rejected.items():
+        size = f" {verdict['width']}x{verdict['height']}" if verdict.get('width') else ''
+        print(f"  ❌ {verdict['reason']}{size}: {url}")
+    for url in unchecked:
+        print(f"  ⚠️ unreachable, not checked: {url}")
+
+    if fix and rejected:
+        fixed = 0
+        for product in products:
+            if product.get('image_url') in rejected:
+                store.update_product_fields(product['id'], image_url='')
+                fixed += 1
+        for entry in sub_entries:
+            product = entry['product']
+            changes = {k: '' for k in ('image', 'amazonImageUrl') if product.get(k) in rejected}
+            if changes:
+                store.upsert_subcategory_product(entry['category_id'], entry['subcategory'],
+                                                 entry['price_range'], {**product, **changes})
+                fixed += 1
+        store.export()
+        print(f"  Cleared {fixed} rejected images")
+    store.close()
+
+    print(f"✅ {len(verdicts) - len(rejected) - len(unchecked)} ok, ❌ {len(rejected)} rejected, "
+          f"⚠️ {len(unchecked)} unchecked")
+    return rejected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify product image URLs in the catalog')
+    parser.add_argument('--fix', action='store_true', help='Clear rejected images in the JSON files')
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent probes')
+    args = parser.parse_args()
+    verify_catalog(fix=args.fix, max_workers=args.workers)
@@ -0,0 +1,179 @@
+"""
+Job Journal
+Checkpointing for long scrape jobs, plus crash-safe file writes.
+
+- JobJournal appends one JSON line per finished item and fsyncs it, so a job
+  killed at item 400 of 500 can be resumed with only the last 100 left to do
+- atomic_write_json writes to a temp file in the target directory and renames
+  it over the original, so a crash never leaves a half-written products.json;
+  a file whose content wouldn't change is left alone
+"""
+
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import telemetry
+
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'jobs')
+
+
+def atomic_write_json(path: str, data, indent: Optional[int] = 2, ensure_ascii: bool = False,
+                      trailing_newline: bool = False) -> bool:
+    """
+    Write JSON to `path` atomically (temp file + fsync + rename)
+
+    Args:
+        path: Destination file
+        data: JSON-serialisable data
+        indent: json.dump indent (None for compact output)
+        ensure_ascii: json.dump ensure_ascii
+        trailing_newline: End the file with a newline
+
+    Returns:
+        False if the file already had exactly this content (it is not touched)
+    """
+    with telemetry.span('write'):
+        content = json.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
+        if trailing_newline:
+            content += '\n'
+        encoded = content.encode('utf-8')
+        try:
+            with open(path, 'rb') as f:
+                unchanged = f.read() == encoded
+        except FileNotFoundError:
+            unchanged = False
+        if unchanged:
+            telemetry.count('files_unchanged')
+            return False
+        _atomic_write_bytes(path, encoded)
+        telemetry.count('files_written')
+        return True
+
+
+# Process umask (read once: os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_mode(path: str) -> int:
+    """
+    Permission bits a replacement for `path` should get: those of the
+    existing file, or what open(path, 'w') would give a new one
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file as 0600
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def journal_path(name: str) -> str:
+    """
+    Default journal file for a job name (scripts/.cache/jobs/<name>.jsonl)
+    """
+    return os.path.join(JOURNAL_DIR, f'{name}.jsonl')
+
+
+def discard_journal(path: str) -> None:
+    """
+    Delete a journal once its job's output has been written
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class JobJournal:
+    """
+    Append-only JSON lines checkpoint file (thread-safe)
+
+    Each line is {"key": ..., "data": ...}. When a key appears more than once
+    the last entry wins. A line cut short by a crash is ignored on load.
+
+    Args:
+        path: Journal file
+        resume: Keep entries from a previous run (otherwise start empty)
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = self._load() if resume else {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if not resume and os.path.exists(path):
+            os.remove(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # Terminate a line cut short by a crash so the next entry is intact
+            self._file.write('\n')
+            self._file.flush()
+
+    def _load(self) -> Dict[str, Dict]:
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entries[entry['key']] = entry['data']
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key)
+
+    def record(self, key: str, data: Dict) -> None:
+        """
+        Append a finished item and flush it to disk
+        """
+        line = json.dumps({'key': key, 'data': data}, ensure_ascii=False)
+        with self._lock:
+            self.entries[key] = data
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def finish(self) -> None:
+        """
+        Job completed: close and delete the journal
+        """
+        self.close()
+        discard_journal(self.path)
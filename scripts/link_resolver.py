@@ -0,0 +1,270 @@
+"""
+Amazon Short-Link Resolver
+Maps amzn.to short links to their ASIN and canonical product URL, and keeps the
+result in an on-disk SQLite cache with a TTL.
+
+Every product link in the catalog is an amzn.to short link, so each scrape used
+to pay an extra redirect round-trip before reaching the product page. With the
+cache, later runs go straight to https://www.amazon.in/dp/<ASIN>.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urlparse
+
+import http_client
+import telemetry
+
+# Default cache location (ignored by git)
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'links.sqlite')
+
+# Resolved links are trusted for 30 days
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# Hosts that only ever redirect to a product page
+SHORT_LINK_HOSTS = {'amzn.to', 'amzn.in', 'a.co'}
+
+# Store used when a redirect does not say which Amazon site it lands on
+DEFAULT_AMAZON_HOST = 'www.amazon.in'
+
+MAX_REDIRECTS = 5
+
+ASIN_PATTERN = re.compile(r'/(?:dp|gp/product|gp/aw/d|exec/obidos/ASIN|o/ASIN)/([A-Z0-9]{10})(?:[/?#]|$)')
+
+
+def extract_asin(url: str) -> Optional[str]:
+    """
+    Return the ASIN contained in an Amazon product URL, or None
+    """
+    if not url:
+        return None
+    match = ASIN_PATTERN.search(urlparse(url).path + '/')
+    return match.group(1) if match else None
+
+
+def build_canonical_url(asin: str, host: str = DEFAULT_AMAZON_HOST, scheme: str = 'https') -> str:
+    """
+    Canonical product page for an ASIN: https://<host>/dp/<ASIN>
+    (host may include a port)
+    """
+    return f"{scheme or 'https'}://{host or DEFAULT_AMAZON_HOST}/dp/{asin}"
+
+
+def _canonical_for(asin: str, url: str) -> str:
+    parsed = urlparse(url)
+    return build_canonical_url(asin, parsed.netloc, parsed.scheme)
+
+
+def is_short_link(url: str) -> bool:
+    return (urlparse(url).hostname or '').lower() in SHORT_LINK_HOSTS
+
+
+class LinkCache:
+    """
+    SQLite-backed cache of resolved short links (safe to share across threads)
+
+    Args:
+        path: SQLite file path
+        ttl_seconds: How long a resolved link stays valid
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS links ('
+            ' short_url TEXT PRIMARY KEY,'
+            ' asin TEXT,'
+            ' canonical_url TEXT NOT NULL,'
+            ' resolved_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS links_asin ON links (asin)')
+        self._conn.commit()
+
+    def get(self, short_url: str) -> Optional[Dict]:
+        """
+        Return the cached entry for a short link, or None if missing/expired
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT asin, canonical_url, resolved_at FROM links WHERE short_url = ?',
+                (short_url,)
+            ).fetchone()
+        if not row or time.time() - row[2] > self.ttl_seconds:
+            return None
+        return {'short_url': short_url, 'asin': row[0], 'canonical_url': row[1], 'resolved_at': row[2]}
+
+    def put(self, short_url: str, asin: Optional[str], canonical_url: str) -> Dict:
+        entry = {'short_url': short_url, 'asin': asin, 'canonical_url': canonical_url,
+                 'resolved_at': time.time()}
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO links (short_url, asin, canonical_url, resolved_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (short_url, asin, canonical_url, entry['resolved_at'])
+            )
+            self._conn.commit()
+        return entry
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[LinkCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> LinkCache:
+    """
+    Return the shared cache at DEFAULT_CACHE_PATH, opening it on first use
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = LinkCache()
+    return _default_cache
+
+
+def follow_redirects(url: str) -> str:
+    """
+    Follow a short link's redirect chain with HEAD requests, stopping as soon
+    as a Location contains an ASIN (the product page itself is not fetched)
+
+    Returns:
+        The last URL reached
+    """
+    current = url
+    for _ in range(MAX_REDIRECTS):
+        response = http_client.head(current, allow_redirects=False)
+        location = response.headers.get('Location')
+        if not response.is_redirect or not location:
+            break
+        current = urljoin(current, location)
+        if extract_asin(current):
+            break
+    return current
+
+
+def resolve_link(url: str, cache: Optional[LinkCache] = None) -> Dict:
+    """
+    Resolve a product link to its ASIN and canonical URL
+
+    Links that already contain an ASIN and non-short links are resolved
+    without any network request. Failed lookups are not cached.
+
+    Args:
+        url: Product link (usually https://amzn.to/...)
+        cache: Cache to use (defaults to the shared cache)
+
+    Returns:
+        Dictionary with short_url, asin (may be None) and canonical_url
+    """
+    asin = extract_asin(url)
+    if asin:
+        return {'short_url': url, 'asin': asin,
+                'canonical_url': _canonical_for(asin, url)}
+    if not is_short_link(url):
+        return {'short_url': url, 'asin': None, 'canonical_url': url}
+
+    cache = cache or get_cache()
+    cached = cache.get(url)
+    if cached:
+        telemetry.count('cache_hits', cache='link')
+        return cached
+    telemetry.count('cache_misses', cache='link')
+
+    try:
+        with telemetry.span('resolve'):
+            target = follow_redirects(url)
+    except Exception as error:
+        print(f"  ⚠️  Could not resolve {url}: {str(error)}")
+        return {'short_url': url, 'asin': None, 'canonical_url': url}
+
+    asin = extract_asin(target)
+    if asin:
+        return cache.put(url, asin, _canonical_for(asin, target))
+    if target != url:
+        return cache.put(url, None, target)
+    return {'short_url': url, 'asin': None, 'canonical_url': url}
+
+
+def known_asin(url: str, cache: Optional[LinkCache] = None) -> Optional[str]:
+    """
+    ASIN of a link from the URL itself or the cache, without any network
+    request (None for short links that were never resolved)
+    """
+    asin = extract_asin(url)
+    if asin or not url or not is_short_link(url):
+        return asin
+    entry = (cache or get_cache()).get(url)
+    return entry['asin'] if entry else None
+
+
+def canonical_url(url: str) -> str:
+    """
+    Return the URL to fetch for a product link: its canonical product page if
+    it can be resolved, otherwise the link itself
+    """
+    return resolve_link(url)['canonical_url']
+
+
+def resolve_links(urls: Iterable[str], max_workers: int = 8) -> Dict[str, Dict]:
+    """
+    Resolve many links concurrently (warms the cache before a scrape run)
+
+    Returns:
+        Mapping of link -> resolve_link() result
+    """
+    unique = list(dict.fromkeys(u for u in urls if u))
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(resolve_link, unique))
+    resolved = sum(1 for r in results if r.get('asin'))
+    print(f"🔗 Resolved {resolved}/{len(unique)} links to an ASIN")
+    return dict(zip(unique, results))
+
+
+async def resolve_links_async(urls: Iterable[str], max_concurrency: int = 4, limiter=None) -> None:
+    """
+    Resolve the short links that aren't cached yet, with at most
+    `max_concurrency` in flight and paced by `limiter` (a HostRateLimiter).
+    These are the redirect lookups the fetches would make anyway.
+    """
+    cache = get_cache()
+    pending = [u for u in dict.fromkeys(urls) if u and is_short_link(u) and cache.get(u) is None]
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def resolve(url: str) -> None:
+        async with semaphore:
+            if limiter:
+                await limiter.acquire(url)
+            await asyncio.to_thread(resolve_link, url, cache)
+
+    await asyncio.gather(*(resolve(url) for url in pending))
+
+
+def group_by_product(urls: Iterable[str], cache: Optional[LinkCache] = None) -> Dict[str, List[str]]:
+    """
+    Group links that point at the same product, so each product is fetched
+    once: the key is the ASIN, or the link itself when no ASIN is known
+    (no network requests; resolve short links first to catch more duplicates)
+
+    Returns:
+        Mapping of key -> distinct links, both in first-seen order
+    """
+    cache = cache or get_cache()
+    groups: Dict[str, List[str]] = {}
+    for url in dict.fromkeys(urls):
+        groups.setdefault(known_asin(url, cache) or url, []).append(url)
+    return groups
@@ -0,0 +1,282 @@
+"""
+Product Page Cache
+Content-addressed on-disk cache of fetched product pages, keyed by canonical URL.
+
+- Stores each page's ETag / Last-Modified and sends conditional requests
+  (If-None-Match / If-Modified-Since), so a 304 costs no body download
+- Page bodies are stored zlib-compressed under their SHA-256 hash
+- Extraction results are cached per (url, kind, body hash), so a page whose
+  body is unchanged since the last run is not parsed again
+- Size-based LRU eviction keeps the body store under max_bytes
+  (SCRAPER_PAGE_CACHE_MB, default 256 MB)
+- Robot-check, not-found and region-redirect pages (see page_check.py) raise
+  BlockedPage and never replace the cached copy
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import http_client
+import page_check
+import telemetry
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'pages')
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get('SCRAPER_PAGE_CACHE_MB', '256')) * 1024 * 1024)
+
+
+def _inflate(data: bytes) -> bytes:
+    # "deflate" is zlib-wrapped per the spec, but some servers send raw deflate
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+# Content-Encodings decoded here rather than inside requests, so network time
+# and decompression time can be measured separately
+_DECODERS = {
+    '': lambda data: data,
+    'identity': lambda data: data,
+    'gzip': lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS),
+    'x-gzip': lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS),
+    'deflate': _inflate,
+}
+
+
+@dataclass
+class CachedPage:
+    """
+    A fetched page
+
+    Attributes:
+        url: URL that was requested
+        status: HTTP status of the request (304 when served from cache)
+        body: Raw page bytes
+        body_hash: SHA-256 of the body
+        changed: False if the body is identical to the previous fetch
+    """
+    url: str
+    status: int
+    body: bytes
+    body_hash: str
+    changed: bool
+
+
+class PageCache:
+    """
+    Page cache rooted at `directory` (thread-safe)
+
+    Args:
+        directory: Cache directory (index.sqlite + bodies/)
+        max_bytes: Maximum size of the compressed body store
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, 'bodies'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            ' url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,'
+            ' body_hash TEXT NOT NULL, fetched_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS pages_body ON pages (body_hash);'
+            'CREATE TABLE IF NOT EXISTS bodies ('
+            ' body_hash TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed_at REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS bodies_lru ON bodies (accessed_at);'
+            'CREATE TABLE IF NOT EXISTS extracts ('
+            ' url TEXT NOT NULL, kind TEXT NOT NULL, body_hash TEXT NOT NULL, data TEXT NOT NULL,'
+            ' PRIMARY KEY (url, kind));'
+        )
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Body store
+    # ------------------------------------------------------------------
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.directory, 'bodies', body_hash[:2], body_hash)
+
+    def _read_body(self, body_hash: str) -> Optional[bytes]:
+        try:
+            with open(self._body_path(body_hash), 'rb') as f:
+                data = f.read()
+            with telemetry.span('decompress'):
+                return zlib.decompress(data)
+        except (OSError, zlib.error):
+            return None
+
+    def _write_body(self, body_hash: str, body: bytes) -> int:
+        path = self._body_path(body_hash)
+        if os.path.exists(path):
+            return os.path.getsize(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(body, 6)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used bodies (and the pages pointing at them)
+        until the store fits in max_bytes. Caller holds the lock.
+        """
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute('SELECT body_hash, size FROM bodies ORDER BY accessed_at').fetchall()
+        for body_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM bodies WHERE body_hash = ?', (body_hash,))
+            self._conn.execute('DELETE FROM pages WHERE body_hash = ?', (body_hash,))
+            try:
+                os.remove(self._body_path(body_hash))
+            except OSError:
+                pass
+            total -= size
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+    def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> CachedPage:
+        """
+        Fetch a page with a conditional request when a cached copy exists
+
+        Raises:
+            page_check.BlockedPage for robot-check, not-found (including 404)
+                and region-redirect pages, which are never stored
+            requests.HTTPError for other error responses (like raise_for_status)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, last_modified, body_hash FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        cached_body = self._read_body(row[2]) if row else None
+
+        request_headers = dict(headers or {})
+        if cached_body is not None:
+            if row[0]:
+                request_headers['If-None-Match'] = row[0]
+            if row[1]:
+                request_headers['If-Modified-Since'] = row[1]
+
+        with telemetry.span('fetch'):
+            response = http_client.get(url, headers=request_headers, stream=True)
+            try:
+                if response.status_code == 304 and cached_body is not None:
+                    raw = None
+                else:
+                    if response.status_code == 404:
+                        telemetry.count('pages_blocked', reason=page_check.NOT_FOUND)
+                        raise page_check.BlockedPage(url, page_check.NOT_FOUND)
+                    response.raise_for_status()
+                    encoding = response.headers.get('Content-Encoding', '').strip().lower()
+                    if encoding in _DECODERS:
+                        raw = response.raw.read(decode_content=False)
+                    else:
+                        encoding, raw = '', response.content
+            finally:
+                response.close()
+        now = time.time()
+
+        if raw is None:
+            telemetry.count('cache_hits', cache='page')
+            with self._lock:
+                self._conn.execute('UPDATE pages SET fetched_at = ? WHERE url = ?', (now, url))
+                self._conn.execute('UPDATE bodies SET accessed_at = ? WHERE body_hash = ?', (now, row[2]))
+                self._conn.commit()
+            return CachedPage(url, 304, cached_body, row[2], changed=False)
+
+        telemetry.count('cache_misses', cache='page')
+        with telemetry.span('decompress'):
+            body = _DECODERS[encoding](raw)
+        # Checked before the body is stored, so the last good copy stays cached
+        blocked = page_check.classify_page(body, url, response.url)
+        if blocked:
+            telemetry.count('pages_blocked', reason=blocked)
+            if blocked == page_check.ROBOT_CHECK:
+                http_client.report_throttled(response.url, blocked)
+            raise page_check.BlockedPage(url, blocked)
+        body_hash = hashlib.sha256(body).hexdigest()
+        size = self._write_body(body_hash, body)
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, etag, last_modified, body_hash, fetched_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (url, response.headers.get('ETag'), response.headers.get('Last-Modified'), body_hash, now)
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO bodies (body_hash, size, accessed_at) VALUES (?, ?, ?)',
+                (body_hash, size, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+        return CachedPage(url, response.status_code, body, body_hash,
+                          changed=not row or row[2] != body_hash)
+
+    # ------------------------------------------------------------------
+    # Extraction results
+    # ------------------------------------------------------------------
+    def get_extract(self, page: CachedPage, kind: str) -> Optional[Dict]:
+        """
+        Return the extraction result stored for this exact page body, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM extracts WHERE url = ? AND kind = ? AND body_hash = ?',
+                (page.url, kind, page.body_hash)
+            ).fetchone()
+        telemetry.count('cache_hits' if row else 'cache_misses', cache='extract')
+        return json.loads(row[0]) if row else None
+
+    def put_extract(self, page: CachedPage, kind: str, data: Dict) -> None:
+        """
+        Store the extraction result for this page body
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO extracts (url, kind, body_hash, data) VALUES (?, ?, ?, ?)',
+                (page.url, kind, page.body_hash, json.dumps(data, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[PageCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> PageCache:
+    """
+    Return the shared cache at CACHE_DIR, opening it on first use
+    """
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = PageCache()
+    return _default_cache
+
+
+def fetch(url: str, headers: Optional[Dict[str, str]] = None) -> CachedPage:
+    """
+    Fetch a page through the shared cache (see PageCache.fetch)
+    """
+    return get_cache().fetch(url, headers)
@@ -0,0 +1,99 @@
+"""
+Page Checks
+Cheap byte-level checks on fetched pages, run before any parsing.
+
+Amazon answers throttled clients with a "Robot Check" CAPTCHA page served with
+status 200. It is small and its markers sit in the first few KB, so a bounded
+byte search finds it without decoding or parsing the page. The same goes for
+its "page not found" pages. A product link that redirects to another
+country's store is caught from the final URL.
+
+Parsing one of these pages finds no selectors and falls back to the
+placeholder image and "Product Title Not Found", so callers raise BlockedPage
+instead and keep the product's previous record (see quarantine.py).
+"""
+
+import re
+from typing import Optional
+from urllib.parse import urlparse
+
+from link_resolver import DEFAULT_AMAZON_HOST, is_short_link
+
+# Only the start of a page is searched
+SNIFF_BYTES = 16 * 1024
+
+ROBOT_CHECK_PATTERN = re.compile(
+    rb'<title[^>]*>\s*Robot Check\s*</title>'
+    rb'|/errors/validateCaptcha'
+    rb'|Type the characters you see in this image'
+    rb'|api-services-support@amazon\.com',
+    re.IGNORECASE,
+)
+
+NOT_FOUND_PATTERN = re.compile(
+    rb'<title[^>]*>\s*(?:Amazon\.[a-z.]+\s*)?(?:Page Not Found|404 - Document Not Found)'
+    rb"|Sorry! We couldn(?:'|&#39;|&rsquo;)t find that page"
+    rb"|We(?:'|&#39;|&rsquo;)re sorry\. The Web address you entered is not a functioning page",
+    re.IGNORECASE,
+)
+
+# Verdicts, in the order they are checked
+ROBOT_CHECK = 'robot_check'
+NOT_FOUND = 'not_found'
+REGION_REDIRECT = 'region_redirect'
+VERDICTS = (ROBOT_CHECK, NOT_FOUND, REGION_REDIRECT)
+
+
+class BlockedPage(Exception):
+    """
+    A fetched page is not a product page (robot check, not found, region
+    redirect) and must not be parsed
+    """
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f'{reason.replace("_", " ")} page: {url}')
+        self.url = url
+        self.reason = reason
+
+
+def is_robot_check(body: bytes) -> bool:
+    """
+    True if a page body is Amazon's robot-check / CAPTCHA interstitial
+    """
+    return ROBOT_CHECK_PATTERN.search(body, 0, SNIFF_BYTES) is not None
+
+
+def _store_domain(url: Optional[str]) -> str:
+    host = (urlparse(url).hostname or '').lower() if url else ''
+    return host[4:] if host.startswith('www.') else host
+
+
+def _requested_store(url: Optional[str]) -> str:
+    # Short links (amzn.to, ...) are made for the store the catalog links to
+    if url and is_short_link(url):
+        return _store_domain(f'https://{DEFAULT_AMAZON_HOST}/')
+    return _store_domain(url)
+
+
+def classify_page(body: bytes, requested_url: Optional[str] = None, final_url: Optional[str] = None) -> Optional[str]:
+    """
+    Classify a page body before parsing
+
+    Args:
+        body: Raw page bytes (only the first SNIFF_BYTES are searched)
+        requested_url: URL that was requested
+        final_url: URL the response came from, after redirects
+
+    Returns:
+        'robot_check', 'not_found' or 'region_redirect', or None for a page
+        worth parsing
+    """
+    if ROBOT_CHECK_PATTERN.search(body, 0, SNIFF_BYTES):
+        return ROBOT_CHECK
+    if NOT_FOUND_PATTERN.search(body, 0, SNIFF_BYTES):
+        return NOT_FOUND
+    # A product link (or short link) redirected from one Amazon store to another
+    requested, final = _requested_store(requested_url), _store_domain(final_url)
+    if requested.startswith('amazon.') and final.startswith('amazon.') and requested != final:
+        return REGION_REDIRECT
+    return None
@@ -0,0 +1,592 @@
+"""
+Product Page Parser
+Extracts title, description and image from an Amazon product page.
+
+Two interchangeable backends produce the same output field for field:
+
+- 'lxml' (default): selectors are compiled once at import time and evaluated
+  in a single pass over the document
+- 'bs4': the original BeautifulSoup/html.parser implementation, kept as a
+  fallback when lxml is not installed
+
+The backend can be chosen per call or with the SCRAPER_PARSER environment variable.
+"""
+
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml is in requirements.txt
+    lxml = None
+    etree = None
+
+# Default placeholder image if no valid image is found
+DEFAULT_PLACEHOLDER_IMAGE = "default.png"
+
+# Placeholder string for missing data
+PLACEHOLDER_IMAGE = "default.png"
+
+# Fallback values used when nothing is found
+TITLE_NOT_FOUND = "Product Title Not Found"
+
+# ============================================
+# SELECTORS (shared by both backends, in priority order)
+# ============================================
+# Title: each selector is tried on <h1> first, then <span>
+TITLE_SELECTORS = [
+    {'id': 'productTitle'},
+    {'class': 'a-size-large'},
+    {'data-automation-id': 'product-title'},
+    {'class': 'a-size-large product-title-word-break'},
+    {'id': 'title'},
+]
+TITLE_TAGS = ('h1', 'span')
+
+# Description: each selector is tried on <div> first, then <ul>
+DESC_SELECTORS = [
+    {'id': 'feature-bullets'},
+    {'id': 'productDescription'},
+    {'class': 'a-unordered-list'},
+    {'data-automation-id': 'feature-bullets'},
+]
+DESC_TAGS = ('div', 'ul')
+
+# Image: <img> elements
+IMAGE_SELECTORS = [
+    {'id': 'landingImage'},
+    {'id': 'main-image'},
+    {'id': 'imgBlkFront'},
+    {'class': 'a-dynamic-image'},
+    {'data-a-image-name': 'landingImage'},
+    {'data-old-src': True},
+    {'data-src': True},
+]
+
+# <meta> fallbacks
+META_SELECTORS = {
+    'og:title': {'property': 'og:title'},
+    'og:description': {'property': 'og:description'},
+    'description': {'name': 'description'},
+    'og:image': {'property': 'og:image'},
+    'twitter:image': {'name': 'twitter:image'},
+}
+
+
+def is_valid_image_url(url: str) -> bool:
+    """
+    Validate if a URL is a valid image URL
+
+    Args:
+        url: URL to validate
+
+    Returns:
+        True if valid image URL, False otherwise
+    """
+    if not url or not isinstance(url, str):
+        return False
+
+    # Check if it's a valid URL format
+    try:
+        parsed = urlparse(url)
+        if not parsed.scheme or not parsed.netloc:
+            return False
+    except Exception:
+        return False
+
+    # Check if URL ends with valid image extension
+    valid_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
+    url_lower = url.lower()
+
+    # Check if URL contains image extension
+    has_extension = any(url_lower.endswith(ext) for ext in valid_extensions)
+
+    # Also check if it's an Amazon media URL (common pattern)
+    is_amazon_media = 'media-amazon.com' in url_lower or 'images-amazon.com' in url_lower
+
+    return has_extension or is_amazon_media
+
+
+def normalize_image_url(image_url: str) -> str:
+    """
+    Drop the query string and make protocol-relative/bare URLs absolute
+    """
+    image_url = image_url.split('?')[0]
+    if image_url and not image_url.startswith('http'):
+        if image_url.startswith('//'):
+            image_url = f'https:{image_url}'
+        else:
+            image_url = f'https://{image_url}'
+    return image_url
+
+
+def _finish(product_title: Optional[str], product_description: Optional[str],
+            product_image: Optional[str]) -> Dict:
+    """
+    Apply the placeholder fallbacks and build the result dictionary
+    """
+    # CRITICAL FIX #3: Use placeholder if no valid image found
+    if not product_image or not is_valid_image_url(product_image):
+        product_image = PLACEHOLDER_IMAGE
+    return {
+        'title': product_title or TITLE_NOT_FOUND,
+        'description': product_description or "",
+        'image_url': product_image,  # Always has a value (either valid URL or placeholder)
+    }
+
+
+# ============================================
+# BEAUTIFULSOUP BACKEND (reference implementation)
+# ============================================
+def parse_with_bs4(content: bytes) -> Dict:
+    """
+    Extract title, description and image with BeautifulSoup + html.parser
+
+    CRITICAL FIX: All variables are explicitly reset to None at the start
+
+    Args:
+        content: Raw HTML of the product page
+
+    Returns:
+        Dictionary with title, description and image_url
+    """
+    # CRITICAL FIX #1: Explicitly reset all variables to None at the start
+    product_title: Optional[str] = None
+    product_description: Optional[str] = None
+    product_image: Optional[str] = None
+
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # ============================================
+    # EXTRACT PRODUCT TITLE
+    # ============================================
+    for selector in TITLE_SELECTORS:
+        element = soup.find('h1', selector) or soup.find('span', selector)
+        if element:
+            product_title = element.get_text(strip=True)
+            if product_title:
+                break
+
+    # CRITICAL FIX #2: Fallback to Open Graph tags if main scraping fails
+    if not product_title:
+        og_title = soup.find('meta', property='og:title')
+        if og_title and og_title.get('content'):
+            product_title = og_title.get('content').strip()
+
+    # ============================================
+    # EXTRACT PRODUCT DESCRIPTION
+    # ============================================
+    for selector in DESC_SELECTORS:
+        element = soup.find('div', selector) or soup.find('ul', selector)
+        if element:
+            # Try to get first bullet point or paragraph
+            desc_text = element.find('span') or element.find('li') or element.find('p')
+            if desc_text:
+                product_description = desc_text.get_text(strip=True)
+                if product_description:
+                    break
+
+    # CRITICAL FIX #2: Fallback to Open Graph description
+    if not product_description:
+        og_desc = soup.find('meta', property='og:description')
+        if og_desc and og_desc.get('content'):
+            product_description = og_desc.get('content').strip()
+
+    # Also try meta description
+    if not product_description:
+        meta_desc = soup.find('meta', {'name': 'description'})
+        if meta_desc and meta_desc.get('content'):
+            product_description = meta_desc.get('content').strip()
+
+    # ============================================
+    # EXTRACT PRODUCT IMAGE
+    # ============================================
+    for selector in IMAGE_SELECTORS:
+        img_element = soup.find('img', selector)
+        if img_element:
+            # Try data-src first (lazy loaded), then src, then data-old-src
+            image_url = (
+                img_element.get('data-src') or
+                img_element.get('src') or
+                img_element.get('data-old-src') or
+                None
+            )
+
+            if image_url:
+                image_url = normalize_image_url(image_url)
+
+                # CRITICAL FIX #3: Validate image URL
+                if is_valid_image_url(image_url):
+                    product_image = image_url
+                    break
+
+    # CRITICAL FIX #2: Fallback to Open Graph image
+    if not product_image:
+        og_image = soup.find('meta', property='og:image')
+        if og_image and og_image.get('content'):
+            og_image_url = og_image.get('content').strip()
+            # CRITICAL FIX #3: Validate Open Graph image URL
+            if is_valid_image_url(og_image_url):
+                product_image = og_image_url
+
+    # Also try Twitter card image
+    if not product_image:
+        twitter_image = soup.find('meta', {'name': 'twitter:image'})
+        if twitter_image and twitter_image.get('content'):
+            twitter_image_url = twitter_image.get('content').strip()
+            # CRITICAL FIX #3: Validate Twitter image URL
+            if is_valid_image_url(twitter_image_url):
+                product_image = twitter_image_url
+
+    return _finish(product_title, product_description, product_image)
+
+
+# ============================================
+# LXML BACKEND (single pass, precompiled selectors)
+# ============================================
+Matcher = Callable[[object], bool]
+
+
+def _compile_selector(selector: Dict) -> Matcher:
+    """
+    Turn a BeautifulSoup-style attribute selector into a predicate on an
+    lxml element, with the same matching rules: True means "attribute
+    present", and 'class' matches any single class or the whole class string.
+    """
+    checks: List[Tuple[str, object]] = list(selector.items())
+
+    def matches(element) -> bool:
+        for attr, expected in checks:
+            value = element.get(attr)
+            if value is None:
+                return False
+            if expected is True:
+                continue
+            if attr == 'class':
+                classes = value.split()
+                if expected not in classes and ' '.join(classes) != expected:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    return matches
+
+
+# Slots are filled with the first matching element, in document order.
+# Slot keys: ('title', selector index, tag), ('desc', ...), ('image', ...), ('meta', name)
+_SLOTS_BY_TAG: Dict[str, List[Tuple[tuple, Matcher]]] = {}
+
+
+def _register(tag: str, slot: tuple, selector: Dict) -> None:
+    _SLOTS_BY_TAG.setdefault(tag, []).append((slot, _compile_selector(selector)))
+
+
+for _i, _selector in enumerate(TITLE_SELECTORS):
+    for _tag in TITLE_TAGS:
+        _register(_tag, ('title', _i, _tag), _selector)
+for _i, _selector in enumerate(DESC_SELECTORS):
+    for _tag in DESC_TAGS:
+        _register(_tag, ('desc', _i, _tag), _selector)
+for _i, _selector in enumerate(IMAGE_SELECTORS):
+    _register('img', ('image', _i, 'img'), _selector)
+for _name, _selector in META_SELECTORS.items():
+    _register('meta', ('meta', _name), _selector)
+
+_SCANNED_TAGS = tuple(_SLOTS_BY_TAG)
+_SLOT_COUNT = sum(len(slots) for slots in _SLOTS_BY_TAG.values())
+
+# Elements whose text BeautifulSoup leaves out of get_text()
+_NON_TEXT_TAGS = {'script', 'style', 'template'}
+
+_UTF8_PARSER = lxml.html.HTMLParser(encoding='utf-8') if lxml else None
+
+
+def _text(element) -> str:
+    """
+    Equivalent of BeautifulSoup's get_text(strip=True) for an lxml element
+    """
+    parts: List[str] = []
+
+    def walk(node) -> None:
+        if node.text and node.tag not in _NON_TEXT_TAGS:
+            parts.append(node.text.strip())
+        for child in node:
+            if isinstance(child.tag, str):
+                walk(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    walk(element)
+    return ''.join(parts)
+
+
+def _first_descendant(element, tag: str):
+    for found in element.iterdescendants(tag):
+        return found
+    return None
+
+
+def _meta_content(slots: Dict, name: str) -> Optional[str]:
+    element = slots.get(('meta', name))
+    if element is not None and element.get('content'):
+        return element.get('content').strip()
+    return None
+
+
+def _parse_document(content: bytes):
+    """
+    Parse raw page bytes with lxml, decoding like BeautifulSoup would for
+    pages that are not UTF-8. Returns None for an empty document.
+    """
+    if not content or not content.strip():
+        return None
+    try:
+        content.decode('utf-8')
+    except UnicodeDecodeError:
+        content = UnicodeDammit(content, is_html=True).unicode_markup.encode('utf-8')
+    try:
+        return lxml.html.document_fromstring(content, parser=_UTF8_PARSER)
+    except etree.ParserError:
+        return None
+
+
+def parse_with_lxml(content: bytes) -> Dict:
+    """
+    Extract title, description and image with lxml in a single pass
+
+    Every selector is evaluated during one walk over the document, recording
+    the first element each selector matches; the priority rules of the bs4
+    backend are then applied to those matches.
+
+    Args:
+        content: Raw HTML of the product page
+
+    Returns:
+        Dictionary with title, description and image_url
+    """
+    # CRITICAL FIX #1: Explicitly reset all variables to None at the start
+    product_title: Optional[str] = None
+    product_description: Optional[str] = None
+    product_image: Optional[str] = None
+
+    root = _parse_document(content)
+    if root is None:
+        return _finish(None, None, None)
+
+    slots: Dict[tuple, object] = {}
+    for element in root.iter(*_SCANNED_TAGS):
+        for slot, matches in _SLOTS_BY_TAG[element.tag]:
+            if slot not in slots and matches(element):
+                slots[slot] = element
+        if len(slots) == _SLOT_COUNT:
+            break
+
+    # Title
+    for i in range(len(TITLE_SELECTORS)):
+        element = slots.get(('title', i, 'h1'))
+        if element is None:
+            element = slots.get(('title', i, 'span'))
+        if element is not None:
+            product_title = _text(element)
+            if product_title:
+                break
+    if not product_title:
+        product_title = _meta_content(slots, 'og:title')
+
+    # Description
+    for i in range(len(DESC_SELECTORS)):
+        element = slots.get(('desc', i, 'div'))
+        if element is None:
+            element = slots.get(('desc', i, 'ul'))
+        if element is not None:
+            desc_text = None
+            for tag in ('span', 'li', 'p'):
+                desc_text = _first_descendant(element, tag)
+                if desc_text is not None:
+                    break
+            if desc_text is not None:
+                product_description = _text(desc_text)
+                if product_description:
+                    break
+    if not product_description:
+        product_description = _meta_content(slots, 'og:description')
+    if not product_description:
+        product_description = _meta_content(slots, 'description')
+
+    # Image
+    for i in range(len(IMAGE_SELECTORS)):
+        img_element = slots.get(('image', i, 'img'))
+        if img_element is not None:
+            image_url = (
+                img_element.get('data-src') or
+                img_element.get('src') or
+                img_element.get('data-old-src') or
+                None
+            )
+            if image_url:
+                image_url = normalize_image_url(image_url)
+                if is_valid_image_url(image_url):
+                    product_image = image_url
+                    break
+    for name in ('og:image', 'twitter:image'):
+        if product_image:
+            break
+        meta_image = _meta_content(slots, name)
+        if is_valid_image_url(meta_image):
+            product_image = meta_image
+
+    return _finish(product_title, product_description, product_image)
+
+
+# ============================================
+# STREAMING (HEAD-ONLY) EXTRACTION
+# ============================================
+class StreamingExtractor:
+    """
+    Incremental parser that watches a product page as it downloads and
+    reports when every required field has been seen, so the caller can stop
+    reading the response early.
+
+    Required fields are the first-choice sources of the full parser:
+    - title: #productTitle (h1/span) text
+    - image: #landingImage URL (if valid)
+    - description: #feature-bullets text
+
+    og:description / meta description are only the full parser's last
+    resort, so a page without usable bullets is read to the end and parsed
+    in full.
+
+    Elements that are no longer needed are cleared as soon as they end, so
+    memory stays flat however much of the page is read.
+    """
+
+    def __init__(self):
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), encoding='utf-8')
+        self._capture = None  # element whose text is needed when it ends
+        self._meta: Dict[str, str] = {}
+        self.title: Optional[str] = None
+        self.image: Optional[str] = None
+        self.bullets: Optional[str] = None
+
+    @property
+    def description(self) -> Optional[str]:
+        return self.bullets or self._meta.get('og:description') or self._meta.get('description')
+
+    @property
+    def complete(self) -> bool:
+        # Empty bullets send the full parser on to #productDescription and the
+        # other selectors, so only non-empty bullets settle the description
+        return bool(self.title and self.image and self.bullets)
+
+    def _on_start(self, element) -> None:
+        tag = element.tag
+        if tag == 'meta':
+            for name, selector in META_SELECTORS.items():
+                if name not in self._meta:
+                    attr, expected = next(iter(selector.items()))
+                    if element.get(attr) == expected and element.get('content'):
+                        self._meta[name] = element.get('content').strip()
+        elif tag == 'img':
+            if self.image is None and element.get('id') == 'landingImage':
+                image_url = element.get('data-src') or element.get('src') or element.get('data-old-src')
+                image_url = normalize_image_url(image_url) if image_url else None
+                # An invalid first choice means the full parser's fallbacks decide
+                self.image = image_url if is_valid_image_url(image_url) else ''
+        elif self._capture is None:
+            if tag in TITLE_TAGS and self.title is None and element.get('id') == 'productTitle':
+                self._capture = element
+            elif tag in DESC_TAGS and self.bullets is None and element.get('id') == 'feature-bullets':
+                self._capture = element
+
+    def _on_end(self, element) -> None:
+        if element is self._capture:
+            if element.get('id') == 'productTitle':
+                self.title = _text(element)
+            else:
+                desc_text = None
+                for tag in ('span', 'li', 'p'):
+                    desc_text = _first_descendant(element, tag)
+                    if desc_text is not None:
+                        break
+                self.bullets = _text(desc_text) if desc_text is not None else ''
+            self._capture = None
+        if self._capture is None:
+            element.clear(keep_tail=True)
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        Feed the next chunk of the page; returns True once every required
+        field has been found
+        """
+        self._parser.feed(chunk)
+        for event, element in self._parser.read_events():
+            if not isinstance(element.tag, str):
+                continue
+            if event == 'start':
+                self._on_start(element)
+            else:
+                self._on_end(element)
+        return self.complete
+
+    def result(self) -> Dict:
+        return _finish(self.title, self.description, self.image)
+
+
+def parse_product_stream(chunks: Iterable[bytes], backend: Optional[str] = None) -> Tuple[Dict, int, bool]:
+    """
+    Extract product details from a page delivered in chunks, stopping as
+    soon as every required field is found (see StreamingExtractor)
+
+    If the page ends first, the whole body is parsed with parse_product_page,
+    so the result is never worse than a full parse.
+
+    Args:
+        chunks: Iterable of raw page chunks (e.g. response.iter_content())
+        backend: Backend used for the full-parse fallback
+
+    Returns:
+        (details, bytes read, True if extraction stopped early)
+    """
+    received: List[bytes] = []
+    size = 0
+    extractor = StreamingExtractor() if etree is not None else None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        received.append(chunk)
+        size += len(chunk)
+        if extractor is not None and extractor.feed(chunk):
+            return extractor.result(), size, True
+    return parse_product_page(b''.join(received), backend), size, False
+
+
+# ============================================
+# BACKEND SELECTION
+# ============================================
+BACKENDS: Dict[str, Callable[[bytes], Dict]] = {'bs4': parse_with_bs4}
+if lxml is not None:
+    BACKENDS['lxml'] = parse_with_lxml
+
+DEFAULT_BACKEND = os.environ.get('SCRAPER_PARSER') or ('lxml' if 'lxml' in BACKENDS else 'bs4')
+
+
+def parse_product_page(content: bytes, backend: Optional[str] = None) -> Dict:
+    """
+    Extract title, description and image from a product page's HTML
+
+    Args:
+        content: Raw HTML of the product page
+        backend: 'lxml' or 'bs4' (defaults to DEFAULT_BACKEND)
+
+    Returns:
+        Dictionary with title, description and image_url
+    """
+    name = backend or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}' (available: {', '.join(sorted(BACKENDS))})")
+    return BACKENDS[name](content)
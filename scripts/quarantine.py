@@ -0,0 +1,147 @@
+"""
+Page Quarantine
+Persistent queue of product URLs whose page came back as a robot check, a
+"page not found" page or a redirect to another country's store
+(see page_check.py).
+
+- A quarantined URL is not fetched again until its backoff expires:
+  QUARANTINE_BASE_SECONDS[reason] * 2^(attempts - 1), capped at
+  QUARANTINE_MAX_SECONDS. Robot checks are retried soonest.
+- The product keeps its previous good record in the catalog meanwhile
+- A URL leaves the quarantine as soon as a fetch returns a real product page
+
+Usage:
+    python quarantine.py             # list quarantined URLs
+    python quarantine.py --clear     # release them all (fetched on the next run)
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+QUARANTINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'quarantine.sqlite')
+
+# First retry delay per reason; doubles with every failed attempt
+QUARANTINE_BASE_SECONDS = {
+    'robot_check': 15 * 60,
+    'region_redirect': 6 * 3600,
+    'not_found': 24 * 3600,
+}
+QUARANTINE_MAX_SECONDS = 7 * 24 * 3600
+
+
+class Quarantine:
+    """
+    Quarantined URLs with per-URL backoff (thread-safe)
+
+    Args:
+        path: SQLite file
+    """
+
+    def __init__(self, path: str = QUARANTINE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS items (
+                url TEXT PRIMARY KEY,
+                reason TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    def add(self, url: str, reason: str) -> float:
+        """
+        Quarantine a URL (or extend its backoff if it already is)
+
+        Returns:
+            Seconds until the URL may be fetched again
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT attempts FROM items WHERE url = ?', (url,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            base = QUARANTINE_BASE_SECONDS.get(reason, QUARANTINE_BASE_SECONDS['robot_check'])
+            delay = min(base * 2 ** (attempts - 1), QUARANTINE_MAX_SECONDS)
+            now = time.time()
+            self.conn.execute(
+                'INSERT INTO items (url, reason, added_at, attempts, next_attempt_at) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (url) DO UPDATE SET reason = excluded.reason, attempts = excluded.attempts,'
+                ' next_attempt_at = excluded.next_attempt_at',
+                (url, reason, now, attempts, now + delay)
+            )
+            self.conn.commit()
+        return delay
+
+    def release(self, url: str) -> None:
+        """
+        Drop a URL whose page was fetched fine
+        """
+        with self._lock:
+            self.conn.execute('DELETE FROM items WHERE url = ?', (url,))
+            self.conn.commit()
+
+    def waiting(self, url: str, now: Optional[float] = None) -> Optional[str]:
+        """
+        Reason a URL is quarantined if its backoff has not expired, else None
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT reason FROM items WHERE url = ? AND next_attempt_at > ?',
+                                    (url, now or time.time())).fetchone()
+        return row[0] if row else None
+
+    def retry_at(self, url: str) -> Optional[float]:
+        """
+        Time a quarantined URL may be fetched again, or None if it is not quarantined
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT next_attempt_at FROM items WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            return self.conn.execute('SELECT 1 FROM items WHERE url = ?', (url,)).fetchone() is not None
+
+    def items(self) -> List[Tuple[str, str, int, float]]:
+        """
+        (url, reason, attempts, next_attempt_at) of every quarantined URL
+        """
+        with self._lock:
+            return self.conn.execute(
+                'SELECT url, reason, attempts, next_attempt_at FROM items ORDER BY next_attempt_at'
+            ).fetchall()
+
+    def clear(self) -> int:
+        with self._lock:
+            count = self.conn.execute('DELETE FROM items').rowcount
+            self.conn.commit()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show or clear quarantined product URLs')
+    parser.add_argument('--clear', action='store_true', help='Release every URL so the next run fetches it')
+    args = parser.parse_args()
+
+    quarantine = Quarantine()
+    try:
+        if args.clear:
+            print(f"Released {quarantine.clear()} URLs")
+        else:
+            items = quarantine.items()
+            print(f"{len(items)} quarantined URLs")
+            for url, reason, attempts, next_attempt_at in items:
+                retry = datetime.fromtimestamp(next_attempt_at).strftime('%Y-%m-%d %H:%M')
+                print(f"  {reason:<16} attempts={attempts:<3} retry after {retry}  {url}")
+    finally:
+        quarantine.close()
@@ -0,0 +1,366 @@
+"""
+Rate Limiting Helpers
+Token-bucket limiters used by the scraping scripts to pace requests per host.
+
+Each host (e.g. amzn.to, www.amazon.in) gets its own bucket so that a burst of
+short-link requests does not eat into the budget of the product pages they
+redirect to, and vice versa. AIMDController adapts the rate and the number of
+requests in flight to the throttling signals the remote side sends.
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import http_client
+import telemetry
+
+# Short-link hosts and the host their links redirect to.
+# A request to a short link also costs a request on the target host.
+REDIRECT_HOSTS = {
+    'amzn.to': 'www.amazon.in',
+}
+
+
+def host_of(url: str) -> str:
+    """
+    Return the lower-cased host name of a URL ('' if it has none)
+    """
+    try:
+        return (urlparse(url).hostname or '').lower()
+    except Exception:
+        return ''
+
+
+def hosts_for(url: str, redirect_hosts: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Hosts a request to `url` will hit, in request order (its own host, then
+    the redirect target of a short-link host)
+    """
+    host = host_of(url)
+    hosts = [host]
+    target = (REDIRECT_HOSTS if redirect_hosts is None else redirect_hosts).get(host)
+    if target and target != host:
+        hosts.append(target)
+    return hosts
+
+
+class TokenBucket:
+    """
+    Async token bucket: refills at `rate` tokens per second up to `capacity`.
+
+    A bucket starts full, so the first `capacity` requests go out immediately
+    and the rest are spaced 1/rate seconds apart.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        """
+        Change the refill rate, keeping the tokens accrued so far
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._refill()
+        self.rate = float(rate)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Wait until `tokens` tokens are available and take them.
+        Waiters are served in arrival order.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class HostRateLimiter:
+    """
+    One token bucket per host, created on first use.
+
+    Args:
+        rate: Requests per second allowed for each host
+        capacity: Burst size for each host
+        host_rates: Optional per-host overrides of `rate`
+        redirect_hosts: Short-link host -> target host; acquiring a short link
+            also acquires a token on its target host
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        host_rates: Optional[Dict[str, float]] = None,
+        redirect_hosts: Optional[Dict[str, str]] = None,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.host_rates = dict(host_rates or {})
+        self.redirect_hosts = REDIRECT_HOSTS if redirect_hosts is None else redirect_hosts
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        """
+        Return (creating if needed) the bucket for a host
+        """
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.host_rates.get(host, self.rate), self.capacity)
+        return self._buckets[host]
+
+    def hosts_for(self, url: str) -> List[str]:
+        """
+        Hosts a request to `url` will hit, in request order
+        """
+        return hosts_for(url, self.redirect_hosts)
+
+    async def acquire(self, url: str) -> None:
+        """
+        Wait for a token on every host a request to `url` will hit
+        """
+        for host in self.hosts_for(url):
+            await self.bucket(host).acquire()
+
+    def set_rate(self, rate: float) -> None:
+        """
+        Change the rate of every host without a per-host override
+        """
+        self.rate = rate
+        for host, bucket in self._buckets.items():
+            if host not in self.host_rates:
+                bucket.set_rate(rate)
+
+    def buckets(self) -> Iterable[TokenBucket]:
+        return self._buckets.values()
+
+
+# ============================================
+# ADAPTIVE (AIMD) CONTROL
+# ============================================
+# Bounds and steps of AIMDController (rates are requests per second per host)
+AIMD_MIN_RATE = 0.1
+AIMD_MAX_RATE = 2.0
+AIMD_MAX_CONCURRENCY = 8
+AIMD_RATE_STEP = 0.05
+AIMD_DECREASE = 0.5
+
+# Responses slower than this (moving average) count as a throttling signal
+AIMD_LATENCY_TARGET = 4.0
+AIMD_LATENCY_SMOOTHING = 0.2
+
+# After a decrease, further signals are ignored this long (and at least one
+# request interval): the requests already in flight report the same congestion
+AIMD_COOLDOWN_SECONDS = 2.0
+
+# Seconds between state lines in the log while nothing else is reported
+AIMD_LOG_INTERVAL = 30.0
+
+
+class AIMDController:
+    """
+    Adapts the request rate and the number of requests in flight to what the
+    remote side tolerates (additive increase, multiplicative decrease)
+
+    Every response without a throttling signal adds rate_step/s to the rate,
+    spread over one round of `concurrency` responses, and every full round
+    allows one more request in flight. A throttling signal - a 429 or 503
+    (also one urllib3 retried), a robot-check page, or the latency moving
+    average going above latency_target - multiplies both by `decrease`.
+
+    Use it in place of the semaphore and the HostRateLimiter:
+
+        async with controller:            # waits for a free slot
+            await controller.acquire(url) # paces per host
+            ...
+
+    and feed it responses with `with controller.observing(): ...` (every
+    request made through http_client in the block is reported). Its state is
+    printed on every decrease and every AIMD_LOG_INTERVAL seconds, and kept as
+    telemetry gauges (aimd_rate, aimd_concurrency).
+
+    Args:
+        rate: Starting requests per second per host (None = no rate limit;
+            only the concurrency adapts)
+        concurrency: Starting number of requests in flight
+        max_rate / max_concurrency: Ceilings (raised to the starting values
+            if those are higher)
+        min_rate / min_concurrency: Floors
+    """
+
+    def __init__(self, rate: Optional[float] = 0.5, concurrency: int = 1, burst: int = 1,
+                 min_rate: float = AIMD_MIN_RATE, max_rate: float = AIMD_MAX_RATE,
+                 min_concurrency: int = 1, max_concurrency: int = AIMD_MAX_CONCURRENCY,
+                 rate_step: float = AIMD_RATE_STEP, decrease: float = AIMD_DECREASE,
+                 latency_target: float = AIMD_LATENCY_TARGET):
+        self.limiter = HostRateLimiter(rate, burst) if rate else None
+        self.rate = float(rate) if rate else None
+        self.min_rate = min(min_rate, self.rate) if self.rate else min_rate
+        self.max_rate = max(max_rate, self.rate) if self.rate else max_rate
+        self.concurrency = max(1, int(concurrency))
+        self.min_concurrency = max(1, min(min_concurrency, self.concurrency))
+        self.max_concurrency = max(max_concurrency, self.concurrency)
+        self.rate_step = rate_step
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.decreases: Dict[str, int] = {}
+        self._round = 0
+        self._last_decrease = float('-inf')
+        self._last_log = time.monotonic()
+        self._hosts: set = set()
+        self._lock = threading.Lock()
+        self._condition: Optional[asyncio.Condition] = None
+
+    # ------------------------------------------------------------------
+    # Pacing (event loop side)
+    # ------------------------------------------------------------------
+    def _take_slot(self) -> bool:
+        with self._lock:
+            if self.in_flight < self.concurrency:
+                self.in_flight += 1
+                return True
+            return False
+
+    async def __aenter__(self) -> 'AIMDController':
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        # A raised limit is picked up when the next request finishes
+        async with self._condition:
+            await self._condition.wait_for(self._take_slot)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def acquire(self, url: str) -> None:
+        """
+        Wait for a token on every host a request to `url` will hit, at the
+        current rate
+        """
+        if self.limiter is None:
+            # Responses come back keyed on the redirect target too
+            self._hosts.update(hosts_for(url))
+            return
+        hosts = self.limiter.hosts_for(url)
+        self._hosts.update(hosts)
+        if self.limiter.rate != self.rate:
+            self.limiter.set_rate(self.rate)
+        await self.limiter.acquire(url)
+
+    # ------------------------------------------------------------------
+    # Signals (any thread)
+    # ------------------------------------------------------------------
+    def observe(self, url: str, throttled: Optional[str], seconds: float) -> None:
+        """
+        Account for one response: `throttled` is the reason the server asked
+        us to slow down ('http_429', 'robot_check', ...) or None
+        """
+        if host_of(url) not in self._hosts:
+            return  # e.g. image probes on hosts this controller doesn't pace
+        with self._lock:
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += AIMD_LATENCY_SMOOTHING * (seconds - self.latency)
+            if throttled is None and self.latency > self.latency_target:
+                throttled = 'latency'
+            if throttled:
+                self._decrease(throttled)
+            else:
+                self._increase()
+            log = time.monotonic() - self._last_log >= AIMD_LOG_INTERVAL
+        if log:
+            self.log_state()
+
+    def _increase(self) -> None:
+        # Caller holds the lock
+        if self.rate is not None:
+            self.rate = min(self.max_rate, self.rate + self.rate_step / self.concurrency)
+        self._round += 1
+        if self._round >= self.concurrency:
+            self._round = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def _decrease(self, reason: str) -> None:
+        # Caller holds the lock
+        now = time.monotonic()
+        cooldown = max(AIMD_COOLDOWN_SECONDS, 1 / self.rate if self.rate else 0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._round = 0
+        before = (self.rate, self.concurrency)
+        if self.rate is not None:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.concurrency = max(self.min_concurrency, int(self.concurrency * self.decrease))
+        self.decreases[reason] = self.decreases.get(reason, 0) + 1
+        telemetry.count('aimd_decreases', reason=reason)
+        print(f"⚙️  Slowing down ({reason}): rate {_format_rate(before[0])} -> {_format_rate(self.rate)}, "
+              f"concurrency {before[1]} -> {self.concurrency}")
+        self._record_gauges()
+
+    def _record_gauges(self) -> None:
+        if self.rate is not None:
+            telemetry.gauge('aimd_rate', round(self.rate, 3))
+        telemetry.gauge('aimd_concurrency', self.concurrency)
+
+    @contextmanager
+    def observing(self):
+        """
+        Report every response made through http_client in the block
+        """
+        http_client.add_observer(self.observe)
+        try:
+            yield self
+        finally:
+            http_client.remove_observer(self.observe)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def state(self) -> Dict:
+        with self._lock:
+            return {
+                'rate': round(self.rate, 3) if self.rate is not None else None,
+                'concurrency': self.concurrency,
+                'in_flight': self.in_flight,
+                'latency_s': round(self.latency, 3) if self.latency is not None else None,
+                'decreases': dict(self.decreases),
+            }
+
+    def log_state(self) -> None:
+        state = self.state()
+        self._last_log = time.monotonic()
+        latency = f"{state['latency_s']:.2f}s" if state['latency_s'] is not None else 'n/a'
+        decreases = ', '.join(f'{n} {reason}' for reason, n in sorted(state['decreases'].items())) or 'none'
+        print(f"⚙️  Adaptive limits: rate {_format_rate(self.rate)}, concurrency {state['concurrency']} "
+              f"({state['in_flight']} in flight), latency {latency}, slowdowns: {decreases}")
+        self._record_gauges()
+
+
+def _format_rate(rate: Optional[float]) -> str:
+    return f'{rate:.2f}/s' if rate is not None else 'unlimited'
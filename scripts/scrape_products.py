@@ -8,358 +8,702 @@ FIXED BUGS:
 3. Image Validation: Validates image URLs and uses placeholder if invalid or missing
 """
 
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-import re
-from typing import List, Dict, Optional
-from urllib.parse import urlparse
+import argparse
+import asyncio
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 
-# Default placeholder image if no valid image is found
-DEFAULT_PLACEHOLDER_IMAGE = "default.png"
+import http_client
+import image_verifier
+from catalog_store import DATA_DIR, PRODUCTS_FILE, open_catalog
+from catalog_shards import SHARDS_DIR, ShardWriter
+from catalog_writer import COMPRESSIONS, FORMATS, CatalogWriter, write_catalog
+from job_journal import JobJournal, discard_journal, journal_path as default_journal_path
+import link_resolver
+import page_cache
+import page_check
+import telemetry
+from product_parser import PLACEHOLDER_IMAGE, parse_product_page, parse_product_stream
+# Defined here before the parser moved to product_parser; kept for `from scrape_products import ...`
+from product_parser import DEFAULT_PLACEHOLDER_IMAGE, is_valid_image_url  # noqa: F401
+from quarantine import QUARANTINE_PATH, Quarantine
+from rate_limit import AIMDController, HostRateLimiter
+from search_index import SEARCH_INDEX_FILE, IndexBuilder, write_index
 
-# Placeholder string for missing data
-PLACEHOLDER_IMAGE = "default.png"
+# Page cache key for parse_product_page results
+EXTRACT_KIND = 'product_details'
 
+# Bytes read per chunk in streaming mode
+STREAM_CHUNK_SIZE = 16 * 1024
 
-def is_valid_image_url(url: str) -> bool:
+# Requests in flight (the starting value in adaptive mode)
+DEFAULT_CONCURRENCY = 4
+
+
+def fetch_details_streaming(url: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Dict:
     """
-    Validate if a URL is a valid image URL
-    
+    Download a product page in chunks and stop as soon as the title, image
+    and description have been found (see product_parser.StreamingExtractor)
+
+    Falls back to a full parse when the page ends before every field is
+    found. Streamed pages bypass the page cache, which needs whole bodies.
+
     Args:
-        url: URL to validate
-        
+        url: URL of the product page
+        chunk_size: Bytes read per chunk
+
     Returns:
-        True if valid image URL, False otherwise
+        Dictionary with title, description and image_url
+
+    Raises:
+        page_check.BlockedPage if the first chunk is a robot-check, not-found
+        or region-redirect page
     """
-    if not url or not isinstance(url, str):
-        return False
-    
-    # Check if it's a valid URL format
+    response = http_client.get(url, stream=True)
     try:
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            return False
-    except Exception:
-        return False
-    
-    # Check if URL ends with valid image extension
-    valid_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
-    url_lower = url.lower()
-    
-    # Check if URL contains image extension
-    has_extension = any(url_lower.endswith(ext) for ext in valid_extensions)
-    
-    # Also check if it's an Amazon media URL (common pattern)
-    is_amazon_media = 'media-amazon.com' in url_lower or 'images-amazon.com' in url_lower
+        blocked = page_check.NOT_FOUND if response.status_code == 404 else None
+        if not blocked:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size)
+            first = next(chunks, b'')
+            blocked = page_check.classify_page(first, url, response.url)
+        if blocked:
+            telemetry.count('pages_blocked', reason=blocked)
+            if blocked == page_check.ROBOT_CHECK:
+                http_client.report_throttled(response.url, blocked)
+            raise page_check.BlockedPage(url, blocked)
+        details, bytes_read, stopped_early = parse_product_stream(itertools.chain([first], chunks))
+    finally:
+        # Closing mid-body drops the connection instead of draining the rest
+        response.close()
+    if stopped_early:
+        print(f"   Streamed {bytes_read // 1024} KB (stopped early)")
+    return details
+
+
+def fetch_product_page(url: str) -> Tuple[page_cache.CachedPage, Optional[Dict]]:
+    """
+    Fetch a product page through the page cache (network stage only)
+
+    Args:
+        url: Amazon product URL
+
+    Returns:
+        (page, cached details) - details is None when the page still needs parsing
+    """
+    # Go straight to the canonical product page when the short link is cached.
+    # The page cache sends a conditional request and the parse result is
+    # reused when the body is identical to the last run.
+    cache = page_cache.get_cache()
+    page = cache.fetch(link_resolver.canonical_url(url))
+    return page, cache.get_extract(page, EXTRACT_KIND)
+
+
+def product_data_from_details(url: str, details: Dict) -> Dict:
+    """
+    Wrap parsed page details into the extract_product_details result
+    """
+    return {
+        'url': url,
+        'title': details['title'],
+        'description': details['description'],
+        'image_url': details['image_url'],  # Always has a value (either valid URL or placeholder)
+        'extracted_at': datetime.now().isoformat()
+    }
+
+
+def product_data_from_error(url: str, error: Exception) -> Dict:
+    """
+    extract_product_details result for a URL that failed
+
+    Blocked pages (robot check, not found, region redirect) are marked with
+    'blocked' so the scraper can quarantine the URL and keep the previous record.
+    """
+    print(f"Error extracting product from {url}: {str(error)}")
     
-    return has_extension or is_amazon_media
+    # CRITICAL FIX #1: On error, explicitly return None/placeholder values
+    product_data = {
+        'url': url,
+        'title': None,
+        'description': None,
+        'image_url': PLACEHOLDER_IMAGE,  # CRITICAL FIX #3: Always use placeholder on error
+        'error': str(error),
+        'extracted_at': datetime.now().isoformat()
+    }
+    if isinstance(error, page_check.BlockedPage):
+        product_data['blocked'] = error.reason
+    return product_data
+
+
+def previous_product_data(urls: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Last good catalog record for each URL, as extract_product_details results
+
+    Used in place of blocked pages, so a robot check never overwrites a good
+    product with the placeholder and "Product Title Not Found".
+    """
+    store = open_catalog()
+    try:
+        previous = {}
+        for url in urls:
+            for product in store.find_by_link(url):
+                if product.get('title') and product.get('title') != "Product Title Not Found":
+                    previous[url] = {
+                        'url': url,
+                        'title': product['title'],
+                        'description': product.get('description'),
+                        'image_url': product.get('image_url') or PLACEHOLDER_IMAGE,
+                        'extracted_at': product.get('extracted_at'),
+                    }
+                    break
+        return previous
+    finally:
+        store.close()
 
 
-def extract_product_details(url: str) -> Dict:
+def extract_product_details(url: str, streaming: bool = False) -> Dict:
     """
     Extract product details from an Amazon URL
     
-    CRITICAL FIX: All variables are explicitly reset to None at the start
+    Parsing is skipped when the page body is unchanged since the last run
+    (see page_cache).
     
     Args:
         url: Amazon product URL
+        streaming: Stop downloading once every field is found
+            (see fetch_details_streaming)
         
     Returns:
         Dictionary with product details
     """
-    # CRITICAL FIX #1: Explicitly reset all variables to None at the start
-    product_title: Optional[str] = None
-    product_description: Optional[str] = None
-    product_image: Optional[str] = None
-    
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
+        if streaming:
+            # Download and parse are interleaved, so they are timed together
+            with telemetry.span('fetch', streaming=True):
+                details = fetch_details_streaming(link_resolver.canonical_url(url))
+        else:
+            page, details = fetch_product_page(url)
+            if details is None:
+                with telemetry.span('parse'):
+                    details = parse_product_page(page.body)
+                page_cache.get_cache().put_extract(page, EXTRACT_KIND, details)
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # ============================================
-        # EXTRACT PRODUCT TITLE
-        # ============================================
-        # CRITICAL FIX #1: Reset to None (already done above)
-        product_title = None
-        
-        # Try multiple selectors for title
-        title_selectors = [
-            {'id': 'productTitle'},
-            {'class': 'a-size-large'},
-            {'data-automation-id': 'product-title'},
-            {'class': 'a-size-large product-title-word-break'},
-            {'id': 'title'},
-        ]
-        
-        for selector in title_selectors:
-            element = soup.find('h1', selector) or soup.find('span', selector)
-            if element:
-                product_title = element.get_text(strip=True)
-                if product_title:
-                    break
-        
-        # CRITICAL FIX #2: Fallback to Open Graph tags if main scraping fails
-        if not product_title:
-            og_title = soup.find('meta', property='og:title')
-            if og_title and og_title.get('content'):
-                product_title = og_title.get('content').strip()
-        
-        # If still no title, use placeholder
-        if not product_title:
-            product_title = "Product Title Not Found"
-        
-        # ============================================
-        # EXTRACT PRODUCT DESCRIPTION
-        # ============================================
-        # CRITICAL FIX #1: Reset to None
-        product_description = None
-        
-        # Try multiple selectors for description
-        desc_selectors = [
-            {'id': 'feature-bullets'},
-            {'id': 'productDescription'},
-            {'class': 'a-unordered-list'},
-            {'data-automation-id': 'feature-bullets'},
-        ]
-        
-        for selector in desc_selectors:
-            element = soup.find('div', selector) or soup.find('ul', selector)
-            if element:
-                # Try to get first bullet point or paragraph
-                desc_text = element.find('span') or element.find('li') or element.find('p')
-                if desc_text:
-                    product_description = desc_text.get_text(strip=True)
-                    if product_description:
-                        break
-        
-        # CRITICAL FIX #2: Fallback to Open Graph description
-        if not product_description:
-            og_desc = soup.find('meta', property='og:description')
-            if og_desc and og_desc.get('content'):
-                product_description = og_desc.get('content').strip()
-        
-        # Also try meta description
-        if not product_description:
-            meta_desc = soup.find('meta', {'name': 'description'})
-            if meta_desc and meta_desc.get('content'):
-                product_description = meta_desc.get('content').strip()
-        
-        # If still no description, use empty string
-        if not product_description:
-            product_description = ""
-        
-        # ============================================
-        # EXTRACT PRODUCT IMAGE
-        # ============================================
-        # CRITICAL FIX #1: Reset to None
-        product_image = None
-        
-        # Try multiple selectors for image
-        image_selectors = [
-            {'id': 'landingImage'},
-            {'id': 'main-image'},
-            {'id': 'imgBlkFront'},
-            {'class': 'a-dynamic-image'},
-            {'data-a-image-name': 'landingImage'},
-            {'data-old-src': True},
-            {'data-src': True},
-        ]
-        
-        for selector in image_selectors:
-            img_element = soup.find('img', selector)
-            if img_element:
-                # Try data-src first (lazy loaded), then src, then data-old-src
-                image_url = (
-                    img_element.get('data-src') or
-                    img_element.get('src') or
-                    img_element.get('data-old-src') or
-                    None
-                )
-                
-                if image_url:
-                    # Clean up the URL
-                    image_url = image_url.split('?')[0]
-                    # Ensure it's a full URL
-                    if image_url and not image_url.startswith('http'):
-                        if image_url.startswith('//'):
-                            image_url = f'https:{image_url}'
-                        else:
-                            image_url = f'https://{image_url}'
-                    
-                    # CRITICAL FIX #3: Validate image URL
-                    if is_valid_image_url(image_url):
-                        product_image = image_url
-                        break
-        
-        # CRITICAL FIX #2: Fallback to Open Graph image
-        if not product_image:
-            og_image = soup.find('meta', property='og:image')
-            if og_image and og_image.get('content'):
-                og_image_url = og_image.get('content').strip()
-                # CRITICAL FIX #3: Validate Open Graph image URL
-                if is_valid_image_url(og_image_url):
-                    product_image = og_image_url
-        
-        # Also try Twitter card image
-        if not product_image:
-            twitter_image = soup.find('meta', {'name': 'twitter:image'})
-            if twitter_image and twitter_image.get('content'):
-                twitter_image_url = twitter_image.get('content').strip()
-                # CRITICAL FIX #3: Validate Twitter image URL
-                if is_valid_image_url(twitter_image_url):
-                    product_image = twitter_image_url
-        
-        # CRITICAL FIX #3: Use placeholder if no valid image found
-        if not product_image or not is_valid_image_url(product_image):
-            product_image = PLACEHOLDER_IMAGE
-        
-        return {
-            'url': url,
-            'title': product_title,
-            'description': product_description,
-            'image_url': product_image,  # Always has a value (either valid URL or placeholder)
-            'extracted_at': datetime.now().isoformat()
-        }
+        return product_data_from_details(url, details)
         
     except Exception as error:
-        print(f"Error extracting product from {url}: {str(error)}")
-        
-        # CRITICAL FIX #1: On error, explicitly return None/placeholder values
-        return {
-            'url': url,
-            'title': None,
-            'description': None,
-            'image_url': PLACEHOLDER_IMAGE,  # CRITICAL FIX #3: Always use placeholder on error
-            'error': str(error),
-            'extracted_at': datetime.now().isoformat()
-        }
+        return product_data_from_error(url, error)
 
 
-def scrape_products(urls: List[str], delay_between_requests: float = 2.0) -> List[Dict]:
+def build_product(index: int, url: str, product_data: Dict, products: List[Dict]) -> Dict:
     """
-    Process multiple product URLs and scrape their data
-    
-    CRITICAL FIX #1: Each iteration explicitly resets all variables to None
-    
+    Build the exported product object for one scraped URL
+
+    CRITICAL FIX #1: Each call starts from freshly reset variables
+
+    Args:
+        index: 1-based position of the URL in the scrape run
+        url: Amazon product URL
+        product_data: Result of extract_product_details for this URL
+        products: Products built so far (used for the stale data check)
+
+    Returns:
+        Product dictionary ready for JSON export
+    """
+    # CRITICAL FIX #1: Explicitly assign values (not relying on closure)
+    product_title: Optional[str] = product_data.get('title')
+    product_description: Optional[str] = product_data.get('description')
+    product_image: Optional[str] = product_data.get('image_url')
+
+    # Build product object for JSON export
+    product = {
+        'id': f'product-{index}',
+        'title': product_title if product_title else "Product Title Not Found",
+        'product_link': url,
+        'image_url': product_image,  # Always has a value (valid URL or placeholder)
+        'description': product_description if product_description else "",
+        'category': '',  # You can add category mapping logic here
+        'subcategory': '',  # You can add subcategory mapping logic here
+        'extracted_at': product_data.get('extracted_at')
+    }
+    # Callers (update_tech_products) must tell a failed fetch from a real result
+    if product_data.get('error'):
+        product['error'] = product_data['error']
+
+    # Validation: Check for potential stale data
+    if index > 1 and products:
+        prev_product = products[-1]
+        if (product_image == prev_product.get('image_url') and
+            product_title == prev_product.get('title') and
+            not product_data.get('title')):
+            print(f"⚠️  WARNING: Possible stale data detected for product {index}")
+            # Force reset to placeholder
+            product['image_url'] = PLACEHOLDER_IMAGE
+            product['title'] = "Product Title Not Found"
+
+    return product
+
+
+def build_failed_product(index: int, url: str, error: Exception) -> Dict:
+    """
+    Build the exported product object for a URL that could not be processed
+    """
+    # CRITICAL FIX #1: On error, explicitly set all fields (not previous product's data)
+    return {
+        'id': f'product-{index}',
+        'title': None,
+        'product_link': url,
+        'image_url': PLACEHOLDER_IMAGE,  # CRITICAL FIX #3: Always use placeholder
+        'description': None,
+        'category': '',
+        'subcategory': '',
+        'error': str(error),
+        'extracted_at': datetime.now().isoformat()
+    }
+
+
+def reject_bad_images(results: List[object]) -> int:
+    """
+    Verify the scraped image URLs in one concurrent batch and swap broken,
+    thumbnail or undersized images for the placeholder (in place)
+
+    Returns:
+        Number of images rejected
+    """
+    scraped = [r for r in results if isinstance(r, dict) and r.get('image_url') != PLACEHOLDER_IMAGE]
+    with telemetry.span('validate'):
+        verdicts = image_verifier.verify_image_urls(r['image_url'] for r in scraped)
+    rejected = 0
+    for product_data in scraped:
+        verdict = verdicts.get(product_data['image_url'])
+        # Unreachable means the probe itself failed, not that the image is bad
+        if verdict and not verdict['ok'] and verdict['reason'] != 'unreachable':
+            print(f"⚠️ Rejected image ({verdict['reason']}): {product_data['image_url']}")
+            telemetry.count('images_rejected', reason=verdict['reason'])
+            product_data['image_url'] = PLACEHOLDER_IMAGE
+            rejected += 1
+    return rejected
+
+
+async def _fetch_and_parse_in_pool(
+    todo: List[Tuple[int, str]],
+    semaphore,
+    gate,
+    on_result,
+    parse_workers: int,
+    queue_size: int,
+) -> None:
+    """
+    Two-stage pipeline: network workers put raw pages on a bounded queue and
+    a process pool parses them
+
+    Fetching blocks while `queue_size` pages are waiting to be parsed, so a
+    slow parse stage slows the downloads instead of piling pages up in
+    memory: at most queue_size + max_concurrency + parse_workers fetched
+    pages are unparsed at any time. Each finished product is passed to on_result(index, url, data).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    loop = asyncio.get_running_loop()
+    cache = page_cache.get_cache()
+
+    async def network_worker(index: int, url: str) -> None:
+        async with semaphore:
+            await gate(index, url)
+            try:
+                page, details = await asyncio.to_thread(fetch_product_page, url)
+            except Exception as error:
+                on_result(index, url, product_data_from_error(url, error))
+                return
+            if details is not None:
+                on_result(index, url, product_data_from_details(url, details))
+                return
+            # The slot is held until the page is queued, so at most
+            # max_concurrency fetched pages wait outside the queue
+            await queue.put((index, url, page))
+
+    async def parse_worker(pool: ProcessPoolExecutor) -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                index, url, page = item
+                try:
+                    # Timed from here: includes the hand-off to the parser process
+                    with telemetry.span('parse'):
+                        details = await loop.run_in_executor(pool, parse_product_page, page.body)
+                    cache.put_extract(page, EXTRACT_KIND, details)
+                    on_result(index, url, product_data_from_details(url, details))
+                except Exception as error:
+                    on_result(index, url, product_data_from_error(url, error))
+            finally:
+                queue.task_done()
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        # One consumer per process keeps every parser busy without letting
+        # more than queue_size pages wait in memory
+        consumers = [asyncio.create_task(parse_worker(pool)) for _ in range(parse_workers)]
+        await asyncio.gather(*(network_worker(i, url) for i, url in todo))
+        for _ in consumers:
+            await queue.put(None)
+        await asyncio.gather(*consumers)
+
+
+async def scrape_products_async(
+    urls: List[str],
+    max_concurrency: int = DEFAULT_CONCURRENCY,
+    requests_per_second: Optional[float] = 0.5,
+    burst: int = 1,
+    streaming: bool = False,
+    parse_workers: int = 0,
+    queue_size: int = 32,
+    journal: Optional[JobJournal] = None,
+    verify_images: bool = True,
+    on_product: Optional[Callable[[Dict], None]] = None,
+    adaptive: bool = True,
+    quarantine: Optional[Quarantine] = None,
+) -> List[Dict]:
+    """
+    Scrape product URLs concurrently with per-host rate limiting
+
+    Up to `max_concurrency` requests are in flight at once, and each host
+    (amzn.to, www.amazon.in) is paced by its own token bucket. Products are
+    returned in the same order as `urls`, with the same shape and ids as the
+    sequential scraper. URLs that lead to the same ASIN are fetched once and
+    every one of them gets the result.
+
+    URLs whose page is a robot check, "not found" or a region redirect are
+    quarantined, and URLs still waiting in the quarantine are not fetched.
+    Either way such a product keeps its last good record from the catalog
+    (the placeholder only if it never had one).
+
     Args:
         urls: List of Amazon product URLs
-        delay_between_requests: Delay in seconds between requests
-        
+        max_concurrency: Maximum number of requests in flight
+        requests_per_second: Request rate allowed per host (None = unlimited)
+        burst: Number of requests a host may receive back-to-back
+        streaming: Stop reading each page once every field is found
+        parse_workers: Parse pages in a pool of this many processes,
+            separate from the network workers (0 = parse on the fetching thread)
+        queue_size: Maximum number of fetched pages waiting to be parsed;
+            fetching pauses while the queue is full
+        journal: Checkpoint each finished URL here; URLs it already holds
+            (without an error) are not fetched again
+        verify_images: Probe every scraped image URL and replace broken,
+            thumbnail or undersized images with the placeholder
+        on_product: Called with each finished product, in input order, as soon
+            as it is assembled (e.g. CatalogWriter.write to stream the export)
+        adaptive: Treat max_concurrency and requests_per_second as starting
+            points and adapt them to throttling signals (see AIMDController)
+        quarantine: Queue for blocked URLs, retried later with backoff
+            (see quarantine.py)
+
     Returns:
         List of product dictionaries ready for JSON export
     """
-    products = []
-    
-    print(f"Starting to scrape {len(urls)} products...")
-    print("=" * 60)
-    
-    # Process each URL - CRITICAL: Each iteration is isolated
+    total = len(urls)
+    if adaptive:
+        # One controller paces the hosts and limits the requests in flight
+        controller = AIMDController(requests_per_second, max_concurrency, burst)
+        semaphore = limiter = controller
+    else:
+        controller = None
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        limiter = HostRateLimiter(requests_per_second, burst) if requests_per_second else None
+    results: List[object] = [None] * total
+
+    # Resume: reuse successful results from an interrupted run
+    todo = []
+    held = 0
     for i, url in enumerate(urls, 1):
-        # CRITICAL FIX #1: Explicitly reset all variables to None at the start of each iteration
-        # This prevents stale data from previous iterations
-        product_title: Optional[str] = None
-        product_description: Optional[str] = None
-        product_image: Optional[str] = None
-        
-        print(f"\n[{i}/{len(urls)}] Processing: {url}")
-        
+        done = journal.get(url) if journal else None
+        reason = quarantine.waiting(url) if quarantine else None
+        if done and not done.get('error'):
+            results[i - 1] = done
+        elif reason:
+            results[i - 1] = {'url': url, 'title': None, 'description': None, 'image_url': PLACEHOLDER_IMAGE,
+                              'error': f'quarantined ({reason})', 'blocked': reason,
+                              'extracted_at': datetime.now().isoformat()}
+            held += 1
+        else:
+            todo.append((i, url))
+
+    print(f"Starting to scrape {total} products...")
+    if len(todo) + held < total:
+        print(f"Resuming: {total - len(todo) - held} already done, {len(todo)} left")
+    if held:
+        print(f"Quarantined: {held} URLs wait for their retry time and keep their previous data")
+
+    # One fetch per product: URLs that resolve to the same ASIN (or the same
+    # URL listed twice) share the fetch of the first one, and its result is
+    # fanned out to the others
+    with controller.observing() if controller else nullcontext():
+        await link_resolver.resolve_links_async([url for _, url in todo], max_concurrency, limiter)
+    indexes: Dict[str, List[int]] = {}
+    for i, url in todo:
+        indexes.setdefault(url, []).append(i)
+    fetches: List[Tuple[int, str]] = []
+    followers: Dict[int, List[Tuple[int, str]]] = {}
+    for group in link_resolver.group_by_product(indexes).values():
+        members = [(i, url) for url in group for i in indexes[url]]
+        fetches.append(members[0])
+        followers[members[0][0]] = members[1:]
+    deduped = len(todo) - len(fetches)
+    if deduped:
+        telemetry.count('fetches_deduped', deduped)
+        print(f"Deduplicated: {len(todo)} URLs point at {len(fetches)} products, {deduped} fetches saved")
+    print(f"Concurrency: {max(1, max_concurrency)}, "
+          f"rate per host: {f'{requests_per_second:g}/s' if requests_per_second else 'unlimited'}"
+          + (" (adaptive)" if adaptive else ""))
+    print("=" * 60)
+
+    def on_result(index: int, url: str, product_data) -> None:
+        for i, member_url in [(index, url)] + followers.get(index, []):
+            data = product_data
+            if member_url != url and isinstance(product_data, dict):
+                data = dict(product_data, url=member_url)
+            results[i - 1] = data
+            if journal and isinstance(data, dict):
+                journal.record(member_url, data)
+            if quarantine and isinstance(data, dict):
+                if data.get('blocked'):
+                    delay = quarantine.add(member_url, data['blocked'])
+                    print(f"🚫 Quarantined ({data['blocked']}), retry in {delay / 3600:.2g}h: {member_url}")
+                elif not data.get('error') and member_url in quarantine:
+                    quarantine.release(member_url)
+
+    async def gate(index: int, url: str) -> None:
+        if limiter:
+            await limiter.acquire(url)
+        print(f"\n[{index}/{total}] Processing: {url}")
+
+    async def fetch(index: int, url: str) -> None:
+        async with semaphore:
+            await gate(index, url)
+            try:
+                product_data = await asyncio.to_thread(extract_product_details, url, streaming)
+            except Exception as error:
+                product_data = error
+        on_result(index, url, product_data)
+
+    with controller.observing() if controller else nullcontext():
+        if parse_workers and not streaming:
+            await _fetch_and_parse_in_pool(fetches, semaphore, gate, on_result, parse_workers, queue_size)
+        else:
+            await asyncio.gather(*(fetch(i, url) for i, url in fetches))
+    if controller:
+        controller.log_state()
+
+    # Blocked pages keep the product's last good record
+    blocked = [url for url, data in zip(urls, results) if isinstance(data, dict) and data.get('blocked')]
+    if blocked:
+        previous = previous_product_data(set(blocked))
+        for index, (url, data) in enumerate(zip(urls, results)):
+            if isinstance(data, dict) and data.get('blocked') and url in previous:
+                results[index] = previous[url]
+        print(f"Blocked: {len(blocked)} URLs ({len([u for u in blocked if u in previous])} kept their previous record)")
+
+    if verify_images:
+        await asyncio.to_thread(reject_bad_images, results)
+
+    # Products are assembled in input order so ids and the stale data check
+    # behave exactly as in a sequential run
+    products = []
+    for i, (url, product_data) in enumerate(zip(urls, results), 1):
         try:
-            # Extract product details
-            product_data = extract_product_details(url)
-            
-            # CRITICAL FIX #1: Explicitly assign values (not relying on closure)
-            product_title = product_data.get('title')
-            product_description = product_data.get('description')
-            product_image = product_data.get('image_url')
-            
-            # Build product object for JSON export
-            product = {
-                'id': f'product-{i}',
-                'title': product_title if product_title else "Product Title Not Found",
-                'product_link': url,
-                'image_url': product_image,  # Always has a value (valid URL or placeholder)
-                'description': product_description if product_description else "",
-                'category': '',  # You can add category mapping logic here
-                'subcategory': '',  # You can add subcategory mapping logic here
-                'extracted_at': product_data.get('extracted_at')
-            }
-            
-            # Validation: Check for potential stale data
-            if i > 1:
-                prev_product = products[i - 2]
-                if (product_image == prev_product.get('image_url') and 
-                    product_title == prev_product.get('title') and
-                    not product_data.get('title')):
-                    print(f"⚠️  WARNING: Possible stale data detected for product {i}")
-                    # Force reset to placeholder
-                    product['image_url'] = PLACEHOLDER_IMAGE
-                    product['title'] = "Product Title Not Found"
-            
+            if isinstance(product_data, Exception):
+                raise product_data
+            with telemetry.span('extract'):
+                product = build_product(i, url, product_data, products)
             products.append(product)
-            
-            print(f"✅ Success: Title='{product_title[:50] if product_title else 'N/A'}...'")
-            print(f"   Image: {product_image}")
-            
-            # Add delay between requests to avoid rate limiting
-            if i < len(urls):
-                time.sleep(delay_between_requests)
-                
+            if product['image_url'] == PLACEHOLDER_IMAGE:
+                telemetry.count('placeholder_fallbacks', reason='error' if product_data.get('error') else 'no_image')
+
+            product_title = product_data.get('title')
+            print(f"✅ [{i}/{total}] Title='{product_title[:50] if product_title else 'N/A'}...'")
+            print(f"   Image: {product_data.get('image_url')}")
         except Exception as error:
-            print(f"❌ Failed: {str(error)}")
-            
-            # CRITICAL FIX #1: On error, explicitly set all fields (not previous product's data)
-            products.append({
-                'id': f'product-{i}',
-                'title': None,
-                'product_link': url,
-                'image_url': PLACEHOLDER_IMAGE,  # CRITICAL FIX #3: Always use placeholder
-                'description': None,
-                'category': '',
-                'subcategory': '',
-                'error': str(error),
-                'extracted_at': datetime.now().isoformat()
-            })
-        
-        # CRITICAL FIX #1: Explicitly clear variables at end of iteration
-        product_title = None
-        product_description = None
-        product_image = None
-    
+            print(f"❌ [{i}/{total}] Failed: {str(error)}")
+            products.append(build_failed_product(i, url, error))
+            telemetry.count('placeholder_fallbacks', reason='error')
+        if on_product:
+            on_product(products[-1])
+
     print("\n" + "=" * 60)
-    print(f"Scraping complete! Processed {len(products)} products.")
-    
+    print(f"Scraping complete! Processed {len(products)} products "
+          f"({len(fetches)} fetched, {deduped} deduplicated).")
+
+    return products
+
+
+def scrape_products(
+    urls: List[str],
+    delay_between_requests: float = 2.0,
+    max_concurrency: int = DEFAULT_CONCURRENCY,
+    streaming: bool = False,
+    parse_workers: int = 0,
+    journal_path: Optional[str] = None,
+    resume: bool = False,
+    verify_images: bool = True,
+    on_product: Optional[Callable[[Dict], None]] = None,
+    adaptive: bool = True,
+    quarantine_path: Optional[str] = QUARANTINE_PATH,
+) -> List[Dict]:
+    """
+    Process multiple product URLs and scrape their data
+
+    Thin synchronous wrapper around scrape_products_async. The delay is turned
+    into a per-host request rate: the starting pace in adaptive mode (default),
+    or a fixed one request every `delay_between_requests` seconds.
+
+    Args:
+        urls: List of Amazon product URLs
+        delay_between_requests: Minimum delay in seconds between requests to a host
+        max_concurrency: Maximum number of requests in flight
+        streaming: Stop reading each page once every field is found
+        parse_workers: Number of parser processes (0 = parse on the fetching thread)
+        journal_path: Checkpoint file; every finished product is appended to it
+        resume: Skip URLs already completed in journal_path by an earlier run
+        verify_images: Replace broken, thumbnail or undersized images with the placeholder
+        on_product: Called with each finished product as soon as it is assembled
+        adaptive: Speed up while the site responds well, slow down when it throttles
+        quarantine_path: Quarantine for robot-check, not-found and region-redirect
+            pages (None = no quarantine)
+
+    Returns:
+        List of product dictionaries ready for JSON export
+    """
+    requests_per_second = 1.0 / delay_between_requests if delay_between_requests > 0 else None
+    journal = JobJournal(journal_path, resume=resume) if journal_path else None
+    quarantine = Quarantine(quarantine_path) if quarantine_path else None
+    try:
+        products = asyncio.run(scrape_products_async(
+            urls,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            streaming=streaming,
+            parse_workers=parse_workers,
+            journal=journal,
+            verify_images=verify_images,
+            on_product=on_product,
+            adaptive=adaptive,
+            quarantine=quarantine,
+        ))
+    finally:
+        if journal:
+            journal.close()
+        if quarantine:
+            quarantine.close()
     return products
 
 
-def export_to_json(products: List[Dict], output_file: str = "products.json"):
+def catalog_path(output_file: str) -> str:
+    """
+    Path of a catalog file in src/data (absolute paths are used as given)
+    """
+    return os.path.normpath(os.path.join(DATA_DIR, output_file))
+
+
+def check_output_format(output_path: str, fmt: str) -> None:
+    """
+    Refuse to write NDJSON over the products.json the frontend imports as a JSON array
+    """
+    if fmt == 'ndjson' and output_path == catalog_path(PRODUCTS_FILE):
+        raise ValueError(f"{PRODUCTS_FILE} must stay a JSON array for the frontend; "
+                         "write NDJSON to another file (e.g. products.ndjson)")
+
+
+class CatalogExport:
+    """
+    The catalog file plus, optionally, its per-category shards and the search
+    index, all fed one product at a time in a single pass
+
+    Args:
+        output_path: Catalog file
+        fmt, minify, compress: See CatalogWriter
+        shards: Also write shards to public/data/catalog (catalog_shards.py)
+        search_index: Also write public/data/search-index.json (search_index.py)
+    """
+
+    def __init__(self, output_path: str, fmt: str = 'json', minify: bool = False, compress: Tuple[str, ...] = (),
+                 shards: bool = False, search_index: bool = False):
+        self.compress = compress
+        self.writer = CatalogWriter(output_path, fmt, minify, compress)
+        self.shard_writer = ShardWriter(SHARDS_DIR, compress=compress) if shards else None
+        self.index_builder = IndexBuilder() if search_index else None
+
+    @property
+    def count(self) -> int:
+        return self.writer.count
+
+    @property
+    def paths(self) -> List[str]:
+        paths = list(self.writer.paths)
+        if self.shard_writer:
+            paths.append(SHARDS_DIR)
+        if self.index_builder:
+            paths.append(SEARCH_INDEX_FILE)
+        return [os.path.normpath(path) for path in paths]
+
+    def write(self, product: Dict) -> None:
+        self.writer.write(product)
+        if self.shard_writer:
+            self.shard_writer.write(product)
+        if self.index_builder:
+            self.index_builder.add(product)
+
+    def commit(self) -> None:
+        with telemetry.span('write'):
+            self.writer.commit()
+            if self.shard_writer:
+                self.shard_writer.commit()
+            if self.index_builder:
+                write_index(self.index_builder.build(), SEARCH_INDEX_FILE, self.compress)
+
+    def abort(self) -> None:
+        self.writer.abort()
+        if self.shard_writer:
+            self.shard_writer.abort()
+
+
+def export_to_json(products: Iterable[Dict], output_file: str = "products.json", fmt: str = 'json',
+                   minify: bool = False, compress: Tuple[str, ...] = (), shards: bool = False,
+                   search_index: bool = False):
     """
     Export products to JSON file
     
     Args:
-        products: List of product dictionaries
-        output_file: Output file path
+        products: Product dictionaries (any iterable; written one at a time)
+        output_file: Output file, relative to src/data
+        fmt: 'json' (array) or 'ndjson' (one product per line)
+        minify: Compact output for production
+        compress: Also write pre-compressed copies ('gzip' -> .gz, 'br' -> .br)
+        shards: Also write per-category shards and their manifest to
+            public/data/catalog (see catalog_shards.py), in the same pass
+        search_index: Also build public/data/search-index.json (see search_index.py)
     """
-    output_path = f"../src/data/{output_file}"
+    output_path = catalog_path(output_file)
     
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(products, f, indent=2, ensure_ascii=False)
+        check_output_format(output_path, fmt)
+        # Streamed into a temp file + rename: a crash never leaves a half-written catalog
+        if shards or search_index:
+            export = CatalogExport(output_path, fmt, minify, compress, shards, search_index)
+            try:
+                for product in products:
+                    export.write(product)
+                export.commit()
+            except BaseException:
+                export.abort()
+                raise
+            count = export.count
+        else:
+            count = write_catalog(output_path, products, fmt, minify, compress)
         
-        print(f"\n✅ Successfully exported {len(products)} products to {output_path}")
+        print(f"\n✅ Successfully exported {count} products to {output_path}")
         return True
     except Exception as error:
         print(f"\n❌ Error exporting to JSON: {str(error)}")
@@ -370,6 +714,36 @@ def main():
     """
     Main function - Example usage
     """
+    parser = argparse.ArgumentParser(description='Scrape Amazon products into products.json')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run, skipping URLs that already finished')
+    parser.add_argument('--journal', default=default_journal_path('scrape_products'),
+                        help='Checkpoint file for --resume')
+    parser.add_argument('--output', default=None,
+                        help='Output file, relative to src/data (default: products.json, or products.ndjson '
+                             'with --format ndjson)')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='JSON array or NDJSON (one product per line)')
+    parser.add_argument('--minify', action='store_true', help='Compact JSON for production')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, default=[],
+                        help='Also write pre-compressed copies for the static host (.gz / .br)')
+    parser.add_argument('--shards', action='store_true',
+                        help='Also write per-category shards to public/data/catalog')
+    parser.add_argument('--search-index', action='store_true',
+                        help='Also build the search index (public/data/search-index.json)')
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help='One request every 2 seconds per host instead of adapting to throttling')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Requests in flight (the starting value unless --fixed-rate)')
+    telemetry.add_arguments(parser)
+    args = parser.parse_args()
+    output_path = catalog_path(args.output or f'products.{args.format}')
+    try:
+        check_output_format(output_path, args.format)
+    except ValueError as error:
+        parser.error(str(error))
+    telemetry.start_run('scrape_products', args.metrics_file, args.prometheus_file)
+    
     # Example list of Amazon URLs
     urls = [
         "https://amzn.to/3NhWXon",
@@ -378,11 +752,21 @@ def main():
         # Add more URLs here
     ]
     
-    # Scrape products
-    products = scrape_products(urls, delay_between_requests=2.0)
+    # Scrape products (each finished product is checkpointed to the journal)
+    # and stream them into the catalog file as they are assembled
+    export = CatalogExport(output_path, args.format, args.minify, args.compress, args.shards, args.search_index)
+    try:
+        products = scrape_products(urls, delay_between_requests=2.0, max_concurrency=args.concurrency,
+                                   journal_path=args.journal, resume=args.resume,
+                                   on_product=export.write, adaptive=not args.fixed_rate)
+        export.commit()
+    except BaseException:
+        export.abort()
+        raise
     
-    # Export to JSON
-    export_to_json(products, "products.json")
+    # The checkpoint is only dropped once the catalog is written
+    print(f"\n✅ Successfully exported {export.count} products to {', '.join(export.paths)}")
+    discard_journal(args.journal)
     
     # Print summary
     print("\n" + "=" * 60)
@@ -391,6 +775,7 @@ def main():
     print(f"Products with valid images: {sum(1 for p in products if p.get('image_url') != PLACEHOLDER_IMAGE)}")
     print(f"Products with placeholders: {sum(1 for p in products if p.get('image_url') == PLACEHOLDER_IMAGE)}")
     print("=" * 60)
+    telemetry.finish_run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,310 @@
+"""
+Search Index
+Prebuilt inverted index over products.json for the FindForMe page and the
+Navbar search, so the client looks up postings instead of scanning every
+product.
+
+- title, description, category and subcategory are tokenized and normalized
+  (lowercase, accents stripped, stopwords dropped, plural "s" trimmed)
+- Each term's postings hold (product, score) pairs with the BM25 weight
+  precomputed (fields weighted, BM25F-style) and stored as integers
+- Terms are sorted, so prefix matches (search-as-you-type) are a range scan
+  found by binary search; a trigram table maps each 3-gram to the terms that
+  contain it, for typo-tolerant matches
+- Written as one minified JSON file (public/data/search-index.json by
+  default, optionally with .gz / .br copies)
+
+search() below is the reference query implementation; the frontend port
+must tokenize exactly like tokenize().
+
+Artifact layout:
+    {
+      "version": 1,
+      "ids": [product ids, in index order],
+      "terms": [sorted terms],
+      "postings": [[doc, score, doc delta, score, ...] per term],
+      "trigrams": {"abc": [term index, delta, delta, ...]},
+      "scale": 100       # score = stored integer / scale
+      ...
+    }
+
+Usage:
+    python search_index.py                      # build from the catalog store
+    python search_index.py --query "noise cancelling headphones"
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from catalog_writer import COMPRESSIONS, write_json
+
+SEARCH_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'data',
+                                 'search-index.json')
+INDEX_VERSION = 1
+
+# Field weights: a title match counts three times a description match
+FIELD_WEIGHTS = {'title': 3.0, 'subcategory': 1.5, 'category': 1.0, 'description': 1.0}
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Scores are stored as integers: round(score * SCORE_SCALE)
+SCORE_SCALE = 100
+
+MIN_TOKEN_LENGTH = 2
+
+STOPWORDS = frozenset('''
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+your you our we us up out into over more most very just than then so no not can all any each
+'''.split())
+
+# Query side: how far prefix and fuzzy matches may expand, and their weight
+MAX_PREFIX_EXPANSIONS = 20
+MAX_FUZZY_EXPANSIONS = 5
+MIN_TRIGRAM_SIMILARITY = 0.4
+PREFIX_WEIGHT = 0.8
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, strip accents and spell out '&'
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.lower().replace('&', ' and ')
+
+
+def stem(token: str) -> str:
+    """
+    Minimal plural trimming: headphones -> headphone, lamps -> lamp
+    (not -ss, -us, -is: glass, status, analysis)
+    """
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')) and not token.isdigit():
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Normalized search terms of a text, in order (duplicates kept)
+    """
+    tokens = []
+    for token in _TOKEN.findall(normalize(text)):
+        if token in STOPWORDS or (len(token) < MIN_TOKEN_LENGTH and not token.isdigit()):
+            continue
+        tokens.append(stem(token))
+    return tokens
+
+
+def trigrams(term: str) -> List[str]:
+    """
+    3-grams of a term padded with spaces (' he', 'hea', ..., 'ne ')
+    """
+    padded = f' {term} '
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def _field_text(product: Dict, field: str) -> str:
+    value = product.get(field) or ''
+    # Slugs like "gaming-laptops" are searched as words
+    return value.replace('-', ' ') if field in ('category', 'subcategory') else value
+
+
+class IndexBuilder:
+    """
+    Collects term frequencies product by product; build() computes the BM25
+    weights once every document length is known
+    """
+
+    def __init__(self, field_weights: Dict[str, float] = FIELD_WEIGHTS):
+        self.field_weights = field_weights
+        self.ids: List[str] = []
+        self.lengths: List[float] = []
+        self._postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+
+    def add(self, product: Dict) -> None:
+        doc = len(self.ids)
+        self.ids.append(str(product.get('id', doc)))
+        weighted: Counter = Counter()
+        length = 0.0
+        for field, weight in self.field_weights.items():
+            tokens = tokenize(_field_text(product, field))
+            length += weight * len(tokens)
+            for token in tokens:
+                weighted[token] += weight
+        self.lengths.append(length)
+        for term, frequency in weighted.items():
+            self._postings[term].append((doc, frequency))
+
+    def add_all(self, products: Iterable[Dict]) -> int:
+        for product in products:
+            self.add(product)
+        return len(self.ids)
+
+    def build(self) -> Dict:
+        count = len(self.ids)
+        average_length = (sum(self.lengths) / count) if count else 0.0
+        terms = sorted(self._postings)
+        postings = []
+        for term in terms:
+            docs = self._postings[term]
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            encoded = []
+            previous = 0
+            for doc, frequency in docs:
+                norm = 1 - BM25_B + BM25_B * (self.lengths[doc] / average_length if average_length else 0)
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                # Docs are added in order, so deltas are always positive
+                encoded.extend((doc - previous, max(1, round(score * SCORE_SCALE))))
+                previous = doc
+            postings.append(encoded)
+
+        grams: Dict[str, List[int]] = defaultdict(list)
+        for index, term in enumerate(terms):
+            for gram in trigrams(term):
+                grams[gram].append(index)
+        trigram_table = {gram: _delta_encode(indexes) for gram, indexes in sorted(grams.items())}
+
+        return {
+            'version': INDEX_VERSION,
+            'fields': self.field_weights,
+            'bm25': {'k1': BM25_K1, 'b': BM25_B},
+            'scale': SCORE_SCALE,
+            'tokenizer': {'min_length': MIN_TOKEN_LENGTH, 'stopwords': sorted(STOPWORDS), 'plural_s': True},
+            'ids': self.ids,
+            'terms': terms,
+            'postings': postings,
+            'trigrams': trigram_table,
+        }
+
+
+def _delta_encode(values: Sequence[int]) -> List[int]:
+    return [value - (values[i - 1] if i else 0) for i, value in enumerate(values)]
+
+
+def _delta_decode(values: Sequence[int]) -> List[int]:
+    decoded, total = [], 0
+    for value in values:
+        total += value
+        decoded.append(total)
+    return decoded
+
+
+def build_index(products: Iterable[Dict]) -> Dict:
+    builder = IndexBuilder()
+    builder.add_all(products)
+    return builder.build()
+
+
+def write_index(index: Dict, path: str = SEARCH_INDEX_FILE, compress: Sequence[str] = ()) -> str:
+    """
+    Write the index as minified JSON (atomic). Returns its content hash.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    content_hash, _ = write_json(path, index, minify=True, compress=compress)
+    return content_hash
+
+
+def load_index(path: str = SEARCH_INDEX_FILE) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ============================================
+# QUERYING (reference implementation)
+# ============================================
+def _postings(index: Dict, term_index: int) -> List[Tuple[int, float]]:
+    encoded = index['postings'][term_index]
+    docs = _delta_decode(encoded[0::2])
+    return [(doc, score / index['scale']) for doc, score in zip(docs, encoded[1::2])]
+
+
+def _prefix_terms(index: Dict, prefix: str) -> List[int]:
+    terms = index['terms']
+    start = bisect.bisect_left(terms, prefix)
+    end = start
+    while end < len(terms) and terms[end].startswith(prefix) and end - start < MAX_PREFIX_EXPANSIONS:
+        end += 1
+    return list(range(start, end))
+
+
+def _fuzzy_terms(index: Dict, token: str) -> List[Tuple[int, float]]:
+    grams = trigrams(token)
+    shared: Counter = Counter()
+    for gram in grams:
+        shared.update(_delta_decode(index['trigrams'].get(gram, ())))
+    matches = []
+    for term_index, overlap in shared.items():
+        similarity = overlap / (len(grams) + len(trigrams(index['terms'][term_index])) - overlap)
+        if similarity >= MIN_TRIGRAM_SIMILARITY:
+            matches.append((term_index, similarity))
+    matches.sort(key=lambda match: -match[1])
+    return matches[:MAX_FUZZY_EXPANSIONS]
+
+
+def search(index: Dict, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+    """
+    Rank products for a query: exact term matches, prefix matches for the
+    last (still being typed) token, and trigram matches for unknown tokens
+
+    Returns:
+        [(product id, score)] best first
+    """
+    tokens = tokenize(query)
+    scores: Dict[int, float] = defaultdict(float)
+    terms = index['terms']
+    for position, token in enumerate(tokens):
+        expansions: Dict[int, float] = {}
+        exact = bisect.bisect_left(terms, token)
+        if exact < len(terms) and terms[exact] == token:
+            expansions[exact] = 1.0
+        if position == len(tokens) - 1:
+            for term_index in _prefix_terms(index, token):
+                expansions.setdefault(term_index, PREFIX_WEIGHT)
+        if not expansions and len(token) >= 3:
+            expansions.update(_fuzzy_terms(index, token))
+        # A product matching several expansions of one token counts once (its best)
+        best: Dict[int, float] = {}
+        for term_index, weight in expansions.items():
+            for doc, score in _postings(index, term_index):
+                best[doc] = max(best.get(doc, 0.0), score * weight)
+        for doc, score in best.items():
+            scores[doc] += score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [(index['ids'][doc], round(score, 3)) for doc, score in ranked]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the product search index')
+    parser.add_argument('--output', default=SEARCH_INDEX_FILE, help='Index file (default: public/data/search-index.json)')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, default=[],
+                        help='Also write pre-compressed copies (.gz / .br)')
+    parser.add_argument('--query', help='Search the existing index instead of building it')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.query:
+        index = load_index(args.output)
+        for product_id, score in search(index, args.query, args.limit):
+            print(f"{score:8.2f}  {product_id}")
+    else:
+        from catalog_store import open_catalog
+
+        store = open_catalog()
+        try:
+            index = build_index(store.iter_products())
+        finally:
+            store.close()
+        write_index(index, args.output, args.compress)
+        print(f"✅ Indexed {len(index['ids'])} products, {len(index['terms'])} terms -> {args.output} "
+              f"({os.path.getsize(args.output) / 1024:.1f} KB)")
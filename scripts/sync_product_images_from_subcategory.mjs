@@ -5,6 +5,8 @@
  * Only applies when subcategoryProducts has a non-placeholder image.
  * This ensures: no wrong/placeholder in products.json for tech products,
  * and same image as on Subcategory page (which uses subcategoryProducts).
+ *
+ * Superseded by scripts/catalog_sync.py, which also covers trendingProducts.json.
  */
 
 import fs from "fs";
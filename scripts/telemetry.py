@@ -0,0 +1,275 @@
+"""
+Run Telemetry
+Per-stage timings and counters for the scraping scripts.
+
+- span(stage) times a block of work under one of STAGES (resolve, fetch,
+  decompress, parse, extract, validate, write)
+- count(name, **labels) increments a counter, e.g. retries, cache hits,
+  placeholder fallbacks, HTTP status codes
+- gauge(name, value, **labels) records the current value of something that
+  goes up and down, e.g. the adaptive request rate
+- start_run() / finish_run() wrap a script run: events are written as JSON
+  lines to scripts/.cache/metrics/<job>-<time>.jsonl, the totals can also be
+  written in Prometheus textfile format (for node_exporter's textfile
+  collector), and a summary table is printed at the end
+
+Spans and counters are cheap and thread-safe, and are collected even when no
+run was started (nothing is written then). Work done in parser subprocesses
+is timed from the calling side.
+
+Environment variables:
+    SCRAPER_METRICS_DIR          Directory for the JSON lines files
+    SCRAPER_PROMETHEUS_TEXTFILE  Also write Prometheus metrics to this file
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+METRICS_DIR = os.environ.get('SCRAPER_METRICS_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.cache', 'metrics')
+
+STAGES = ('resolve', 'fetch', 'decompress', 'parse', 'extract', 'validate', 'write')
+
+PROMETHEUS_PREFIX = 'scraper'
+
+
+def _label_key(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Telemetry:
+    """
+    Collects spans and counters for one run
+    """
+
+    def __init__(self, job: str = 'scraper'):
+        self.job = job
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._spans: Dict[str, List[float]] = {}
+        self._counters: Counter = Counter()
+        self._gauges: Dict[Tuple, float] = {}
+        self._file = None
+        self.metrics_file: Optional[str] = None
+        self.prometheus_file: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    def _emit(self, event: Dict) -> None:
+        # Caller holds the lock
+        if self._file is not None:
+            self._file.write(json.dumps({'ts': round(time.time(), 3), 'job': self.job, **event}) + '\n')
+
+    def record_span(self, stage: str, seconds: float, **labels) -> None:
+        with self._lock:
+            self._spans.setdefault(stage, []).append(seconds)
+            self._emit({'type': 'span', 'stage': stage, 'seconds': round(seconds, 6), **labels})
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(stage, time.perf_counter() - started, **labels)
+
+    def count(self, name: str, value: int = 1, **labels) -> None:
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+            self._emit({'type': 'counter', 'name': name, 'value': value, **labels})
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+            self._emit({'type': 'gauge', 'name': name, 'value': value, **labels})
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def summary(self) -> Dict:
+        with self._lock:
+            spans = {stage: list(values) for stage, values in self._spans.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        return {
+            'duration_s': round(time.time() - self.started_at, 3),
+            'stages': {
+                stage: {
+                    'count': len(values),
+                    'total_s': round(sum(values), 3),
+                    'p50_ms': round(_percentile(values, 0.5) * 1000, 2),
+                    'p99_ms': round(_percentile(values, 0.99) * 1000, 2),
+                    'max_ms': round(max(values) * 1000, 2),
+                }
+                for stage, values in sorted(spans.items(), key=lambda item: order.get(item[0], len(order)))
+            },
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            'gauges': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(gauges.items())
+            ],
+        }
+
+    def print_summary(self, summary: Optional[Dict] = None) -> None:
+        summary = summary or self.summary()
+        print("\n" + "=" * 60)
+        print(f"TIMINGS ({self.job}, {summary['duration_s']:.1f}s total)")
+        print(f"{'stage':<12}{'count':>8}{'total s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, s in summary['stages'].items():
+            print(f"{stage:<12}{s['count']:>8}{s['total_s']:>10.2f}{s['p50_ms']:>10.1f}"
+                  f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+        if summary['counters']:
+            print("COUNTERS")
+            for counter in summary['counters']:
+                labels = ', '.join(f'{k}={v}' for k, v in counter['labels'].items())
+                print(f"  {counter['name']}{'{' + labels + '}' if labels else ''}: {counter['value']}")
+        if summary['gauges']:
+            print("GAUGES (last value)")
+            for gauge in summary['gauges']:
+                labels = ', '.join(f'{k}={v}' for k, v in gauge['labels'].items())
+                print(f"  {gauge['name']}{'{' + labels + '}' if labels else ''}: {gauge['value']}")
+        print("=" * 60)
+
+    def prometheus_text(self, summary: Optional[Dict] = None) -> str:
+        """
+        Totals in Prometheus text exposition format
+        """
+        summary = summary or self.summary()
+        job = self.job.replace('"', '')
+        lines = [
+            f'# HELP {PROMETHEUS_PREFIX}_run_duration_seconds Wall time of the last run',
+            f'# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge',
+            f'{PROMETHEUS_PREFIX}_run_duration_seconds{{job="{job}"}} {summary["duration_s"]}',
+            f'# HELP {PROMETHEUS_PREFIX}_run_timestamp_seconds When the last run finished',
+            f'# TYPE {PROMETHEUS_PREFIX}_run_timestamp_seconds gauge',
+            f'{PROMETHEUS_PREFIX}_run_timestamp_seconds{{job="{job}"}} {int(time.time())}',
+            f'# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent per stage in the last run',
+            f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary',
+        ]
+        for stage, s in summary['stages'].items():
+            labels = f'job="{job}",stage="{stage}"'
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},quantile="0.5"}} {round(s["p50_ms"] / 1000, 6)}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{{labels},quantile="0.99"}} {round(s["p99_ms"] / 1000, 6)}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_sum{{{labels}}} {s["total_s"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_count{{{labels}}} {s["count"]}')
+        names = sorted({c['name'] for c in summary['counters']})
+        for name in names:
+            metric = f'{PROMETHEUS_PREFIX}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for counter in summary['counters']:
+                if counter['name'] == name:
+                    labels = ','.join([f'job="{job}"'] + [f'{k}="{v}"' for k, v in counter['labels'].items()])
+                    lines.append(f'{metric}{{{labels}}} {counter["value"]}')
+        for name in sorted({g['name'] for g in summary['gauges']}):
+            metric = f'{PROMETHEUS_PREFIX}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            for gauge in summary['gauges']:
+                if gauge['name'] == name:
+                    labels = ','.join([f'job="{job}"'] + [f'{k}="{v}"' for k, v in gauge['labels'].items()])
+                    lines.append(f'{metric}{{{labels}}} {gauge["value"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str, summary: Optional[Dict] = None) -> None:
+        # Written to a temp file and renamed: the textfile collector must never
+        # read a half-written file
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(summary))
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # Run lifecycle
+    # ------------------------------------------------------------------
+    def open(self, metrics_file: Optional[str] = None, prometheus_file: Optional[str] = None) -> None:
+        if metrics_file is None:
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            metrics_file = os.path.join(METRICS_DIR, f'{self.job}-{stamp}.jsonl')
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file or os.environ.get('SCRAPER_PROMETHEUS_TEXTFILE') or None
+        self._file = open(metrics_file, 'a', encoding='utf-8', buffering=1)
+
+    def close(self, print_summary: bool = True) -> Dict:
+        summary = self.summary()
+        with self._lock:
+            self._emit({'type': 'summary', **summary})
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.prometheus_file:
+            self.write_prometheus(self.prometheus_file, summary)
+        if print_summary:
+            self.print_summary(summary)
+            if self.metrics_file:
+                print(f"Metrics: {self.metrics_file}")
+            if self.prometheus_file:
+                print(f"Prometheus textfile: {self.prometheus_file}")
+        return summary
+
+
+_current = Telemetry()
+
+
+def current() -> Telemetry:
+    return _current
+
+
+def span(stage: str, **labels):
+    """
+    Time a block: `with telemetry.span('fetch'): ...`
+    """
+    return _current.span(stage, **labels)
+
+
+def record_span(stage: str, seconds: float, **labels) -> None:
+    _current.record_span(stage, seconds, **labels)
+
+
+def count(name: str, value: int = 1, **labels) -> None:
+    _current.count(name, value, **labels)
+
+
+def gauge(name: str, value: float, **labels) -> None:
+    _current.gauge(name, value, **labels)
+
+
+def start_run(job: str, metrics_file: Optional[str] = None, prometheus_file: Optional[str] = None) -> Telemetry:
+    """
+    Start collecting a new run (resets spans and counters) and open its JSON lines file
+    """
+    global _current
+    _current = Telemetry(job)
+    _current.open(metrics_file, prometheus_file)
+    return _current
+
+
+def finish_run(print_summary: bool = True) -> Dict:
+    """
+    Close the run: write the summary event and Prometheus file, print the table
+    """
+    return _current.close(print_summary)
+
+
+def add_arguments(parser) -> None:
+    """
+    Add --metrics-file / --prometheus-file to a script's argument parser
+    """
+    parser.add_argument('--metrics-file', help='JSON lines metrics file (default: scripts/.cache/metrics/)')
+    parser.add_argument('--prometheus-file', help='Also write Prometheus textfile metrics here')
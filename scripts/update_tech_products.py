@@ -4,49 +4,61 @@ Extracts URLs from subcategoryProducts.json (tech category) and scrapes fresh da
 Updates products.json with the scraped data
 """
 
+import argparse
+import hashlib
 import json
 import os
 import sys
-from scrape_products import scrape_products, export_to_json
+from datetime import datetime, timedelta
+
+import link_resolver
+import telemetry
+from catalog_shards import SHARDS_DIR
+from catalog_store import open_catalog
+from search_index import SEARCH_INDEX_FILE
+from job_journal import atomic_write_json
+from quarantine import Quarantine
+from scrape_products import DEFAULT_CONCURRENCY, scrape_products, export_to_json
+
+# Per-product fingerprints and scrape times for incremental refreshes
+REFRESH_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'tech_refresh_state.json')
+
+# Incremental mode re-scrapes products last scraped longer ago than this
+DEFAULT_MAX_AGE_HOURS = 7 * 24
+
 
 def extract_tech_urls_from_subcategory():
     """
     Extract all product URLs from subcategoryProducts.json for tech category
     """
-    # Path to subcategoryProducts.json
-    subcategory_file = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'subcategoryProducts.json')
-    
     try:
-        with open(subcategory_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Indexed lookup of the tech entries (the store re-imports
+        # subcategoryProducts.json if it changed)
+        store = open_catalog()
+        entries = store.subcategory_products('tech')
+        store.close()
         
         urls = []
         product_info = {}  # Store additional info like id, category, subcategory
         
-        # Extract from tech category
-        if 'tech' in data:
-            tech_data = data['tech']
-            
-            # Iterate through all subcategories in tech
-            for subcategory_slug, price_ranges in tech_data.items():
-                # Iterate through price ranges (high-end, mid-range, etc.)
-                for price_range, products in price_ranges.items():
-                    # Iterate through products
-                    for product in products:
-                        if 'link' in product:
-                            url = product['link']
-                            urls.append(url)
-                            
-                            # Store product info for later use
-                            product_info[url] = {
-                                'id': product.get('id', ''),
-                                'category': 'tech',
-                                'subcategory': subcategory_slug,
-                                'original_title': product.get('title', ''),
-                                'original_description': product.get('description', ''),
-                                'original_image': product.get('amazonImageUrl') or product.get('image', ''),
-                                'price_range': price_range
-                            }
+        # Entries come back in file order: subcategory, then price range
+        # (high-end, mid-range, etc.), then product
+        for entry in entries:
+            product = entry['product']
+            if 'link' in product:
+                url = product['link']
+                urls.append(url)
+                
+                # Store product info for later use
+                product_info[url] = {
+                    'id': product.get('id', ''),
+                    'category': 'tech',
+                    'subcategory': entry['subcategory'],
+                    'original_title': product.get('title', ''),
+                    'original_description': product.get('description', ''),
+                    'original_image': product.get('amazonImageUrl') or product.get('image', ''),
+                    'price_range': entry['price_range']
+                }
         
         return urls, product_info
     
@@ -58,64 +70,71 @@ def extract_tech_urls_from_subcategory():
 def merge_scraped_data_with_info(scraped_products, product_info):
     """
     Merge scraped data with original product info (id, category, subcategory)
+
+    A product whose scrape failed keeps its original title, description and
+    image instead of the placeholders.
     """
     merged_products = []
     
-    for scraped in scraped_products:
-        url = scraped.get('url') or scraped.get('product_link')
-        info = product_info.get(url, {})
+    with telemetry.span('extract'):
+        for scraped in scraped_products:
+            url = scraped.get('url') or scraped.get('product_link')
+            info = product_info.get(url, {})
+            fields = {} if scraped.get('error') else scraped
         
-        # Use scraped data, but preserve original IDs and category info
-        merged_product = {
-            'id': info.get('id', scraped.get('id', '')),
-            'title': scraped.get('title') or info.get('original_title', 'Product Title Not Found'),
-            'product_link': url,
-            'image_url': scraped.get('image_url', info.get('original_image', 'default.png')),
-            'description': scraped.get('description') or info.get('original_description', ''),
-            'category': info.get('category', 'tech'),
-            'subcategory': info.get('subcategory', ''),
-            'extracted_at': scraped.get('extracted_at', '')
-        }
+            # Use scraped data, but preserve original IDs and category info
+            merged_product = {
+                'id': info.get('id', scraped.get('id', '')),
+                'title': fields.get('title') or info.get('original_title', 'Product Title Not Found'),
+                'product_link': url,
+                'image_url': fields.get('image_url', info.get('original_image', 'default.png')),
+                'description': fields.get('description') or info.get('original_description', ''),
+                'category': info.get('category', 'tech'),
+                'subcategory': info.get('subcategory', ''),
+                'extracted_at': scraped.get('extracted_at', '')
+            }
         
-        # Add price_range if available
-        if info.get('price_range'):
-            merged_product['price_range'] = info.get('price_range')
+            # Add price_range if available
+            if info.get('price_range'):
+                merged_product['price_range'] = info.get('price_range')
         
-        merged_products.append(merged_product)
+            merged_products.append(merged_product)
     
     return merged_products
 
 
-def update_products_json(new_tech_products):
+def update_products_json(new_tech_products, shards=False, search_index=False):
     """
     Update products.json by:
-    1. Reading existing products.json
-    2. Removing old tech products
-    3. Adding new scraped tech products
-    4. Keeping non-tech products intact
+    1. Removing old tech products from the catalog store
+    2. Adding new scraped tech products
+    3. Keeping non-tech products intact
+    4. Regenerating products.json from the store
+    5. Rebuilding the per-category shards in public/data/catalog if shards=True
+       and the search index in public/data/search-index.json if search_index=True
     """
-    products_file = os.path.join(os.path.dirname(__file__), '..', 'src', 'data', 'products.json')
-    
     try:
-        # Read existing products
-        with open(products_file, 'r', encoding='utf-8') as f:
-            existing_products = json.load(f)
-        
-        # Filter out old tech products
-        non_tech_products = [p for p in existing_products if p.get('category') != 'tech']
+        store = open_catalog()
+        old_tech_ids = [p['id'] for p in store.products_in('tech')]
+        kept_count = store.count_products() - len(old_tech_ids)
         
-        # Combine: non-tech products + new tech products
-        updated_products = non_tech_products + new_tech_products
+        # Remove old tech products; new ones are appended after the non-tech products
+        for product_id in old_tech_ids:
+            store.delete_product(product_id)
+        for product in new_tech_products:
+            store.upsert_product(product, merge=False)
         
-        # Write back to file
-        with open(products_file, 'w', encoding='utf-8') as f:
-            json.dump(updated_products, f, indent=2, ensure_ascii=False)
+        # Write back to file (temp file + rename)
+        store.export(products=True, subcategory_products=False, shards_dir=SHARDS_DIR if shards else None,
+                     search_index_path=SEARCH_INDEX_FILE if search_index else None)
+        total = store.count_products()
+        store.close()
         
         print(f"\n✅ Successfully updated products.json")
-        print(f"   Removed: {len(existing_products) - len(non_tech_products)} old tech products")
+        print(f"   Removed: {len(old_tech_ids)} old tech products")
         print(f"   Added: {len(new_tech_products)} new tech products")
-        print(f"   Kept: {len(non_tech_products)} non-tech products")
-        print(f"   Total: {len(updated_products)} products")
+        print(f"   Kept: {kept_count} non-tech products")
+        print(f"   Total: {total} products")
         
         return True
     
@@ -124,7 +143,218 @@ def update_products_json(new_tech_products):
         return False
 
 
+def product_fingerprint(info):
+    """
+    Fingerprint of a product's source entry in subcategoryProducts.json.
+    A product whose fingerprint changes is re-scraped in incremental mode.
+    """
+    source = {
+        'id': info.get('id', ''),
+        'link': info.get('link', ''),
+        'subcategory': info.get('subcategory', ''),
+        'price_range': info.get('price_range', ''),
+        'title': info.get('original_title', ''),
+        'description': info.get('original_description', ''),
+        'image': info.get('original_image', ''),
+    }
+    return hashlib.sha256(json.dumps(source, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def load_refresh_state():
+    """
+    Read the per-product refresh state (fingerprint + last scraped time)
+    """
+    try:
+        with open(REFRESH_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_refresh_state(state):
+    os.makedirs(os.path.dirname(REFRESH_STATE_FILE), exist_ok=True)
+    atomic_write_json(REFRESH_STATE_FILE, dict(sorted(state.items())))
+
+
+def record_scraped(state, scraped_products, product_info):
+    """
+    Mark successfully scraped products as scraped now with their current
+    source fingerprint
+
+    Failed scrapes and quarantined URLs (robot check, not found, region
+    redirect) kept their previous data, so they are not marked and stay stale
+    for the next run.
+    """
+    now = datetime.now().isoformat()
+    urls = [p['product_link'] for p in scraped_products if not p.get('error')]
+    quarantine = Quarantine()
+    try:
+        urls = [url for url in urls if url not in quarantine]
+    finally:
+        quarantine.close()
+    for url in urls:
+        info = product_info[url]
+        state[info['id']] = {'fingerprint': product_fingerprint({**info, 'link': url}), 'last_scraped': now}
+
+
+def plan_incremental_refresh(urls, product_info, existing_ids, state, max_age_hours):
+    """
+    Decide which tech products need scraping
+
+    A product is stale when it is new, its source entry changed, it has never
+    been scraped, or it was last scraped more than max_age_hours ago.
+    
+    Args:
+        existing_ids: Ids of the tech products currently in products.json
+
+    Returns:
+        List of URLs to scrape, in source order
+    """
+    cutoff = datetime.now() - timedelta(hours=max_age_hours)
+    stale = []
+    
+    for url in urls:
+        info = product_info[url]
+        entry = state.get(info['id'])
+        if info['id'] not in existing_ids or not entry:
+            stale.append(url)
+        elif entry.get('fingerprint') != product_fingerprint({**info, 'link': url}):
+            stale.append(url)
+        else:
+            try:
+                last_scraped = datetime.fromisoformat(entry.get('last_scraped', ''))
+            except ValueError:
+                last_scraped = None
+            if last_scraped is None or last_scraped < cutoff:
+                stale.append(url)
+    
+    return stale
+
+
+def merge_products_in_place(store, merged_products, source_ids):
+    """
+    Merge freshly scraped tech products into the catalog store by id
+
+    - Scraped products replace the fields of the existing entry with the same
+      id, keeping its position and any extra fields (e.g. lovedBy)
+    - Scraped products with a new id are appended
+    - Tech products whose id is no longer in the source are removed
+
+    Returns:
+        Report dict with added/updated/removed/unchanged ids
+    """
+    report = {'added': [], 'updated': [], 'removed': [], 'unchanged': []}
+    scraped_ids = set()
+    
+    for product in store.products_in('tech'):
+        if product['id'] not in source_ids:
+            store.delete_product(product['id'])
+            report['removed'].append(product['id'])
+    
+    for fresh in merged_products:
+        scraped_ids.add(fresh['id'])
+        existing = store.get_product(fresh['id'])
+        store.upsert_product(fresh)
+        if existing is None:
+            report['added'].append(fresh['id'])
+        elif any(existing.get(k) != v for k, v in fresh.items() if k != 'extracted_at'):
+            report['updated'].append(fresh['id'])
+        else:
+            report['unchanged'].append(fresh['id'])
+    
+    report['unchanged'].extend(p['id'] for p in store.products_in('tech') if p['id'] not in scraped_ids)
+    return report
+
+
+def update_products_json_incremental(urls, product_info, max_age_hours=DEFAULT_MAX_AGE_HOURS, shards=False,
+                                     search_index=False, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Incremental refresh: re-scrape only stale or changed tech products and
+    merge them into products.json in place by id
+
+    Args:
+        urls: Tech product URLs from subcategoryProducts.json
+        product_info: Source info per URL (from extract_tech_urls_from_subcategory)
+        max_age_hours: Products scraped longer ago than this are refreshed
+        shards: Also rebuild the per-category shards in public/data/catalog
+        search_index: Also rebuild public/data/search-index.json
+        concurrency: Requests in flight while scraping
+
+    Returns:
+        Report dict with added/updated/removed/unchanged ids, or None on error
+    """
+    try:
+        store = open_catalog()
+        existing_ids = {p['id'] for p in store.products_in('tech')}
+        
+        state = load_refresh_state()
+        stale_urls = plan_incremental_refresh(urls, product_info, existing_ids, state, max_age_hours)
+        print(f"   {len(stale_urls)} of {len(urls)} tech products are stale or changed")
+        
+        scraped_products, merged_products = [], []
+        if stale_urls:
+            print("\nResolving amzn.to short links...")
+            link_resolver.resolve_links(stale_urls)
+            
+            print(f"\nScraping {len(stale_urls)} products...")
+            scraped_products = scrape_products(stale_urls, delay_between_requests=2.0, max_concurrency=concurrency)
+            merged_products = merge_scraped_data_with_info(scraped_products, product_info)
+        
+        source_ids = {product_info[url]['id'] for url in urls}
+        report = merge_products_in_place(store, merged_products, source_ids)
+        
+        # Regenerate products.json once from the store (temp file + rename)
+        store.export(products=True, subcategory_products=False, shards_dir=SHARDS_DIR if shards else None,
+                     search_index_path=SEARCH_INDEX_FILE if search_index else None)
+        total = store.count_products()
+        store.close()
+        
+        # Record fingerprints only for products that were actually scraped
+        record_scraped(state, scraped_products, product_info)
+        for product_id in report['removed']:
+            state.pop(product_id, None)
+        save_refresh_state(state)
+        
+        print("\n✅ Successfully updated products.json (incremental)")
+        print(f"   Added: {len(report['added'])}")
+        print(f"   Updated: {len(report['updated'])}")
+        print(f"   Removed: {len(report['removed'])}")
+        print(f"   Unchanged: {len(report['unchanged'])}")
+        print(f"   Total: {total} products")
+        
+        return report
+    
+    except Exception as e:
+        print(f"\n❌ Error updating products.json: {str(e)}")
+        return None
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Refresh tech products in products.json')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only scrape new, changed or stale tech products and merge them by id')
+    parser.add_argument('--max-age-hours', type=float, default=DEFAULT_MAX_AGE_HOURS,
+                        help='With --incremental: re-scrape products older than this')
+    parser.add_argument('--shards', action='store_true',
+                        help='Also write per-category shards to public/data/catalog')
+    parser.add_argument('--search-index', action='store_true',
+                        help='Also rebuild the search index (public/data/search-index.json)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Requests in flight while scraping')
+    telemetry.add_arguments(parser)
+    args = parser.parse_args()
+    
+    telemetry.start_run('update_tech_products', args.metrics_file, args.prometheus_file)
+    try:
+        update_tech_products(args)
+    finally:
+        telemetry.finish_run()
+
+
+def update_tech_products(args):
+    """
+    Run the update steps for the parsed command line arguments
+    """
     print("=" * 60)
     print("TECH PRODUCTS UPDATE SCRIPT")
     print("=" * 60)
@@ -139,11 +369,26 @@ def main():
     
     print(f"✅ Found {len(urls)} tech product URLs")
     
+    if args.incremental:
+        print(f"\n[Step 2] Incremental refresh (max age {args.max_age_hours:g}h)...")
+        update_products_json_incremental(urls, product_info, args.max_age_hours, shards=args.shards,
+                                         search_index=args.search_index, concurrency=args.concurrency)
+        
+        print("\n" + "=" * 60)
+        print("UPDATE COMPLETE!")
+        print("=" * 60)
+        return
+    
+    # Resolve short links up front (cached on disk) so scraping goes straight
+    # to each canonical product page
+    print("\n[Step 1b] Resolving amzn.to short links...")
+    link_resolver.resolve_links(urls)
+    
     # Step 2: Scrape products
     print(f"\n[Step 2] Scraping {len(urls)} products...")
     print("This may take a while. Please wait...\n")
     
-    scraped_products = scrape_products(urls, delay_between_requests=2.0)
+    scraped_products = scrape_products(urls, delay_between_requests=2.0, max_concurrency=args.concurrency)
     
     # Step 3: Merge scraped data with original product info
     print(f"\n[Step 3] Merging scraped data with product info...")
@@ -151,7 +396,11 @@ def main():
     
     # Step 4: Update products.json
     print(f"\n[Step 4] Updating products.json...")
-    update_products_json(merged_products)
+    if update_products_json(merged_products, shards=args.shards, search_index=args.search_index):
+        # A full refresh counts as a fresh scrape for the next incremental run
+        state = {}
+        record_scraped(state, scraped_products, product_info)
+        save_refresh_state(state)
     
     print("\n" + "=" * 60)
     print("UPDATE COMPLETE!")
@@ -0,0 +1,594 @@
+"""
+Distributed Scrape Queue
+Work-queue mode for scrape_products: a coordinator enqueues product URLs into
+a durable broker and any number of worker processes (or hosts) scrape them.
+
+- Workers claim leased batches (claim), extend the lease while they work
+  (heartbeat) and write each product back (complete / fail)
+- A lease that is not extended for `lease_seconds` expires (crashed or
+  stalled worker) and its URLs go back to pending for the next claim
+- Products that come back with an error are retried up to MAX_ATTEMPTS times
+- URLs held in the quarantine (robot check, not found, region redirect, see
+  quarantine.py) are deferred until their retry time, without using up an
+  attempt
+- The coordinator exports the results in enqueue order with the same ids as a
+  single-process run
+
+The broker is a SQLite file (WAL mode) by default, which any process on the
+machine can share. Broker is the interface a Redis-backed broker would
+implement to spread workers across hosts.
+
+Each worker paces its own requests (adaptive rate, see rate_limit.py), so
+the total request rate grows with the number of workers.
+
+Usage:
+    python work_queue.py run --workers 4 --urls-file urls.txt      # enqueue, run local workers, export
+    python work_queue.py enqueue --urls-file urls.txt
+    python work_queue.py worker                                    # on each machine / terminal
+    python work_queue.py status
+    python work_queue.py export --output products.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import telemetry
+
+BROKER_PATH = os.environ.get('SCRAPER_BROKER') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '.cache', 'work_queue.sqlite')
+
+DEFAULT_QUEUE = 'products'
+
+# URLs handed to a worker per claim
+DEFAULT_BATCH_SIZE = 10
+
+# A lease not extended for this long expires and its URLs are claimed again
+DEFAULT_LEASE_SECONDS = 120.0
+
+# Products that keep coming back with an error are stored as failed after this many tries
+MAX_ATTEMPTS = 3
+
+# Idle workers poll this often while other workers still hold leases
+POLL_SECONDS = 2.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    queue TEXT NOT NULL,
+    url TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (queue, url)
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (queue, state, position);
+CREATE INDEX IF NOT EXISTS tasks_lease ON tasks (state, lease_expires_at);
+'''
+
+
+@dataclass
+class Task:
+    """
+    A claimed URL
+
+    Attributes:
+        id: Task id within the broker
+        url: Product URL
+        position: 1-based position in enqueue order (the product id number)
+        attempts: Claims so far, including this one
+    """
+    id: int
+    url: str
+    position: int
+    attempts: int
+
+
+class Broker(ABC):
+    """
+    Durable work queue interface shared by the coordinator and the workers
+
+    Every method is safe to call from several processes at once. Methods
+    taking `worker` only act on tasks whose lease that worker still holds.
+    A subclass missing any of them cannot be instantiated.
+    """
+
+    @abstractmethod
+    def enqueue(self, queue: str, urls: Iterable[str]) -> int:
+        """
+        Add URLs to a queue after the ones already in it (duplicates are
+        ignored). Returns the number added.
+        """
+
+    @abstractmethod
+    def claim(self, queue: str, worker: str, batch_size: int, lease_seconds: float) -> List[Task]:
+        """
+        Lease up to batch_size pending URLs, oldest first, re-queueing expired leases first
+        """
+
+    @abstractmethod
+    def heartbeat(self, worker: str, task_ids: Iterable[int], lease_seconds: float) -> int:
+        """
+        Extend the worker's leases. Returns how many it still holds.
+        """
+
+    @abstractmethod
+    def complete(self, worker: str, task_id: int, result: Dict) -> bool:
+        """
+        Store a task's result. False if the worker lost the lease.
+        """
+
+    @abstractmethod
+    def fail(self, worker: str, task_id: int, error: str, result: Optional[Dict] = None) -> bool:
+        """
+        Put a task back to pending, or store it as failed (with `result`)
+        after MAX_ATTEMPTS. False if the worker lost the lease.
+        """
+
+    @abstractmethod
+    def defer(self, worker: str, task_id: int, not_before: float, reason: str) -> bool:
+        """
+        Put a task back to pending, not to be claimed before `not_before`.
+        The claim does not count as an attempt. False if the worker lost the lease.
+        """
+
+    @abstractmethod
+    def requeue_expired(self, queue: Optional[str] = None) -> int:
+        """
+        Return expired leases to pending. Returns the number re-queued.
+        """
+
+    @abstractmethod
+    def counts(self, queue: str) -> Dict[str, int]:
+        """
+        Number of tasks per state ('pending', 'leased', 'done', 'failed'),
+        plus 'deferred': pending tasks waiting for their not_before time
+        """
+
+    @abstractmethod
+    def results(self, queue: str) -> List[Tuple[int, str, Optional[Dict]]]:
+        """
+        (position, url, result) of finished tasks in enqueue order
+        """
+
+    @abstractmethod
+    def purge(self, queue: str) -> int:
+        """
+        Delete every task of a queue. Returns the number deleted.
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBroker(Broker):
+    """
+    Broker backed by one SQLite file (WAL mode, one write transaction per call)
+
+    Args:
+        path: SQLite file shared by every process
+    """
+
+    def __init__(self, path: str = BROKER_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode: every write runs in an explicit BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        # Brokers created before tasks could be deferred
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(tasks)')}
+        if 'not_before' not in columns:
+            self.conn.execute('ALTER TABLE tasks ADD COLUMN not_before REAL NOT NULL DEFAULT 0')
+
+    def _write(self, statements):
+        """
+        Run statements(conn) in one write transaction and return its result
+        """
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self.conn)
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    def enqueue(self, queue: str, urls: Iterable[str]) -> int:
+        urls = list(urls)
+
+        def statements(conn):
+            start = conn.execute('SELECT COALESCE(MAX(position), 0) FROM tasks WHERE queue = ?', (queue,)).fetchone()[0]
+            added = 0
+            now = time.time()
+            for url in urls:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO tasks (queue, url, position, updated_at) VALUES (?, ?, ?, ?)',
+                    (queue, url, start + added + 1, now)
+                )
+                added += cursor.rowcount
+            return added
+
+        return self._write(statements)
+
+    def _requeue_expired(self, conn, queue: Optional[str], now: float) -> int:
+        where = 'state = ? AND lease_expires_at <= ?' + (' AND queue = ?' if queue else '')
+        params = ('leased', now) + ((queue,) if queue else ())
+        count = conn.execute(
+            f"UPDATE tasks SET state = 'pending', worker = NULL, lease_expires_at = NULL, updated_at = ?"
+            f" WHERE {where}", (now,) + params
+        ).rowcount
+        if count:
+            telemetry.count('leases_expired', count)
+        return count
+
+    def claim(self, queue: str, worker: str, batch_size: int, lease_seconds: float) -> List[Task]:
+        def statements(conn):
+            now = time.time()
+            self._requeue_expired(conn, queue, now)
+            rows = conn.execute(
+                "SELECT id, url, position, attempts FROM tasks WHERE queue = ? AND state = 'pending'"
+                ' AND not_before <= ? ORDER BY position LIMIT ?', (queue, now, max(1, batch_size))
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_expires_at = ?, attempts = attempts + 1,"
+                ' updated_at = ? WHERE id = ?',
+                [(worker, now + lease_seconds, now, row[0]) for row in rows]
+            )
+            return [Task(row[0], row[1], row[2], row[3] + 1) for row in rows]
+
+        return self._write(statements)
+
+    def heartbeat(self, worker: str, task_ids: Iterable[int], lease_seconds: float) -> int:
+        task_ids = list(task_ids)
+
+        def statements(conn):
+            now = time.time()
+            return sum(conn.execute(
+                "UPDATE tasks SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (now + lease_seconds, now, task_id, worker)
+            ).rowcount for task_id in task_ids)
+
+        return self._write(statements)
+
+    def _finish(self, worker: str, task_id: int, state: str, result: Optional[Dict], error: Optional[str]) -> bool:
+        data = json.dumps(result, ensure_ascii=False) if result is not None else None
+        return self._write(lambda conn: conn.execute(
+            'UPDATE tasks SET state = ?, worker = NULL, lease_expires_at = NULL, result = ?, error = ?, updated_at = ?'
+            " WHERE id = ? AND state = 'leased' AND worker = ?",
+            (state, data, error, time.time(), task_id, worker)
+        ).rowcount == 1)
+
+    def complete(self, worker: str, task_id: int, result: Dict) -> bool:
+        return self._finish(worker, task_id, 'done', result, None)
+
+    def fail(self, worker: str, task_id: int, error: str, result: Optional[Dict] = None) -> bool:
+        with self._lock:
+            row = self.conn.execute('SELECT attempts FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if row and row[0] >= MAX_ATTEMPTS:
+            return self._finish(worker, task_id, 'failed', result, error)
+        return self._finish(worker, task_id, 'pending', None, error)
+
+    def defer(self, worker: str, task_id: int, not_before: float, reason: str) -> bool:
+        return self._write(lambda conn: conn.execute(
+            "UPDATE tasks SET state = 'pending', worker = NULL, lease_expires_at = NULL, not_before = ?,"
+            ' attempts = MAX(attempts - 1, 0), error = ?, updated_at = ?'
+            " WHERE id = ? AND state = 'leased' AND worker = ?",
+            (not_before, reason, time.time(), task_id, worker)
+        ).rowcount == 1)
+
+    def requeue_expired(self, queue: Optional[str] = None) -> int:
+        return self._write(lambda conn: self._requeue_expired(conn, queue, time.time()))
+
+    def counts(self, queue: str) -> Dict[str, int]:
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        with self._lock:
+            rows = self.conn.execute('SELECT state, COUNT(*) FROM tasks WHERE queue = ? GROUP BY state',
+                                     (queue,)).fetchall()
+            deferred = self.conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE queue = ? AND state = 'pending' AND not_before > ?",
+                (queue, time.time())
+            ).fetchone()[0]
+        counts.update(rows)
+        counts['deferred'] = deferred
+        return counts
+
+    def results(self, queue: str) -> List[Tuple[int, str, Optional[Dict]]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT position, url, result FROM tasks WHERE queue = ? AND state IN ('done', 'failed')"
+                ' ORDER BY position', (queue,)
+            ).fetchall()
+        return [(position, url, json.loads(result) if result else None) for position, url, result in rows]
+
+    def purge(self, queue: str) -> int:
+        return self._write(lambda conn: conn.execute('DELETE FROM tasks WHERE queue = ?', (queue,)).rowcount)
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+def open_broker(location: str = BROKER_PATH) -> Broker:
+    """
+    Open the broker at `location`: a SQLite file path or sqlite:///path
+
+    Raises:
+        ValueError for broker URLs without an implementation (e.g. redis://)
+    """
+    if location.startswith('sqlite:///'):
+        return SQLiteBroker(location[len('sqlite:///'):])
+    if '://' in location:
+        raise ValueError(f"Unsupported broker: {location} (only SQLite is implemented)")
+    return SQLiteBroker(location)
+
+
+def default_worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+
+# ============================================
+# WORKER
+# ============================================
+class _Heartbeat:
+    """
+    Background thread that extends a batch's leases every lease_seconds / 3
+    """
+
+    def __init__(self, broker: Broker, worker: str, tasks: List[Task], lease_seconds: float):
+        self.broker = broker
+        self.worker = worker
+        self.task_ids = [task.id for task in tasks]
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            held = self.broker.heartbeat(self.worker, self.task_ids, self.lease_seconds)
+            if held < len(self.task_ids):
+                print(f"⚠️  Worker {self.worker} lost {len(self.task_ids) - held} leases (expired)")
+
+    def __enter__(self) -> '_Heartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def process_batch(broker: Broker, worker: str, tasks: List[Task], **scrape_options) -> Dict[str, int]:
+    """
+    Scrape one claimed batch with scrape_products and write each product back
+
+    Products with an error go back to the queue (see Broker.fail). URLs the
+    scraper quarantined are deferred until the quarantine's retry time (see
+    Broker.defer), so the backoff is kept across claims.
+
+    Returns:
+        {'completed': n, 'failed': n, 'deferred': n, 'lost': n}
+    """
+    from quarantine import QUARANTINE_PATH, Quarantine
+    from scrape_products import scrape_products
+
+    summary = {'completed': 0, 'failed': 0, 'deferred': 0, 'lost': 0}
+    lease_seconds = scrape_options.pop('lease_seconds', DEFAULT_LEASE_SECONDS)
+    with _Heartbeat(broker, worker, tasks, lease_seconds):
+        products = scrape_products([task.url for task in tasks], **scrape_options)
+    quarantine_path = scrape_options.get('quarantine_path', QUARANTINE_PATH)
+    quarantine = Quarantine(quarantine_path) if quarantine_path else None
+    try:
+        retry_at = {task.url: quarantine.retry_at(task.url) for task in tasks} if quarantine else {}
+        # A stale entry whose retry time has passed must not defer the task again
+        now = time.time()
+        retry_at = {url: at for url, at in retry_at.items() if at and at > now}
+    finally:
+        if quarantine:
+            quarantine.close()
+    for task, product in zip(tasks, products):
+        if product.get('error') and retry_at.get(task.url):
+            held = broker.defer(worker, task.id, retry_at[task.url], product['error'])
+            summary['deferred' if held else 'lost'] += 1
+        elif product.get('error'):
+            held = broker.fail(worker, task.id, product['error'], product)
+            summary['failed' if held else 'lost'] += 1
+        else:
+            held = broker.complete(worker, task.id, product)
+            summary['completed' if held else 'lost'] += 1
+    for key, value in summary.items():
+        if value:
+            telemetry.count(f'tasks_{key}', value)
+    return summary
+
+
+def run_worker(
+    broker: Broker,
+    queue: str = DEFAULT_QUEUE,
+    worker: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    wait: bool = True,
+    **scrape_options,
+) -> Dict[str, int]:
+    """
+    Claim and scrape batches until the queue is drained
+
+    Args:
+        broker: Broker shared with the coordinator and the other workers
+        queue: Queue name
+        worker: Worker id (default: host-pid-random)
+        batch_size: URLs claimed at a time
+        lease_seconds: Lease length; extended every lease_seconds / 3 while working
+        wait: Keep polling while other workers hold leases (their URLs come
+            back if a lease expires); otherwise stop when nothing is claimable.
+            Deferred URLs are left for a later worker run.
+        **scrape_options: Passed to scrape_products (e.g. delay_between_requests)
+
+    Returns:
+        Totals: {'batches', 'completed', 'failed', 'deferred', 'lost'}
+    """
+    worker = worker or default_worker_id()
+    totals = {'batches': 0, 'completed': 0, 'failed': 0, 'deferred': 0, 'lost': 0}
+    print(f"Worker {worker} on queue '{queue}'")
+    while True:
+        tasks = broker.claim(queue, worker, batch_size, lease_seconds)
+        if not tasks:
+            if wait and broker.counts(queue)['leased']:
+                time.sleep(POLL_SECONDS)
+                continue
+            break
+        print(f"\nWorker {worker}: claimed {len(tasks)} URLs (positions {tasks[0].position}-{tasks[-1].position})")
+        summary = process_batch(broker, worker, tasks, lease_seconds=lease_seconds, **scrape_options)
+        totals['batches'] += 1
+        for key, value in summary.items():
+            totals[key] += value
+    print(f"\nWorker {worker} done: {totals['completed']} completed, {totals['failed']} failed, "
+          f"{totals['deferred']} deferred, {totals['lost']} lost leases in {totals['batches']} batches")
+    return totals
+
+
+# ============================================
+# COORDINATOR
+# ============================================
+def collect_products(broker: Broker, queue: str = DEFAULT_QUEUE) -> List[Dict]:
+    """
+    Finished products in enqueue order, numbered like a single-process run
+    (product-1, product-2, ...)
+    """
+    from scrape_products import build_failed_product
+
+    products = []
+    for position, url, result in broker.results(queue):
+        product = result or build_failed_product(position, url, RuntimeError('no result'))
+        products.append(dict(product, id=f'product-{position}'))
+    return products
+
+
+def spawn_workers(count: int, queue: str, broker_location: str, worker_args: List[str] = ()) -> List[subprocess.Popen]:
+    """
+    Start `count` local worker processes (python work_queue.py worker ...)
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--broker', broker_location, '--queue', queue, 'worker']
+    return [subprocess.Popen(command + list(worker_args)) for _ in range(count)]
+
+
+def read_urls(path: Optional[str], urls: List[str]) -> List[str]:
+    """
+    URLs from the command line plus one per line of `path` (# comments skipped)
+    """
+    urls = list(urls)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed scrape queue (coordinator and workers)')
+    parser.add_argument('--broker', default=BROKER_PATH, help='SQLite broker file (or SCRAPER_BROKER)')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE, help='Queue name')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_url_arguments(command):
+        command.add_argument('urls', nargs='*', help='Product URLs')
+        command.add_argument('--urls-file', help='File with one URL per line')
+
+    def add_worker_arguments(command):
+        command.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='URLs claimed at a time')
+        command.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS, help='Lease length')
+        command.add_argument('--delay', type=float, default=2.0,
+                             help='Seconds between requests to a host, per worker')
+        command.add_argument('--concurrency', type=int, default=1, help='Requests in flight, per worker')
+        command.add_argument('--fixed-rate', action='store_true', help='No adaptive pacing')
+
+    add_url_arguments(commands.add_parser('enqueue', help='Add URLs to the queue'))
+    worker_parser = commands.add_parser('worker', help='Scrape batches until the queue is drained')
+    worker_parser.add_argument('--worker-id', help='Worker id (default: host-pid-random)')
+    add_worker_arguments(worker_parser)
+    telemetry.add_arguments(worker_parser)
+    commands.add_parser('status', help='Show task counts')
+    export_parser = commands.add_parser('export', help='Write finished products to a catalog file')
+    export_parser.add_argument('--output', default='products.json', help='Output file, relative to src/data')
+    commands.add_parser('purge', help='Delete every task of the queue')
+    run_parser = commands.add_parser('run', help='Enqueue, run local workers, export')
+    add_url_arguments(run_parser)
+    run_parser.add_argument('--workers', type=int, default=2, help='Local worker processes')
+    run_parser.add_argument('--output', default='products.json', help='Output file, relative to src/data')
+    add_worker_arguments(run_parser)
+    args = parser.parse_args()
+
+    broker = open_broker(args.broker)
+    try:
+        if args.command in ('enqueue', 'run'):
+            urls = read_urls(args.urls_file, args.urls)
+            print(f"Enqueued {broker.enqueue(args.queue, urls)} of {len(urls)} URLs on '{args.queue}'")
+
+        if args.command == 'worker':
+            worker = args.worker_id or default_worker_id()
+            # One metrics file per worker, even when several start in the same second
+            metrics_file = args.metrics_file or os.path.join(
+                telemetry.METRICS_DIR, f"work_queue_worker-{worker}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl")
+            telemetry.start_run('work_queue_worker', metrics_file, args.prometheus_file)
+            try:
+                run_worker(broker, args.queue, worker, args.batch_size, args.lease_seconds,
+                           delay_between_requests=args.delay, max_concurrency=args.concurrency,
+                           adaptive=not args.fixed_rate)
+            finally:
+                telemetry.finish_run()
+
+        if args.command == 'run':
+            worker_args = ['--batch-size', str(args.batch_size), '--lease-seconds', str(args.lease_seconds),
+                           '--delay', str(args.delay), '--concurrency', str(args.concurrency)]
+            if args.fixed_rate:
+                worker_args.append('--fixed-rate')
+            processes = spawn_workers(args.workers, args.queue, args.broker, worker_args)
+            failed = [process for process in processes if process.wait() != 0]
+            if failed:
+                print(f"⚠️  {len(failed)} workers exited with an error; their leases expire and "
+                      f"'python work_queue.py worker' picks them up")
+
+        if args.command in ('status', 'run'):
+            counts = broker.counts(args.queue)
+            print(f"Queue '{args.queue}': " + ', '.join(f"{state} {count}" for state, count in counts.items()))
+
+        if args.command in ('export', 'run'):
+            from scrape_products import export_to_json
+
+            counts = broker.counts(args.queue)
+            if counts['pending'] or counts['leased']:
+                print(f"⚠️  {counts['pending'] + counts['leased']} URLs are not finished yet "
+                      f"({counts['deferred']} deferred by the quarantine); exporting the rest")
+            export_to_json(collect_products(broker, args.queue), args.output)
+
+        if args.command == 'purge':
+            print(f"Deleted {broker.purge(args.queue)} tasks from '{args.queue}'")
+    finally:
+        broker.close()
+
+
+if __name__ == '__main__':
+    main()